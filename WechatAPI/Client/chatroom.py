@@ -99,7 +99,9 @@ class ChatroomMixin(WechatAPIClientBase):
             json_resp = await response.json()
 
             if json_resp.get("Success"):
-                return json_resp.get("Data").get("NewChatroomData").get("ChatRoomMember")
+                members = json_resp.get("Data").get("NewChatroomData").get("ChatRoomMember")
+                self.contact_cache.put_members(members)
+                return members
             else:
                 self.error_handler(json_resp)
 
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.metrics import metrics
+
+contact_lookups = metrics.counter("xybot_contact_cache_lookups_total", "联系人缓存查询次数", ("result",))
+contact_batches = metrics.histogram("xybot_contact_batch_size", "批量查询联系人时每次请求的wxid数量",
+                                    buckets=(1, 2, 5, 10, 15, 20))
+
+# 一次 GetContractDetail 最多查询的联系人数量
+BATCH_SIZE = 20
+
+
+def _string(value) -> str:
+    """联系人字段可能是字符串，也可能是 {"string": ...}"""
+    if isinstance(value, dict):
+        return value.get("string") or ""
+    return value or ""
+
+
+class _Entry:
+    __slots__ = ("expires", "nickname", "detail", "contact")
+
+    def __init__(self, expires: float):
+        self.expires = expires
+        self.nickname: Optional[str] = None
+        self.detail: Optional[dict] = None
+        self.contact: Optional[dict] = None
+
+
+class ContactCache:
+    """
+    联系人缓存，按wxid保存昵称和联系人详情
+
+    数据来自联系人详情查询和群成员列表，超过ttl秒的数据会被重新查询，查询不到的联系人只缓存negative_ttl秒，
+    超过max_entries时淘汰最久未使用的联系人。
+    消息中PushContent里的名字是群昵称或备注而不是微信昵称，不会写入缓存
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 20000, negative_ttl: float = 60):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, wxid: str) -> bool:
+        return self._get(wxid) is not None
+
+    def _get(self, wxid: str) -> Optional[_Entry]:
+        entry = self._entries.get(wxid)
+        if entry is None:
+            return None
+        if entry.expires < time.monotonic():
+            del self._entries[wxid]
+            return None
+        self._entries.move_to_end(wxid)
+        return entry
+
+    def _entry(self, wxid: str) -> _Entry:
+        entry = self._get(wxid)
+        if entry is None:
+            entry = _Entry(time.monotonic() + self.ttl)
+            self._entries[wxid] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def nickname(self, wxid: str) -> Optional[str]:
+        """缓存的昵称，未缓存时返回None"""
+        result = self.peek_nickname(wxid)
+        contact_lookups.labels("miss" if result is None else "hit").inc()
+        return result
+
+    def peek_nickname(self, wxid: str) -> Optional[str]:
+        """与nickname相同，但不计入缓存命中率"""
+        entry = self._get(wxid)
+        return entry.nickname if entry is not None else None
+
+    def detail(self, wxid: str) -> Optional[dict]:
+        """缓存的联系人详情(GetContractDetail)"""
+        entry = self._get(wxid)
+        return entry.detail if entry is not None else None
+
+    def contact(self, wxid: str) -> Optional[dict]:
+        """缓存的联系人信息(GetContact)"""
+        entry = self._get(wxid)
+        return entry.contact if entry is not None else None
+
+    def put_nickname(self, wxid: str, nickname: str):
+        if wxid:
+            self._entry(wxid).nickname = nickname
+
+    def put_detail(self, detail: dict):
+        wxid = _string(detail.get("UserName"))
+        if wxid:
+            entry = self._entry(wxid)
+            entry.detail = detail
+            entry.nickname = _string(detail.get("NickName"))
+
+    def put_contact(self, contact: dict):
+        wxid = _string(contact.get("UserName"))
+        if wxid:
+            entry = self._entry(wxid)
+            entry.contact = contact
+            entry.nickname = _string(contact.get("NickName"))
+
+    def put_members(self, members: List[dict]):
+        """记录群成员列表中的昵称"""
+        for member in members or []:
+            wxid = _string(member.get("UserName"))
+            nickname = _string(member.get("NickName"))
+            if wxid and nickname:
+                self.put_nickname(wxid, nickname)
+
+    def put_missing(self, wxid: str):
+        """记录查询不到的联系人（昵称为空），只缓存negative_ttl秒，之后会重新查询"""
+        if wxid:
+            entry = self._entry(wxid)
+            entry.nickname = ""
+            entry.expires = min(entry.expires, time.monotonic() + self.negative_ttl)
+
+    def invalidate(self, wxid: str):
+        self._entries.pop(wxid, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class NicknameBatcher:
+    """把同一轮事件循环中的单个wxid查询合并成每次最多20个wxid的请求"""
+
+    def __init__(self, fetch: Callable[[List[str]], Awaitable[List[dict]]], cache: ContactCache):
+        """
+        Args:
+            fetch: 查询联系人详情的函数，例如 get_contract_detail
+            cache: 查询结果写入的缓存
+        """
+        self.fetch = fetch
+        self.cache = cache
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._queued: List[str] = []
+        self._scheduled = False
+
+    def resolve(self, wxid: str) -> asyncio.Future:
+        """查询昵称，同一个wxid正在查询时共用同一个结果"""
+        future = self._pending.get(wxid)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[wxid] = future
+        self._queued.append(wxid)
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        self._scheduled = False
+        queued, self._queued = self._queued, []
+        for i in range(0, len(queued), BATCH_SIZE):
+            asyncio.ensure_future(self._run(queued[i:i + BATCH_SIZE]))
+
+    async def _run(self, wxids: List[str]):
+        contact_batches.observe(len(wxids))
+        try:
+            details = await self.fetch(wxids)
+        except Exception as e:
+            for wxid in wxids:
+                future = self._pending.pop(wxid)
+                if not future.done():
+                    future.set_exception(e)
+                    # 等待者可能已经被取消，避免出现未读取异常的警告
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            return
+
+        for detail in details or []:
+            self.cache.put_detail(detail)
+        for wxid in wxids:
+            future = self._pending.pop(wxid)
+            nickname = self.cache.peek_nickname(wxid)
+            if nickname is None:
+                # 查询不到的联系人也短暂缓存，避免短时间内重复查询
+                nickname = ""
+                self.cache.put_missing(wxid)
+            if not future.done():
+                future.set_result(nickname)
@@ -1,13 +1,22 @@
+import asyncio
 from typing import Union
 
 import aiohttp
+from loguru import logger
 
 from .base import *
+from .contacts import BATCH_SIZE, ContactCache, NicknameBatcher
 from .protect import protector
 from ..errors import *
 
 
 class FriendMixin(WechatAPIClientBase):
+    def __init__(self, ip: str, port: int):
+        super().__init__(ip, port)
+        # 联系人缓存，昵称查询优先使用缓存，未缓存的wxid合并成批量请求
+        self.contact_cache = ContactCache()
+        self._nickname_batcher = NicknameBatcher(self.get_contract_detail, self.contact_cache)
+
     async def accept_friend(self, scene: int, v1: str, v2: str) -> bool:
         """接受好友请求
 
@@ -57,6 +66,11 @@ class FriendMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
+        if isinstance(wxid, str) and "," not in wxid:
+            cached = self.contact_cache.contact(wxid)
+            if cached is not None:
+                return cached
+
         if isinstance(wxid, list):
             wxid = ",".join(wxid)
 
@@ -67,6 +81,8 @@ class FriendMixin(WechatAPIClientBase):
 
             if json_resp.get("Success"):
                 contact_list = json_resp.get("Data").get("ContactList")
+                for contact in contact_list:
+                    self.contact_cache.put_contact(contact)
                 if len(contact_list) == 1:
                     return contact_list[0]
                 else:
@@ -99,7 +115,11 @@ class FriendMixin(WechatAPIClientBase):
             json_resp = await response.json()
 
             if json_resp.get("Success"):
-                return json_resp.get("Data").get("ContactList")
+                contact_list = json_resp.get("Data").get("ContactList")
+                if not chatroom:
+                    for contact in contact_list or []:
+                        self.contact_cache.put_detail(contact)
+                return contact_list
             else:
                 self.error_handler(json_resp)
 
@@ -135,18 +155,44 @@ class FriendMixin(WechatAPIClientBase):
         Returns:
             Union[str, list[str]]: 如果输入单个wxid返回str，如果输入wxid列表则返回对应的昵称列表
         """
-        data = await self.get_contract_detail(wxid)
-
         if isinstance(wxid, str):
-            try:
-                return data[0].get("NickName").get("string")
-            except:
-                return ""
-        else:
-            result = []
-            for contact in data:
-                try:
-                    result.append(contact.get("NickName").get("string"))
-                except:
-                    result.append("")
-            return result
+            nickname = self.contact_cache.nickname(wxid)
+            if nickname is not None:
+                return nickname
+            return await asyncio.shield(self._nickname_batcher.resolve(wxid))
+
+        nicknames = [self.contact_cache.nickname(i) for i in wxid]
+        missing = [i for i, nickname in zip(wxid, nicknames) if nickname is None]
+        if missing:
+            # 未缓存的wxid与同时进行的其它查询合并成批量请求
+            resolved = await asyncio.gather(*(asyncio.shield(self._nickname_batcher.resolve(i)) for i in missing))
+            resolved = dict(zip(missing, resolved))
+            nicknames = [resolved.get(i, "") if nickname is None else nickname for i, nickname in zip(wxid, nicknames)]
+        return nicknames
+
+    async def preload_contacts(self, interval: float = 1) -> int:
+        """
+        分页读取联系人列表，把未缓存的联系人昵称批量查询进缓存
+
+        Args:
+            interval: 两次批量查询之间的间隔（秒）
+
+        Returns:
+            int: 新缓存的联系人数量
+        """
+        wxids = []
+        wx_seq, chatroom_seq = 0, 0
+        while True:
+            contact_list = await self.get_contract_list(wx_seq, chatroom_seq)
+            wxids.extend(contact_list.get("ContactUsernameList") or [])
+            wx_seq = contact_list["CurrentWxcontactSeq"]
+            chatroom_seq = contact_list["CurrentChatRoomContactSeq"]
+            if contact_list["CountinueFlag"] != 1:
+                break
+
+        missing = [wxid for wxid in dict.fromkeys(wxids) if wxid not in self.contact_cache]
+        for i in range(0, len(missing), BATCH_SIZE):
+            await self.get_contract_detail(missing[i:i + BATCH_SIZE])
+            await asyncio.sleep(interval)
+        logger.info("已缓存 {} 个联系人", len(missing))
+        return len(missing)
@@ -1,6 +1,7 @@
 import asyncio
 import base64
 import os
+import time
 from asyncio import Future
 from asyncio import Queue, sleep
 from io import BytesIO
@@ -13,17 +14,26 @@ from loguru import logger
 from pydub import AudioSegment
 from pymediainfo import MediaInfo
 
+from utils.metrics import metrics
+from utils.tracing import tracer
 from .base import *
 from .protect import protector
 from ..errors import *
 
 
+outbound_sent = metrics.counter("xybot_outbound_messages_total", "通过发送队列发出的消息数", ("result",))
+outbound_wait = metrics.histogram("xybot_outbound_queue_wait_seconds", "消息在发送队列中的等待时间",
+                                  buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+
+
 class MessageMixin(WechatAPIClientBase):
     def __init__(self, ip: str, port: int):
         # 初始化消息队列
         super().__init__(ip, port)
         self._message_queue = Queue()
         self._is_processing = False
+        # 多个进程共用一个账号发送时使用的共享限速器，为None时每条消息后等待1秒
+        self.send_limiter = None
 
     async def _process_message_queue(self):
         """
@@ -38,22 +48,35 @@ class MessageMixin(WechatAPIClientBase):
                 self._is_processing = False
                 break
 
-            func, args, kwargs, future = await self._message_queue.get()
+            func, args, kwargs, future, queued_at, span = await self._message_queue.get()
+            wait = time.monotonic() - queued_at
+            outbound_wait.observe(wait)
+            span.set_attribute("xybot.queue_wait_ms", round(wait * 1000, 3))
             try:
-                result = await func(*args, **kwargs)
+                if self.send_limiter is not None:
+                    await self.send_limiter.acquire()
+                # 在发送者的追踪上下文中发送
+                with tracer.use_span(span if span.recording else None):
+                    result = await func(*args, **kwargs)
                 future.set_result(result)
+                outbound_sent.labels("success").inc()
             except Exception as e:
+                span.record_exception(e)
                 future.set_exception(e)
+                outbound_sent.labels("error").inc()
             finally:
+                tracer.finish(span)
                 self._message_queue.task_done()
-                await sleep(1)  # 消息发送间隔1秒
+                if self.send_limiter is None:
+                    await sleep(1)  # 消息发送间隔1秒
 
     async def _queue_message(self, func, *args, **kwargs):
         """
         将消息添加到队列
         """
         future = Future()
-        await self._message_queue.put((func, args, kwargs, future))
+        span = tracer.begin(f"WechatAPI.{func.__name__.lstrip('_')}", "producer")
+        await self._message_queue.put((func, args, kwargs, future, time.monotonic(), span))
 
         if not self._is_processing:
             asyncio.create_task(self._process_message_queue())
@@ -617,9 +640,12 @@ class MessageMixin(WechatAPIClientBase):
             else:
                 self.error_handler(json_resp)
 
-    async def sync_message(self) -> dict:
+    async def sync_message(self, synckey: str = "") -> dict:
         """同步消息。
 
+        Args:
+            synckey (str, optional): 上次同步返回的同步键，为空时由服务端决定同步位置. Defaults to "".
+
         Returns:
             dict: 返回同步到的消息数据
 
@@ -631,7 +657,7 @@ class MessageMixin(WechatAPIClientBase):
             raise UserLoggedOut("请先登录")
 
         async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-            json_param = {"Wxid": self.wxid, "Scene": 0, "Synckey": ""}
+            json_param = {"Wxid": self.wxid, "Scene": 0, "Synckey": synckey}
             response = await session.post(f'http://{self.ip}:{self.port}/Sync', json=json_param)
             json_resp = await response.json()
 
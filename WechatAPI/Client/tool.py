@@ -6,12 +6,18 @@ import aiohttp
 import pysilk
 from pydub import AudioSegment
 
+from utils.metrics import metrics
 from .base import *
 from .protect import protector
 from ..errors import *
 
 
+media_download = metrics.histogram("xybot_media_download_seconds", "媒体文件下载耗时", ("kind",),
+                                   buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
 class ToolMixin(WechatAPIClientBase):
+    @media_download.labels("image").time()
     async def download_image(self, aeskey: str, cdnmidimgurl: str) -> str:
         """CDN下载高清图片。
 
@@ -39,6 +45,7 @@ class ToolMixin(WechatAPIClientBase):
             else:
                 self.error_handler(json_resp)
 
+    @media_download.labels("voice").time()
     async def download_voice(self, msg_id: str, voiceurl: str, length: int) -> str:
         """下载语音文件。
 
@@ -67,6 +74,7 @@ class ToolMixin(WechatAPIClientBase):
             else:
                 self.error_handler(json_resp)
 
+    @media_download.labels("attach").time()
     async def download_attach(self, attach_id: str) -> dict:
         """下载附件。
 
@@ -93,6 +101,7 @@ class ToolMixin(WechatAPIClientBase):
             else:
                 self.error_handler(json_resp)
 
+    @media_download.labels("video").time()
     async def download_video(self, msg_id) -> str:
         """下载视频。
 
@@ -4,32 +4,49 @@
 使用Redis存储认证数据
 """
 
-import os
-import time
-import hashlib
 import secrets
 import json
-import base64
-from datetime import datetime, timedelta
+from datetime import datetime
+
+from xybot.auth.tokens import TokenStore
+from xybot.auth.security import (
+    LoginGuard, PasswordHasher, TokenCache,
+    hash_password, verify_password
+)
 
 class AuthManager:
     """认证管理器，负责用户认证和访问控制，使用Redis存储数据"""
     
     # Redis键前缀
     REDIS_KEY_USERS = "xybot:web:users"
-    REDIS_KEY_TOKENS = "xybot:web:tokens"
     REDIS_KEY_SECRET = "xybot:web:secret_key"
     
-    def __init__(self, redis_client, token_expire_hours=24):
+    def __init__(self, redis_client, token_expire_hours=24, max_login_attempts=5,
+                 login_timeout_minutes=30, token_cache_seconds=30, token_compaction_minutes=60,
+                 max_ip_login_attempts=20):
         """
         初始化认证管理器
         
         Args:
             redis_client: Redis客户端实例
             token_expire_hours: 令牌过期时间（小时）
+            max_login_attempts: 同一地址对同一用户锁定前允许的登录失败次数
+            max_ip_login_attempts: 同一地址锁定前允许的登录失败次数（不区分用户）
+            login_timeout_minutes: 登录失败的统计窗口和锁定时长（分钟）
+            token_cache_seconds: 已验证令牌的本地缓存时间（秒），0表示不缓存
+            token_compaction_minutes: 令牌存储后台压缩的间隔（分钟）
         """
         self.redis = redis_client
         self.token_expire_hours = token_expire_hours
+        self.token_compaction_minutes = token_compaction_minutes
+        
+        # 令牌按键存储并使用Redis原生TTL，按用户维护令牌集合
+        self.tokens = TokenStore(redis_client)
+        
+        # 密码哈希在线程池中执行，避免阻塞事件循环
+        self.hasher = PasswordHasher()
+        self.rate_limiter = LoginGuard(max_login_attempts, max_ip_login_attempts, login_timeout_minutes * 60)
+        self.token_cache = TokenCache(token_cache_seconds)
         
         # 初始化或加载配置
         self._load_or_create_config()
@@ -51,7 +68,7 @@ class AuthManager:
         
         # 默认管理员账户
         default_password = 'admin123'  # 默认密码
-        password_hash = self._hash_password(default_password)
+        password_hash = await self.hasher.hash(default_password)
         
         admin_user = {
             'username': 'admin',
@@ -75,7 +92,7 @@ class AuthManager:
     
     def _hash_password(self, password):
         """
-        密码哈希
+        密码哈希（同步调用，异步代码中请使用self.hasher）
         
         Args:
             password: 原始密码
@@ -83,23 +100,11 @@ class AuthManager:
         Returns:
             哈希后的密码
         """
-        # 生成随机盐值
-        salt = secrets.token_bytes(16)
-        
-        # 使用PBKDF2算法，带盐值哈希
-        key = hashlib.pbkdf2_hmac(
-            'sha256',
-            password.encode('utf-8'),
-            salt,
-            100000  # 迭代次数
-        )
-        
-        # 将盐值和哈希结果编码为Base64字符串
-        return base64.b64encode(salt + key).decode('utf-8')
+        return hash_password(password)
     
     def _verify_password(self, stored_hash, password):
         """
-        验证密码
+        验证密码（同步调用，异步代码中请使用self.hasher）
         
         Args:
             stored_hash: 存储的哈希值
@@ -108,48 +113,39 @@ class AuthManager:
         Returns:
             密码是否匹配
         """
-        try:
-            # 解码存储的哈希值
-            decoded = base64.b64decode(stored_hash)
-            
-            # 提取盐值和哈希结果
-            salt = decoded[:16]
-            stored_key = decoded[16:]
-            
-            # 使用相同的盐值和算法计算哈希
-            key = hashlib.pbkdf2_hmac(
-                'sha256',
-                password.encode('utf-8'),
-                salt,
-                100000  # 迭代次数
-            )
-            
-            # 比较哈希结果
-            return key == stored_key
-        except Exception:
-            return False
+        return verify_password(stored_hash, password)
     
-    async def authenticate(self, username, password):
+    async def authenticate(self, username, password, client_ip=None):
         """
         验证用户凭据
         
         Args:
             username: 用户名
             password: 密码
+            client_ip: 客户端地址，用于登录频率限制
             
         Returns:
             认证成功时返回用户信息和令牌，否则返回None
+            
+        Raises:
+            LoginRateLimited: 登录失败次数过多
         """
+        self.rate_limiter.check(username, client_ip)
+        
         user_json = await self.redis.hget(self.REDIS_KEY_USERS, username)
         if not user_json:
+            self.rate_limiter.record_failure(username, client_ip)
             return None
         
         user = json.loads(user_json)
         
         # 验证密码
-        if not self._verify_password(user['password_hash'], password):
+        if not await self.hasher.verify(user['password_hash'], password):
+            self.rate_limiter.record_failure(username, client_ip)
             return None
         
+        self.rate_limiter.reset(username, client_ip)
+        
         # 生成访问令牌
         token = await self._generate_token(username)
         
@@ -169,26 +165,8 @@ class AuthManager:
         Returns:
             访问令牌
         """
-        # 生成随机令牌
-        token = secrets.token_hex(32)
-        
-        # 记录令牌信息，使用配置的过期时间
-        expires_at = datetime.now() + timedelta(hours=self.token_expire_hours)
-        token_info = {
-            'username': username,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': expires_at.isoformat()
-        }
-        
-        # 存储到Redis，设置过期时间
-        await self.redis.hset(self.REDIS_KEY_TOKENS, token, json.dumps(token_info))
-        
-        # 设置令牌过期时间
-        ttl_seconds = int(self.token_expire_hours * 3600)
-        expiry_key = f"{self.REDIS_KEY_TOKENS}:expiry:{token}"
-        await self.redis.set(expiry_key, '1', expire=ttl_seconds)
-        
-        return token
+        # 令牌键使用配置的过期时间作为TTL
+        return await self.tokens.issue(username, int(self.token_expire_hours * 3600))
     
     async def validate_token(self, token):
         """
@@ -200,18 +178,14 @@ class AuthManager:
         Returns:
             令牌有效时返回用户信息，否则返回None
         """
-        token_info_json = await self.redis.hget(self.REDIS_KEY_TOKENS, token)
-        if not token_info_json:
-            return None
-        
-        token_info = json.loads(token_info_json)
-        
-        # 检查令牌是否过期
-        expires_at = datetime.fromisoformat(token_info['expires_at'])
-        if datetime.now() > expires_at:
-            # 删除过期令牌
-            await self.redis.hdel(self.REDIS_KEY_TOKENS, token)
-            await self.redis.delete(f"{self.REDIS_KEY_TOKENS}:expiry:{token}")
+        # 短时间内验证过的令牌直接返回，不访问Redis
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
+        
+        # 令牌键带有TTL，过期后自动删除
+        token_info = await self.tokens.get(token)
+        if not token_info:
             return None
         
         # 返回用户信息
@@ -220,8 +194,11 @@ class AuthManager:
         
         if not user_json:
             return None
-            
-        return json.loads(user_json)
+        
+        user = json.loads(user_json)
+        expires_at = datetime.fromisoformat(token_info['expires_at'])
+        self.token_cache.put(token, user, (expires_at - datetime.now()).total_seconds())
+        return user
     
     async def revoke_token(self, token):
         """
@@ -233,15 +210,19 @@ class AuthManager:
         Returns:
             是否成功撤销
         """
-        # 检查令牌是否存在
-        exists = await self.redis.hexists(self.REDIS_KEY_TOKENS, token)
-        if not exists:
-            return False
+        self.token_cache.invalidate(token)
+        return await self.tokens.revoke(token)
+    
+    def start_token_compaction(self):
+        """启动令牌存储的后台压缩任务，需在事件循环中调用"""
+        async def get_usernames():
+            return await self.redis.hkeys(self.REDIS_KEY_USERS)
         
-        # 删除令牌
-        await self.redis.hdel(self.REDIS_KEY_TOKENS, token)
-        await self.redis.delete(f"{self.REDIS_KEY_TOKENS}:expiry:{token}")
-        return True
+        self.tokens.start_compaction(get_usernames, self.token_compaction_minutes * 60)
+    
+    async def stop_token_compaction(self):
+        """停止令牌存储的后台压缩任务"""
+        await self.tokens.stop_compaction()
     
     async def create_user(self, username, password, role='user'):
         """
@@ -261,7 +242,7 @@ class AuthManager:
             return False
         
         # 创建新用户
-        password_hash = self._hash_password(password)
+        password_hash = await self.hasher.hash(password)
         user = {
             'username': username,
             'password_hash': password_hash,
@@ -293,15 +274,16 @@ class AuthManager:
         user = json.loads(user_json)
         
         # 验证旧密码
-        if not self._verify_password(user['password_hash'], old_password):
+        if not await self.hasher.verify(user['password_hash'], old_password):
             return False
         
         # 设置新密码
-        user['password_hash'] = self._hash_password(new_password)
+        user['password_hash'] = await self.hasher.hash(new_password)
         user['updated_at'] = datetime.now().isoformat()
         
         # 更新用户信息
         await self.redis.hset(self.REDIS_KEY_USERS, username, json.dumps(user))
+        self.token_cache.invalidate_user(username)
         return True
     
     async def delete_user(self, username):
@@ -339,13 +321,9 @@ class AuthManager:
         
         # 删除用户
         await self.redis.hdel(self.REDIS_KEY_USERS, username)
+        self.token_cache.invalidate_user(username)
         
         # 撤销该用户的所有令牌
-        all_tokens = await self.redis.hgetall(self.REDIS_KEY_TOKENS)
-        for token, token_info_json in all_tokens.items():
-            token_info = json.loads(token_info_json)
-            if token_info['username'] == username:
-                await self.redis.hdel(self.REDIS_KEY_TOKENS, token)
-                await self.redis.delete(f"{self.REDIS_KEY_TOKENS}:expiry:{token}")
+        await self.tokens.revoke_user(username)
         
         return True 
\ No newline at end of file
@@ -0,0 +1,4 @@
+"""
+性能基准测试
+不依赖真实微信账号，用本地模拟的WechatAPI服务回放消息流量
+"""
@@ -0,0 +1,153 @@
+"""
+数据库引擎配置基准测试
+
+在临时目录中用不同的引擎配置创建SQLite数据库，分别测试：
+    sync  与XYBotDB相同的单线程逐条提交（UPDATE积分，不存在时INSERT）
+    async 与MessageDB相同的多个协程并发写入（每条消息一个事务）
+输出每种配置的写入速度和遇到 database is locked 的次数。
+
+用法:
+    python -m benchmarks.db_engine
+    python -m benchmarks.db_engine --writes 5000 --concurrency 32 --configs default wal-normal
+    python -m benchmarks.db_engine --json db_engine.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.XYBotDB import Base, User
+from database.engine import create_async_db_engine, create_db_engine
+from database.messsagDB import DeclarativeBase as MessageBase, Message
+
+# None表示不做任何调优（修改前的create_engine默认参数）
+CONFIGS: Dict[str, Any] = {
+    "default": None,
+    "wal-normal": {"journal-mode": "WAL", "synchronous": "NORMAL"},
+    "wal-full": {"journal-mode": "WAL", "synchronous": "FULL"},
+    "delete-normal": {"journal-mode": "DELETE", "synchronous": "NORMAL"},
+}
+
+
+def bench_sync(workdir: Path, name: str, config, writes: int, users: int) -> Dict[str, Any]:
+    url = f"sqlite:///{workdir / f'{name}-sync.db'}"
+    engine = create_engine(url) if config is None else create_db_engine(url, config)
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(writes):
+        wxid = f"wxid_{rng.randrange(users)}"
+        session = session_factory()
+        try:
+            result = session.execute(update(User).where(User.wxid == wxid).values(points=User.points + 1))
+            if result.rowcount == 0:
+                session.add(User(wxid=wxid, points=1))
+            session.commit()
+        finally:
+            session.close()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+    return {"writes": writes, "seconds": round(elapsed, 3), "writes_per_second": round(writes / elapsed, 1)}
+
+
+async def bench_async(workdir: Path, name: str, config, writes: int, concurrency: int) -> Dict[str, Any]:
+    url = f"sqlite+aiosqlite:///{workdir / f'{name}-async.db'}"
+    engine = create_async_engine(url) if config is None else create_async_db_engine(url, config)
+    async with engine.begin() as conn:
+        await conn.run_sync(MessageBase.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    locked = 0
+    failed = 0
+    counter = iter(range(writes))
+
+    async def writer(worker: int):
+        nonlocal locked, failed
+        for i in counter:
+            async with session_factory() as session:
+                try:
+                    session.add(Message(msg_id=i, sender_wxid=f"wxid_{worker}", from_wxid="bench@chatroom",
+                                        msg_type=1, content="benchmark " * 10, is_group=True))
+                    await session.commit()
+                except OperationalError as e:
+                    await session.rollback()
+                    if "locked" in str(e):
+                        locked += 1
+                    else:
+                        failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    ok = writes - locked - failed
+    return {"writes": ok, "locked": locked, "failed": failed, "seconds": round(elapsed, 3),
+            "writes_per_second": round(ok / elapsed, 1)}
+
+
+def run(args) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="xybot-db-bench-"))
+    results: Dict[str, Any] = {}
+    try:
+        for name in args.configs:
+            config = CONFIGS[name]
+            if config is not None:
+                config = {**config, "busy-timeout": args.busy_timeout}
+            results[name] = {
+                "sync": bench_sync(workdir, name, config, args.writes, args.users),
+                "async": asyncio.run(bench_async(workdir, name, config, args.writes, args.concurrency)),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "params": {"writes": args.writes, "users": args.users, "concurrency": args.concurrency,
+                   "busy_timeout": args.busy_timeout},
+        "results": results,
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    params = result["params"]
+    print(f"每种配置写入 {params['writes']} 条，并发写入协程数 {params['concurrency']}")
+    print(f"{'配置':<16} {'逐条提交 条/秒':>16} {'并发写入 条/秒':>16} {'被锁次数':>10} {'其它失败':>10}")
+    for name, row in result["results"].items():
+        print(f"{name:<16} {row['sync']['writes_per_second']:>16.1f} {row['async']['writes_per_second']:>16.1f} "
+              f"{row['async']['locked']:>10} {row['async']['failed']:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="XYBot数据库引擎配置基准测试")
+    parser.add_argument("--writes", type=int, default=2000, help="每种配置写入的条数")
+    parser.add_argument("--users", type=int, default=500, help="逐条提交测试中的用户数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发写入的协程数")
+    parser.add_argument("--busy-timeout", type=int, default=5000, help="调优配置的忙等待超时（毫秒）")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS), help="测试的配置")
+    parser.add_argument("--json", default="", help="把结果保存为JSON文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
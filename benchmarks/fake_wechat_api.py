@@ -0,0 +1,135 @@
+"""
+模拟的WechatAPI HTTP服务
+按真实接口的返回格式应答WechatAPIClient的请求，/Sync 返回预先放入队列的消息，
+其它发送类接口直接返回成功，用于在没有微信账号和Redis的情况下回放消息
+"""
+
+import asyncio
+import base64
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from aiohttp import web
+
+# 1x1 像素的PNG图片，作为下载图片、语音等接口的返回内容
+PLACEHOLDER_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+PLACEHOLDER_B64 = base64.b64encode(PLACEHOLDER_PNG).decode()
+
+
+class FakeWechatAPI:
+    """模拟的WechatAPI服务"""
+
+    def __init__(self, members: Iterable[str] = (), latency: float = 0.0, sync_batch: int = 100):
+        """
+        Args:
+            members: 群成员wxid列表，用于应答获取群成员、联系人详情等接口
+            latency: 每个请求额外的模拟网络延迟（秒）
+            sync_batch: 每次 /Sync 最多返回的消息数
+        """
+        self.members = list(members)
+        self.latency = latency
+        self.sync_batch = sync_batch
+
+        self.requests: Counter = Counter()
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._runner: Optional[web.AppRunner] = None
+        self._msg_seq = 0
+
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_post("/{path}", self._handle)
+
+    @property
+    def pending(self) -> int:
+        """尚未被同步走的消息数"""
+        return len(self._pending)
+
+    def push(self, messages: Iterable[Dict[str, Any]]):
+        """放入待同步的消息，下一次 /Sync 时返回"""
+        self._pending.extend(messages)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """
+        启动服务
+
+        Returns:
+            实际监听的端口
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return self._runner.addresses[0][1]
+
+    async def stop(self):
+        """停止服务"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        path = request.match_info["path"]
+        self.requests[path] = self.requests[path] + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        try:
+            params = await request.json()
+        except Exception:
+            params = {}
+
+        handler = getattr(self, f"_on_{path}", None)
+        data = handler(params) if handler is not None else self._sent()
+        return web.json_response({"Success": True, "Code": 0, "Message": "", "Data": data})
+
+    def _next_msg_id(self) -> int:
+        self._msg_seq += 1
+        return 7_000_000_000_000_000_000 + self._msg_seq
+
+    def _sent(self) -> Dict[str, Any]:
+        """发送类接口的通用返回，同时包含各接口解析时使用的字段"""
+        now = int(time.time())
+        msg_id = self._next_msg_id()
+        return {
+            "List": [{"ClientMsgid": msg_id, "Createtime": now, "NewMsgId": msg_id}],
+            "ClientImgId": {"string": str(msg_id)},
+            "CreateTime": now,
+            "Newmsgid": msg_id,
+            "clientMsgId": msg_id,
+            "createTime": now,
+            "newMsgId": msg_id,
+        }
+
+    def _contact(self, wxid: str) -> Dict[str, Any]:
+        return {
+            "UserName": {"string": wxid},
+            "NickName": {"string": f"昵称_{wxid[-4:]}"},
+            "SmallHeadImgUrl": "",
+            "BigHeadImgUrl": "",
+        }
+
+    def _on_Sync(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        batch = []
+        while self._pending and len(batch) < self.sync_batch:
+            batch.append(self._pending.popleft())
+        return {"AddMsgs": batch, "ContinueFlag": 1 if self._pending else 0}
+
+    def _on_CdnDownloadImg(self, params: Dict[str, Any]) -> str:
+        return PLACEHOLDER_B64
+
+    def _download(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"data": {"buffer": PLACEHOLDER_B64}}
+
+    _on_DownloadVoice = _on_DownloadAttach = _on_DownloadVideo = _download
+
+    def _on_GetContractDetail(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        wxids: List[str] = [w for w in str(params.get("RequestWxids", "")).split(",") if w]
+        return {"ContactList": [self._contact(wxid) for wxid in wxids]}
+
+    _on_GetContact = _on_GetContractDetail
+
+    def _on_GetChatroomMemberDetail(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        members = [{"UserName": wxid, "NickName": f"昵称_{wxid[-4:]}", "DisplayName": ""} for wxid in self.members]
+        return {"NewChatroomData": {"MemberCount": len(members), "ChatRoomMember": members}}
@@ -0,0 +1,192 @@
+"""
+五子棋引擎微基准测试
+
+同时进行多局随机对弈（模拟很多群同时下五子棋），对比修改前的实现（列表棋盘，每步扫描整个棋盘判断胜负和平局）
+与 plugins.Gomoku.engine.GomokuBoard（bytearray棋盘，只检查经过最后一颗棋子的线）每秒能处理的落子数，
+并检查两者判断的结果一致。
+
+--render-moves 大于0时，另外测试每步绘制棋盘图片的延迟：修改前的方式（每步打开底图、重画所有棋子、PNG编码）
+与 plugins.Gomoku.renderer.BoardRenderer 的各种输出格式。需要在仓库根目录运行（读取棋盘底图）。
+
+用法:
+    python -m benchmarks.gomoku_engine
+    python -m benchmarks.gomoku_engine --games 1000 --seed 1
+    python -m benchmarks.gomoku_engine --render-moves 60
+"""
+
+import argparse
+import asyncio
+import base64
+import random
+import sys
+import time
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw
+
+from plugins.Gomoku.engine import BLACK, DRAW, EMPTY, SIZE, WHITE, GomokuBoard
+from plugins.Gomoku.renderer import BoardRenderer
+
+
+def legacy_check_winner(board: List[List[int]]) -> str:
+    """修改前 Gomoku._check_winner 的实现"""
+    directions = [(0, 1), (1, 0), (1, 1), (1, -1)]
+    for y in range(17):
+        for x in range(17):
+            if board[y][x] == 0:
+                continue
+            for dx, dy in directions:
+                count = 1
+                nx, ny = x + dx, y + dy
+                while 0 <= nx < 17 and 0 <= ny < 17 and board[ny][nx] == board[y][x]:
+                    count += 1
+                    nx += dx
+                    ny += dy
+                if count >= 5:
+                    return 'black' if board[y][x] == 1 else 'white'
+    if all(board[y][x] != 0 for y in range(17) for x in range(17)):
+        return 'draw'
+    return ''
+
+
+def make_games(count: int, seed: int) -> Dict[str, List[Tuple[int, int]]]:
+    """每局一个随机的落子顺序"""
+    rng = random.Random(seed)
+    cells = [(x, y) for y in range(SIZE) for x in range(SIZE)]
+    games = {}
+    for i in range(count):
+        order = cells[:]
+        rng.shuffle(order)
+        games[f"game{i}"] = order
+    return games
+
+
+def play_interleaved(games: Dict[str, List[Tuple[int, int]]], new_board, place) -> Tuple[int, float, Dict[str, str]]:
+    """所有对局轮流落子直到结束，返回总落子数、耗时和每局结果"""
+    boards = {game_id: new_board() for game_id in games}
+    active = list(games)
+    results: Dict[str, str] = {}
+    moves = 0
+    step = 0
+    start = time.perf_counter()
+    while active:
+        still_active = []
+        for game_id in active:
+            x, y = games[game_id][step]
+            stone = BLACK if step % 2 == 0 else WHITE
+            result = place(boards[game_id], x, y, stone)
+            moves += 1
+            if result:
+                results[game_id] = result
+            else:
+                still_active.append(game_id)
+        active = still_active
+        step += 1
+    return moves, time.perf_counter() - start, results
+
+
+def legacy_place(board: List[List[int]], x: int, y: int, stone: int) -> str:
+    board[y][x] = stone
+    return legacy_check_winner(board)
+
+
+def engine_place(board: GomokuBoard, x: int, y: int, stone: int) -> str:
+    result = board.place(x, y, stone)
+    if result == EMPTY:
+        return ''
+    return 'draw' if result == DRAW else ('black' if result == BLACK else 'white')
+
+
+def legacy_board() -> List[List[int]]:
+    return [[0 for _ in range(17)] for _ in range(17)]
+
+
+def board_size(board) -> int:
+    if isinstance(board, GomokuBoard):
+        return sys.getsizeof(board) + sys.getsizeof(board.cells)
+    return sys.getsizeof(board) + sum(sys.getsizeof(row) for row in board)
+
+
+def legacy_draw(board: GomokuBoard, highlight: Tuple[int, int]) -> str:
+    """修改前 Gomoku._draw_board 的实现"""
+    board_img = Image.open('resource/images/gomoku_board_original.png')
+    draw = ImageDraw.Draw(board_img)
+    for x, y, stone in board.stones():
+        draw.ellipse((24 + x * 27 - 8, 24 + y * 27 - 8, 24 + x * 27 + 8, 24 + y * 27 + 8),
+                     fill='black' if stone == BLACK else 'white')
+    x, y = highlight
+    draw.ellipse((24 + x * 27 - 8, 24 + y * 27 - 8, 24 + x * 27 + 8, 24 + y * 27 + 8), outline='red', width=2)
+    buffer = BytesIO()
+    board_img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+async def bench_render(moves: List[Tuple[int, int]]) -> List[Tuple[str, List[float], int]]:
+    """每种绘制方式每步的延迟（秒）和最后一张图片的大小"""
+    renderers = [
+        ("PNG 压缩等级6", BoardRenderer(image_format="PNG", png_compress_level=6)),
+        ("PNG 压缩等级1", BoardRenderer(image_format="PNG", png_compress_level=1)),
+        ("JPEG 质量85", BoardRenderer(image_format="JPEG", jpeg_quality=85)),
+    ]
+    results = []
+
+    board = GomokuBoard()
+    latencies = []
+    image = ""
+    for i, (x, y) in enumerate(moves):
+        board.place(x, y, BLACK if i % 2 == 0 else WHITE)
+        start = time.perf_counter()
+        image = legacy_draw(board, (x, y))
+        latencies.append(time.perf_counter() - start)
+    results.append(("修改前", latencies, len(image)))
+
+    for name, renderer in renderers:
+        board = GomokuBoard()
+        latencies = []
+        for i, (x, y) in enumerate(moves):
+            board.place(x, y, BLACK if i % 2 == 0 else WHITE)
+            start = time.perf_counter()
+            renderer.place("bench", board, x, y)
+            image = await renderer.render("bench", board, highlight=(x, y))
+            latencies.append(time.perf_counter() - start)
+        results.append((name, latencies, len(image)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="五子棋引擎微基准测试")
+    parser.add_argument("--games", type=int, default=200, help="同时进行的对局数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--render-moves", type=int, default=0, help="测试绘制延迟的落子数，0为不测试")
+    args = parser.parse_args(argv)
+
+    games = make_games(args.games, args.seed)
+    rows = []
+    outcomes = {}
+    for name, new_board, place in (("列表+全盘扫描", legacy_board, legacy_place),
+                                   ("bytearray+增量检查", GomokuBoard, engine_place)):
+        moves, elapsed, results = play_interleaved(games, new_board, place)
+        outcomes[name] = results
+        rows.append((name, moves, elapsed, board_size(new_board())))
+
+    print(f"同时进行 {args.games} 局随机对弈")
+    print(f"{'实现':<20} {'落子数':>10} {'耗时s':>10} {'落子/秒':>12} {'每局棋盘字节':>14}")
+    for name, moves, elapsed, size in rows:
+        print(f"{name:<20} {moves:>10} {elapsed:>10.3f} {moves / elapsed:>12.0f} {size:>14}")
+    legacy, engine = outcomes.values()
+    print("结果一致" if legacy == engine else "结果不一致！")
+
+    if args.render_moves > 0:
+        moves = next(iter(games.values()))[:args.render_moves]
+        print(f"\n每步绘制棋盘图片的延迟（{len(moves)}步）")
+        print(f"{'方式':<16} {'p50 ms':>10} {'p99 ms':>10} {'最大 ms':>10} {'图片大小':>12}")
+        for name, latencies, size in asyncio.run(bench_render(moves)):
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+            print(f"{name:<16} {p50:>10.2f} {p99:>10.2f} {latencies[-1] * 1000:>10.2f} {size:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+抽奖引擎基准测试
+
+用 plugins/LuckyDraw/config.toml 中的奖池，对比修改前逐次遍历奖品、每次解析概率字符串的实现
+与 plugins.LuckyDraw.lottery.PrizeTable（累积概率数组 + NumPy批量抽取）在不同抽奖次数下每次请求的耗时，
+并比较两者抽中各奖品的频率。
+
+用法:
+    python -m benchmarks.lottery
+    python -m benchmarks.lottery --pool 大 --counts 1 10 100 1000 10000
+"""
+
+import argparse
+import random
+import time
+import tomllib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from plugins.LuckyDraw.lottery import PrizeTable
+
+
+def legacy_draw(draw_probability: dict, draw_count: int, draw_per_guarantee: int,
+                guaranteed_max_probability: float) -> Tuple[list, int]:
+    """修改前 LuckyDraw.handle_text 中的抽奖循环"""
+    wins = []
+    min_guaranteed = draw_count // draw_per_guarantee
+    for _ in range(min_guaranteed):
+        random_num = random.uniform(0, guaranteed_max_probability)
+        cumulative_probability = 0
+        for p, prize in draw_probability.items():
+            cumulative_probability += float(p)
+            if random_num <= cumulative_probability:
+                wins.append((prize["name"], prize["points"], prize["symbol"]))
+                break
+    for _ in range(draw_count - min_guaranteed):
+        random_num = random.uniform(0, 1)
+        cumulative_probability = 0
+        for p, prize in draw_probability.items():
+            cumulative_probability += float(p)
+            if random_num <= cumulative_probability:
+                wins.append((prize["name"], prize["points"], prize["symbol"]))
+                break
+    return wins, sum(win[1] for win in wins)
+
+
+def time_per_call(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def frequencies(wins: List[tuple]) -> Dict[str, float]:
+    counter = Counter(win[0] for win in wins)
+    total = sum(counter.values()) or 1
+    return {name: count / total for name, count in counter.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="抽奖引擎基准测试")
+    parser.add_argument("--config", default="plugins/LuckyDraw/config.toml", help="抽奖插件配置文件")
+    parser.add_argument("--pool", default="大", help="奖池名称")
+    parser.add_argument("--counts", nargs="+", type=int, default=[1, 10, 100, 1000, 10000], help="每次请求的抽奖次数")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每组测试至少运行的秒数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    with open(args.config, "rb") as f:
+        config = tomllib.load(f)["LuckyDraw"]
+    pools = {item["name"]: item for item in config["probabilities"].values()}
+    probability = pools[args.pool]["probability"]
+    draw_per_guarantee = config["draw-per-guarantee"]
+    guaranteed_max = config["guaranteed-max-probability"]
+
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    table = PrizeTable(probability)
+
+    print(f"奖池: {args.pool}  奖品数: {len(table.prizes)}  每{draw_per_guarantee}次保底一次")
+    print(f"{'次数':>8} {'修改前 us/请求':>16} {'累积表 us/请求':>16} {'加速':>8}")
+    for count in args.counts:
+        def legacy():
+            legacy_draw(probability, count, draw_per_guarantee, guaranteed_max)
+
+        def vectorized():
+            table.sample(count, count // draw_per_guarantee, guaranteed_max, rng)
+
+        results = []
+        for func in (legacy, vectorized):
+            repeat = 1
+            while True:
+                elapsed = time_per_call(func, repeat)
+                if elapsed * repeat >= args.min_time or repeat >= 1 << 20:
+                    break
+                repeat *= 4
+            results.append(elapsed)
+        print(f"{count:>8} {results[0] * 1e6:>16.1f} {results[1] * 1e6:>16.1f} {results[0] / results[1]:>7.1f}x")
+
+    # 抽中各奖品的频率应一致
+    count = max(args.counts)
+    legacy_freq = frequencies(legacy_draw(probability, count, draw_per_guarantee, guaranteed_max)[0])
+    table_freq = frequencies(table.sample(count, count // draw_per_guarantee, guaranteed_max, rng)[0])
+    print(f"\n{count}次抽奖中各奖品的频率:")
+    for name, _, _ in table.prizes:
+        print(f"  {name:<4} 修改前 {legacy_freq.get(name, 0):.4f}  累积表 {table_freq.get(name, 0):.4f}")
+
+
+if __name__ == "__main__":
+    main()
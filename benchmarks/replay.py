@@ -0,0 +1,422 @@
+"""
+消息处理回放基准测试
+
+启动一个模拟的WechatAPI服务，把合成或录制的 AddMsgs 消息按与 bot_core 相同的
+同步循环交给 XYBot.process_message，经过真实的插件和SQLite数据库处理，统计吞吐量、
+端到端延迟分位数和各阶段耗时。结果可以保存为JSON，用于对比不同提交的性能。
+
+用法:
+    python -m benchmarks.replay --messages 2000 --rate 200
+    python -m benchmarks.replay --recorded traffic.jsonl --messages 5000
+    python -m benchmarks.replay --json before.json
+    python -m benchmarks.replay --json after.json --compare before.json
+
+所有数据库都放在临时目录中，不会修改仓库中的数据库。
+"""
+
+import argparse
+import asyncio
+import importlib
+import inspect
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# 默认加载的插件，只访问本地数据库和模拟的WechatAPI服务
+DEFAULT_PLUGINS = ["SignIn", "QueryPoint", "Menu", "Leaderboard", "BotStatus", "LuckyDraw", "Gomoku",
+                   "ManagePlugin", "AdminPoint"]
+
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def _quantile_label(q: float) -> str:
+    return "max" if q == 1.0 else f"p{int(q * 100)}"
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    """延迟分位数（毫秒）"""
+    values = sorted(values)
+    result = {_quantile_label(q): round(_quantile(values, q) * 1000, 3) for q in QUANTILES}
+    result["mean"] = round(sum(values) / len(values) * 1000, 3) if values else 0.0
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+
+def prepare_workdir(workdir: Path):
+    """
+    准备临时工作目录：数据库指向临时目录、关闭风控保护，插件和资源目录链接到仓库
+    """
+    config = (REPO_ROOT / "main_config.toml").read_text(encoding="utf-8")
+    replacements = {
+        "XYBotDB-url": f'"sqlite:///{workdir / "xybot.db"}"',
+        "msgDB-url": f'"sqlite+aiosqlite:///{workdir / "message.db"}"',
+        "keyvalDB-url": f'"sqlite+aiosqlite:///{workdir / "keyval.db"}"',
+        "ignore-protection": "true",
+    }
+    for key, value in replacements.items():
+        config = re.sub(rf"^({re.escape(key)}\s*=\s*)[^#\n]*", rf"\g<1>{value}  ", config, count=1, flags=re.M)
+    (workdir / "main_config.toml").write_text(config, encoding="utf-8")
+
+    for name in ("plugins", "resource"):
+        (workdir / name).symlink_to(REPO_ROOT / name, target_is_directory=True)
+
+
+async def load_plugins(bot, selected: Optional[List[str]]) -> List[str]:
+    """加载选中的插件，selected为空时加载main_config.toml中未禁用的全部插件"""
+    from utils.plugin_base import PluginBase
+    from utils.plugin_manager import plugin_manager
+
+    if selected is None:
+        with open(REPO_ROOT / "main_config.toml", "rb") as f:
+            import tomllib
+            excluded = set(tomllib.load(f)["XYBot"]["disabled-plugins"])
+    loaded = []
+    for dirname in sorted(os.listdir("plugins")):
+        if not os.path.exists(f"plugins/{dirname}/main.py"):
+            continue
+        module = importlib.import_module(f"plugins.{dirname}.main")
+        for _, obj in inspect.getmembers(module):
+            if inspect.isclass(obj) and issubclass(obj, PluginBase) and obj != PluginBase:
+                if selected is None:
+                    is_disabled = obj.__name__ in excluded
+                else:
+                    is_disabled = obj.__name__ not in selected
+                if await plugin_manager.load_plugin(bot, obj, is_disabled=is_disabled):
+                    loaded.append(obj.__name__)
+    return loaded
+
+
+def histogram_snapshot() -> Dict[Tuple[str, Tuple[str, ...]], Tuple[int, float]]:
+    """所有直方图当前的计数和总耗时"""
+    from utils.metrics import Histogram, metrics
+
+    snapshot = {}
+    for metric in metrics.collect():
+        if not isinstance(metric, Histogram):
+            continue
+        for values, child in metric.children():
+            snapshot[(metric.name, values)] = (child.count, child.sum)
+    return snapshot
+
+
+def stage_breakdown(before, after) -> List[Dict[str, Any]]:
+    """两次快照之间各直方图的调用次数和耗时"""
+    from utils.metrics import metrics
+
+    labelnames = {metric.name: metric.labelnames for metric in metrics.collect()}
+    stages = []
+    for key, (count, total) in after.items():
+        base_count, base_total = before.get(key, (0, 0.0))
+        count -= base_count
+        total -= base_total
+        if count <= 0:
+            continue
+        name, values = key
+        stages.append({
+            "metric": name,
+            "labels": dict(zip(labelnames.get(name, ()), values)),
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total / count * 1000, 3),
+        })
+    stages.sort(key=lambda s: s["total_ms"], reverse=True)
+    return stages
+
+
+class Replayer:
+    """按 bot_core 的同步循环把消息交给XYBot处理，并记录每条消息的耗时"""
+
+    def __init__(self, fake, bot, xybot, sync_interval: float):
+        self.fake = fake
+        self.bot = bot
+        self.xybot = xybot
+        self.sync_interval = sync_interval
+
+        self.latencies: List[float] = []
+        self.process_times: List[float] = []
+        self.sync_times: List[float] = []
+        self.errors = 0
+        self._injected_at: Dict[int, float] = {}
+        self._tasks = set()
+
+    async def run(self, messages: List[Dict[str, Any]], rate: float) -> float:
+        """
+        回放消息
+
+        Args:
+            messages: 消息列表
+            rate: 每秒放入的消息数，0为一次性全部放入
+
+        Returns:
+            从开始放入消息到全部处理完成的耗时（秒）
+        """
+        start = time.perf_counter()
+        injector = asyncio.create_task(self._inject(messages, rate))
+        while not injector.done() or self.fake.pending:
+            await self._sync_once()
+            await asyncio.sleep(self.sync_interval)
+        await injector
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+        return time.perf_counter() - start
+
+    async def _inject(self, messages: List[Dict[str, Any]], rate: float):
+        if rate <= 0:
+            now = time.perf_counter()
+            for message in messages:
+                self._injected_at[message["MsgId"]] = now
+            self.fake.push(messages)
+            return
+
+        start = time.perf_counter()
+        sent = 0
+        while sent < len(messages):
+            due = min(len(messages), int((time.perf_counter() - start) * rate) + 1)
+            now = time.perf_counter()
+            batch = messages[sent:due]
+            for message in batch:
+                self._injected_at[message["MsgId"]] = now
+            self.fake.push(batch)
+            sent = due
+            await asyncio.sleep(min(0.01, 1 / rate))
+
+    async def _sync_once(self):
+        start = time.perf_counter()
+        data = await self.bot.sync_message()
+        self.sync_times.append(time.perf_counter() - start)
+        for message in data.get("AddMsgs") or []:
+            injected_at = self._injected_at.pop(message["MsgId"], start)
+            task = asyncio.create_task(self._process(message, injected_at))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, message: Dict[str, Any], injected_at: float):
+        start = time.perf_counter()
+        try:
+            await self.xybot.process_message(message)
+        except Exception:
+            self.errors += 1
+        end = time.perf_counter()
+        self.process_times.append(end - start)
+        self.latencies.append(end - injected_at)
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    import WechatAPI
+    from WechatAPI.Client import message as message_module
+    from database.XYBotDB import XYBotDB
+    from database.keyvalDB import KeyvalDB
+    from database.messsagDB import MessageDB
+    from utils.profiler import profiler
+    from utils.tracing import tracer
+    from utils.xybot import XYBot
+
+    from benchmarks.fake_wechat_api import FakeWechatAPI
+    from benchmarks.traffic import TrafficGenerator, load_recorded, replay_cycle
+
+    generator = TrafficGenerator(args.wxid, users=args.users, rooms=args.rooms, seed=args.seed)
+    if args.recorded:
+        recorded = replay_cycle(load_recorded(args.recorded))
+        produce = lambda count: [next(recorded) for _ in range(count)]
+    else:
+        produce = generator.generate
+
+    fake = FakeWechatAPI(members=generator.users[:args.room_size], latency=args.api_latency / 1000,
+                         sync_batch=args.sync_batch)
+    port = await fake.start()
+
+    bot = WechatAPI.WechatAPIClient("127.0.0.1", port)
+    bot.wxid = args.wxid
+    bot.nickname = "XYBot基准测试"
+    bot.ignore_protect = True
+    if not args.real_send_interval:
+        async def no_interval(delay):
+            await asyncio.sleep(0)
+
+        message_module.sleep = no_interval
+
+    xybot = XYBot(bot)
+    xybot.update_profile(bot.wxid, bot.nickname, "", "")
+
+    xybot_db = XYBotDB()
+    message_db = MessageDB()
+    await message_db.initialize()
+    keyval_db = KeyvalDB()
+    await keyval_db.initialize()
+
+    profiler.configure({"enabled": True, "watchdog-threshold": 0})
+    if args.trace_file:
+        tracer.configure({"enabled": True, "sample-rate": 1.0, "exporter": "file", "file": args.trace_file,
+                          "flush-interval": 1})
+    plugins = await load_plugins(bot, None if args.plugins == ["all"] else args.plugins)
+
+    replayer = Replayer(fake, bot, xybot, args.sync_interval)
+    if args.warmup:
+        await replayer.run(produce(args.warmup), 0)
+        replayer = Replayer(fake, bot, xybot, args.sync_interval)
+    profiler.reset()
+
+    requests_before = dict(fake.requests)
+    before = histogram_snapshot()
+    elapsed = await replayer.run(produce(args.messages), args.rate)
+    after = histogram_snapshot()
+    requests = {path: count - requests_before.get(path, 0) for path, count in fake.requests.items()
+                if count - requests_before.get(path, 0) > 0}
+
+    await fake.stop()
+    await message_db.close()
+    await keyval_db.close()
+    xybot_db.executor.shutdown(wait=True)
+    tracer.shutdown()
+
+    return {
+        "commit": _git_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "params": {
+            "messages": args.messages,
+            "rate": args.rate,
+            "sync_interval": args.sync_interval,
+            "api_latency_ms": args.api_latency,
+            "recorded": args.recorded or "",
+            "real_send_interval": args.real_send_interval,
+        },
+        "plugins": plugins,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(args.messages / elapsed, 2) if elapsed else 0.0,
+        "errors": replayer.errors,
+        "latency_ms": _summary(replayer.latencies),
+        "process_ms": _summary(replayer.process_times),
+        "sync_ms": _summary(replayer.sync_times),
+        "stages": stage_breakdown(before, after),
+        "plugin_ranking": profiler.ranking(by="wall", group="plugin"),
+        "api_requests": requests,
+    }
+
+
+def print_report(result: Dict[str, Any], top: int):
+    print(f"提交: {result['commit'] or '-'}  插件: {', '.join(result['plugins'])}")
+    print(f"消息数: {result['params']['messages']}  耗时: {result['elapsed']:.3f}s  "
+          f"吞吐量: {result['throughput']:.1f} 条/秒  失败: {result['errors']}")
+    for title, key in (("端到端延迟", "latency_ms"), ("处理耗时", "process_ms"), ("同步请求", "sync_ms")):
+        summary = result[key]
+        print(f"{title}(ms): " + "  ".join(f"{name}={value:.2f}" for name, value in summary.items()))
+
+    print("\n各阶段耗时:")
+    print(f"{'指标':<40} {'标签':<45} {'次数':>8} {'总耗时ms':>12} {'平均ms':>10}")
+    for stage in result["stages"][:top]:
+        labels = ",".join(f"{k}={v}" for k, v in stage["labels"].items())
+        print(f"{stage['metric']:<40} {labels[:45]:<45} {stage['count']:>8} {stage['total_ms']:>12.2f} "
+              f"{stage['mean_ms']:>10.3f}")
+
+    print("\n插件耗时:")
+    for row in result["plugin_ranking"]:
+        print(f"  {row['plugin']:<20} 调用 {row['calls']:>6}  总耗时 {row['wall'] * 1000:>10.2f}ms  "
+              f"CPU {row['cpu'] * 1000:>10.2f}ms  最长单步 {row['step_max'] * 1000:>8.2f}ms")
+
+    print("\nWechatAPI请求:")
+    for path, count in sorted(result["api_requests"].items(), key=lambda item: -item[1]):
+        print(f"  {path:<30} {count}")
+
+
+def print_comparison(result: Dict[str, Any], baseline: Dict[str, Any]):
+    print(f"\n与 {baseline.get('commit') or '基准'} 对比:")
+    rows = [("吞吐量(条/秒)", baseline["throughput"], result["throughput"])]
+    for key, title in (("latency_ms", "端到端"), ("process_ms", "处理")):
+        for name in baseline[key]:
+            rows.append((f"{title} {name}(ms)", baseline[key][name], result[key].get(name, 0.0)))
+    for title, old, new in rows:
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"  {title:<20} {old:>12.2f} -> {new:>12.2f}  ({change:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="XYBot消息处理回放基准测试")
+    parser.add_argument("--messages", type=int, default=2000, help="回放的消息数")
+    parser.add_argument("--warmup", type=int, default=100, help="正式计时前预热的消息数")
+    parser.add_argument("--rate", type=float, default=0, help="每秒放入的消息数，0为一次性全部放入")
+    parser.add_argument("--recorded", default="", help="录制的消息文件（JSON Lines），为空时使用合成消息")
+    parser.add_argument("--plugins", nargs="+", default=DEFAULT_PLUGINS,
+                        help="加载的插件类名，all为main_config.toml中未禁用的全部插件")
+    parser.add_argument("--users", type=int, default=200, help="合成消息的用户数")
+    parser.add_argument("--rooms", type=int, default=10, help="合成消息的群聊数")
+    parser.add_argument("--room-size", type=int, default=50, help="模拟群成员数")
+    parser.add_argument("--seed", type=int, default=0, help="合成消息的随机种子")
+    parser.add_argument("--wxid", default="wxid_xybotbench", help="机器人wxid")
+    parser.add_argument("--sync-interval", type=float, default=0.5, help="同步消息间隔（秒），与bot_core一致")
+    parser.add_argument("--sync-batch", type=int, default=100, help="每次同步最多返回的消息数")
+    parser.add_argument("--api-latency", type=float, default=0, help="模拟WechatAPI每个请求的延迟（毫秒）")
+    parser.add_argument("--real-send-interval", action="store_true", help="保留发送队列每条消息1秒的间隔")
+    parser.add_argument("--log-level", default="WARNING", help="日志等级")
+    parser.add_argument("--top", type=int, default=25, help="各阶段耗时显示的行数")
+    parser.add_argument("--trace-file", default="", help="记录每条消息的追踪并导出到该文件（OTLP JSON）")
+    parser.add_argument("--json", default="", help="把结果保存为JSON文件")
+    parser.add_argument("--compare", default="", help="与之前保存的JSON结果对比")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留临时工作目录")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.json) if args.json else ""
+    if args.recorded:
+        args.recorded = os.path.abspath(args.recorded)
+    if args.trace_file:
+        args.trace_file = os.path.abspath(args.trace_file)
+
+    workdir = Path(tempfile.mkdtemp(prefix="xybot-bench-"))
+    cwd = os.getcwd()
+    try:
+        prepare_workdir(workdir)
+        os.chdir(workdir)
+        if str(REPO_ROOT) not in sys.path:
+            sys.path.insert(0, str(REPO_ROOT))
+        result = asyncio.run(run_benchmark(args))
+    finally:
+        os.chdir(cwd)
+        if args.keep_workdir:
+            print(f"工作目录: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(result, args.top)
+    if baseline is not None:
+        print_comparison(result, baseline)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+回放用的消息流量
+生成与 /Sync 返回的 AddMsgs 格式一致的合成消息，或读取录制的消息
+"""
+
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# 合成流量中各类消息的默认比例
+DEFAULT_MIX = {
+    "text": 0.45,
+    "command": 0.2,
+    "group_at": 0.1,
+    "image": 0.08,
+    "quote": 0.07,
+    "pat": 0.05,
+    "system": 0.05,
+}
+
+# 会触发本地插件（不访问外部网络）的指令
+DEFAULT_COMMANDS = ["签到", "积分", "菜单", "排行榜", "状态", "五子棋", "抽奖"]
+
+CHATTER = ["哈哈哈", "早上好", "今天天气不错", "有人吗", "收到", "晚上一起打游戏吗", "这个bot好用",
+           "[捂脸]", "明天见", "刚下班"]
+
+
+def _string(value: str) -> Dict[str, str]:
+    return {"string": value}
+
+
+class TrafficGenerator:
+    """合成消息生成器，相同种子生成的消息序列相同"""
+
+    def __init__(self, bot_wxid: str, users: int = 200, rooms: int = 10, seed: int = 0,
+                 mix: Optional[Dict[str, float]] = None, commands: Optional[List[str]] = None):
+        """
+        Args:
+            bot_wxid: 机器人wxid
+            users: 发送消息的用户数
+            rooms: 群聊数，消息按约七成的比例发在群聊中
+            seed: 随机种子
+            mix: 各类消息的比例，键见 DEFAULT_MIX
+            commands: 指令消息的内容
+        """
+        self.bot_wxid = bot_wxid
+        self.users = [f"wxid_bench{i:05d}" for i in range(users)]
+        self.rooms = [f"{4000000000 + i}@chatroom" for i in range(rooms)]
+        self.commands = commands or DEFAULT_COMMANDS
+        self.random = random.Random(seed)
+
+        mix = mix or DEFAULT_MIX
+        self._kinds = list(mix.keys())
+        self._weights = list(mix.values())
+        self._msg_id = 1_000_000
+        self._new_msg_id = 5_000_000_000_000_000_000
+
+    def generate(self, count: int) -> List[Dict[str, Any]]:
+        """生成count条消息"""
+        return [self.message() for _ in range(count)]
+
+    def message(self, kind: Optional[str] = None) -> Dict[str, Any]:
+        """生成一条消息，kind为空时按比例随机选择类型"""
+        kind = kind or self.random.choices(self._kinds, self._weights)[0]
+        sender = self.random.choice(self.users)
+        room = self.random.choice(self.rooms) if kind == "group_at" or self.random.random() < 0.7 else None
+        return getattr(self, f"_{kind}")(sender, room)
+
+    def _envelope(self, msg_type: int, sender: str, room: Optional[str], content: str,
+                  msg_source: str = "<msgsource></msgsource>") -> Dict[str, Any]:
+        self._msg_id += 1
+        self._new_msg_id += 1
+        return {
+            "MsgId": self._msg_id,
+            "FromUserName": _string(room or sender),
+            "ToWxid": _string(self.bot_wxid),
+            "MsgType": msg_type,
+            "Content": _string(f"{sender}:\n{content}" if room else content),
+            "Status": 3,
+            "ImgStatus": 1,
+            "ImgBuf": {"iLen": 0},
+            "CreateTime": int(time.time()),
+            "MsgSource": msg_source,
+            "PushContent": "",
+            "NewMsgId": self._new_msg_id,
+            "MsgSeq": self._msg_id,
+        }
+
+    def _text(self, sender, room):
+        return self._envelope(1, sender, room, self.random.choice(CHATTER))
+
+    def _command(self, sender, room):
+        return self._envelope(1, sender, room, self.random.choice(self.commands))
+
+    def _group_at(self, sender, room):
+        source = f"<msgsource><atuserlist>{self.bot_wxid}</atuserlist></msgsource>"
+        return self._envelope(1, sender, room, f"@机器人 {self.random.choice(CHATTER)}", source)
+
+    def _image(self, sender, room):
+        content = ('<?xml version="1.0"?><msg><img aeskey="0123456789abcdef0123456789abcdef" '
+                   'cdnmidimgurl="3057020100044b30490201000204bench" length="1024" md5="bench" />'
+                   '</msg>')
+        return self._envelope(3, sender, room, content)
+
+    def _quote(self, sender, room):
+        quoted = self.random.choice(self.users)
+        content = (f'<msg><appmsg appid="" sdkver="0"><title>{self.random.choice(CHATTER)}</title>'
+                   f'<type>57</type><refermsg><type>1</type><svrid>{self._new_msg_id - 1}</svrid>'
+                   f'<fromusr>{room or self.bot_wxid}</fromusr><chatusr>{quoted}</chatusr>'
+                   f'<displayname>昵称_{quoted[-4:]}</displayname><msgsource>&lt;msgsource/&gt;</msgsource>'
+                   f'<content>{self.random.choice(CHATTER)}</content><createtime>{int(time.time())}</createtime>'
+                   f'</refermsg></appmsg><fromusername>{sender}</fromusername></msg>')
+        return self._envelope(49, sender, room, content)
+
+    def _pat(self, sender, room):
+        content = (f'<sysmsg type="pat"><pat><fromusername>{sender}</fromusername>'
+                   f'<chatusername>{room or sender}</chatusername><pattedusername>{self.bot_wxid}</pattedusername>'
+                   f'<patsuffix></patsuffix></pat></sysmsg>')
+        return self._envelope(10002, room or sender, room, content)
+
+    def _system(self, sender, room):
+        content = ('<sysmsg type="sysmsgtemplate"><sysmsgtemplate><content_template type="tmpl_type_profile">'
+                   '<plain><![CDATA[]]></plain><template><![CDATA["$names$"加入了群聊]]></template>'
+                   '</content_template></sysmsgtemplate></sysmsg>')
+        return self._envelope(10002, room or sender, room, content)
+
+
+def load_recorded(path: str) -> List[Dict[str, Any]]:
+    """
+    读取录制的消息
+
+    文件为JSON Lines格式，每行是一条 AddMsgs 中的消息，或者是一次 /Sync 返回的
+    Data（包含 AddMsgs 列表）
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        消息列表
+    """
+    messages = []
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict) and "AddMsgs" in record:
+                messages.extend(record["AddMsgs"] or [])
+            else:
+                messages.append(record)
+    return messages
+
+
+def replay_cycle(messages: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    循环回放录制的消息，每轮为消息分配新的MsgId，避免重复主键
+
+    Args:
+        messages: 录制的消息列表
+
+    Yields:
+        消息的副本
+    """
+    offset = 0
+    while True:
+        for message in messages:
+            copied = json.loads(json.dumps(message))
+            copied["MsgId"] = int(copied.get("MsgId", 0)) + offset
+            if "NewMsgId" in copied:
+                copied["NewMsgId"] = int(copied["NewMsgId"]) + offset
+            yield copied
+        offset += 10_000_000
@@ -0,0 +1,97 @@
+"""
+战争雷霆玩家卡片绘制基准测试
+
+用随机生成的玩家数据，对比修改前每张卡片都重新生成渐变背景、圆角矩形和加载字体的方式
+与 plugins.Warthunder.card（静态图层只生成一次）绘制一张卡片的耗时；
+再比较同时绘制多张卡片时，线程池（修改前使用的默认线程池）与进程池的总耗时。
+
+用法:
+    python -m benchmarks.warthunder_card
+    python -m benchmarks.warthunder_card --cards 16 --workers 4 --font /usr/share/fonts/xxx.ttf
+"""
+
+import argparse
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from plugins.Warthunder import card
+from plugins.Warthunder.card import AIR_TITLES, COUNTRY_TRANSLATION, GROUND_TITLES, NAVAL_TITLES, TITLES
+
+
+def make_player(rng: random.Random) -> dict:
+    def stats(titles: dict) -> dict:
+        return {key: rng.randint(0, 100000) for key in titles}
+
+    modes = {}
+    for mode in ("arcade", "realistic", "simulation"):
+        modes[mode] = stats(TITLES)
+        modes[mode]["aviation"] = stats(AIR_TITLES)
+        modes[mode]["ground"] = stats(GROUND_TITLES)
+        modes[mode]["fleet"] = stats(NAVAL_TITLES)
+    return {
+        "nickname": f"player{rng.randint(0, 9999)}",
+        "clan_name": "XYB",
+        "player_level": rng.randint(1, 100),
+        "register_date": "2020-01-01",
+        "avatar": "",
+        "vehicles_and_rewards": {c: {"owned_vehicles": rng.randint(0, 300)} for c in COUNTRY_TRANSLATION},
+        "statistics": modes,
+    }
+
+
+def legacy_render(data: dict, font_path: str) -> bytes:
+    """修改前的方式：每次都重新生成静态图层"""
+    card._layers = card.CardLayers(font_path)
+    return card.render_card(data)
+
+
+def cached_render(data: dict) -> bytes:
+    return card.render_card(data)
+
+
+def timed(func, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="战争雷霆玩家卡片绘制基准测试")
+    parser.add_argument("--font", default=card.FONT_PATH, help="字体文件")
+    parser.add_argument("--repeat", type=int, default=5, help="单张卡片测试的次数")
+    parser.add_argument("--cards", type=int, default=8, help="并发测试的卡片数")
+    parser.add_argument("--workers", type=int, default=4, help="线程池/进程池的大小")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    players = [make_player(rng) for _ in range(args.cards)]
+
+    card.init_worker(args.font)
+    legacy = timed(lambda: legacy_render(players[0], args.font), args.repeat)
+    card.init_worker(args.font)
+    cached = timed(lambda: cached_render(players[0]), args.repeat)
+    print(f"单张卡片: 修改前 {legacy * 1000:.1f} ms  静态图层缓存 {cached * 1000:.1f} ms  加速 {legacy / cached:.1f}x")
+
+    print(f"\n同时绘制 {args.cards} 张卡片（{args.workers} 个工作线程/进程）")
+    with ThreadPoolExecutor(args.workers) as pool:
+        start = time.perf_counter()
+        list(pool.map(cached_render, players))
+        threaded = time.perf_counter() - start
+
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=card.init_worker, initargs=(args.font,)) as pool:
+        # 先启动所有进程，不计入进程启动和静态图层生成的时间
+        list(pool.map(time.sleep, [0.5] * args.workers))
+        start = time.perf_counter()
+        list(pool.map(card.render_card, players))
+        processes = time.perf_counter() - start
+
+    print(f"线程池 {threaded:.2f} s  进程池 {processes:.2f} s  加速 {threaded / processes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,4 @@
 import asyncio
-import json
-import os
-import time
 import tomllib
 from pathlib import Path
 
@@ -11,9 +8,14 @@ import WechatAPI
 from database.XYBotDB import XYBotDB
 from database.keyvalDB import KeyvalDB
 from database.messsagDB import MessageDB
+from utils.account_manager import AccountManager
 from utils.decorators import scheduler
+from utils.http_client import http_client
+from utils.loop_monitor import loop_monitor
+from utils.message_stream import RedisRateLimiter, StreamConfig, StreamPublisher, StreamWorker, create_redis
 from utils.plugin_manager import plugin_manager
-from utils.xybot import XYBot
+from utils.profiler import profiler
+from utils.tracing import tracer
 
 
 async def bot_core():
@@ -27,9 +29,22 @@ async def bot_core():
 
     logger.success("读取主设置成功")
 
-    # 启动WechatAPI服务
-    server = WechatAPI.WechatAPIServer()
+    # 消息链路追踪
+    tracer.configure(main_config.get("Tracing", {}))
+
+    # 插件共用的HTTP客户端
+    http_client.configure(main_config.get("HttpClient", {}))
+
     api_config = main_config.get("WechatAPIServer", {})
+
+    # 分布式模式：工作进程不登录，只从消息流读取事件运行插件
+    cluster = StreamConfig.from_config(main_config.get("Cluster", {}))
+    if cluster.mode == "worker":
+        await worker_core(main_config, cluster)
+        return
+
+    # 启动WechatAPI服务，所有账号共用一个服务
+    server = WechatAPI.WechatAPIServer()
     redis_host = api_config.get("redis-host", "127.0.0.1")
     redis_port = api_config.get("redis-port", 6379)
     logger.debug("Redis 主机地址: {}:{}", redis_host, redis_port)
@@ -40,9 +55,11 @@ async def bot_core():
                  redis_password=api_config.get("redis-password", ""),
                  redis_db=api_config.get("redis-db", 0))
 
-    # 实例化WechatAPI客户端
-    bot = WechatAPI.WechatAPIClient("127.0.0.1", api_config.get("port", 9000))
-    bot.ignore_protect = main_config.get("XYBot", {}).get("ignore-protection", False)
+    # 实例化每个账号的WechatAPI客户端
+    accounts = AccountManager(main_config, script_dir)
+    for name in AccountManager.account_names(main_config):
+        accounts.add(name)
+    bot = accounts.primary.client
 
     # 等待WechatAPI服务启动
     time_out = 10
@@ -63,109 +80,24 @@ async def bot_core():
 
     # ==========登陆==========
 
-    # 检查并创建robot_stat.json文件
-    robot_stat_path = script_dir / "resource" / "robot_stat.json"
-    if not os.path.exists(robot_stat_path):
-        default_config = {
-            "wxid": "",
-            "device_name": "",
-            "device_id": ""
-        }
-        os.makedirs(os.path.dirname(robot_stat_path), exist_ok=True)
-        with open(robot_stat_path, "w") as f:
-            json.dump(default_config, f)
-        robot_stat = default_config
-    else:
-        with open(robot_stat_path, "r") as f:
-            robot_stat = json.load(f)
-
-    wxid = robot_stat.get("wxid", None)
-    device_name = robot_stat.get("device_name", None)
-    device_id = robot_stat.get("device_id", None)
-
-    if not await bot.is_logged_in(wxid):
-        while not await bot.is_logged_in(wxid):
-            # 需要登录
-            try:
-                if await bot.get_cached_info(wxid):
-                    # 尝试唤醒登录
-                    uuid = await bot.awaken_login(wxid)
-                    logger.success("获取到登录uuid: {}", uuid)
-                else:
-                    # 二维码登录
-                    if not device_name:
-                        device_name = bot.create_device_name()
-                    if not device_id:
-                        device_id = bot.create_device_id()
-                    uuid, url = await bot.get_qr_code(device_id=device_id, device_name=device_name, print_qr=True)
-                    logger.success("获取到登录uuid: {}", uuid)
-                    logger.success("获取到登录二维码: {}", url)
-            except:
-                # 二维码登录
-                if not device_name:
-                    device_name = bot.create_device_name()
-                if not device_id:
-                    device_id = bot.create_device_id()
-                uuid, url = await bot.get_qr_code(device_id=device_id, device_name=device_name, print_qr=True)
-                logger.success("获取到登录uuid: {}", uuid)
-                logger.success("获取到登录二维码: {}", url)
-
-            while True:
-                stat, data = await bot.check_login_uuid(uuid, device_id=device_id)
-                if stat:
-                    break
-                logger.info("等待登录中，过期倒计时：{}", data)
-                await asyncio.sleep(5)
-
-        # 保存登录信息
-        robot_stat["wxid"] = bot.wxid
-        robot_stat["device_name"] = device_name
-        robot_stat["device_id"] = device_id
-        with open("resource/robot_stat.json", "w") as f:
-            json.dump(robot_stat, f)
-
-        # 获取登录账号信息
-        bot.wxid = data.get("acctSectResp").get("userName")
-        bot.nickname = data.get("acctSectResp").get("nickName")
-        bot.alias = data.get("acctSectResp").get("alias")
-        bot.phone = data.get("acctSectResp").get("bindMobile")
-
-        logger.info("登录账号信息: wxid: {}  昵称: {}  微信号: {}  手机号: {}", bot.wxid, bot.nickname, bot.alias,
-                    bot.phone)
-
-    else:  # 已登录
-        bot.wxid = wxid
-        profile = await bot.get_profile()
-
-        bot.nickname = profile.get("NickName").get("string")
-        bot.alias = profile.get("Alias")
-        bot.phone = profile.get("BindMobile").get("string")
-
-        logger.info("登录账号信息: wxid: {}  昵称: {}  微信号: {}  手机号: {}", bot.wxid, bot.nickname, bot.alias,
-                    bot.phone)
-
-    logger.info("登录设备信息: device_name: {}  device_id: {}", device_name, device_id)
-
-    logger.success("登录成功")
+    await accounts.login_all()
+
+    logger.success("登录成功，共 {} 个账号", len(accounts.accounts))
 
     # ========== 登录完毕 开始初始化 ========== #
 
     # 开启自动心跳
-    try:
-        success = await bot.start_auto_heartbeat()
-        if success:
-            logger.success("已开启自动心跳")
-        else:
-            logger.warning("开启自动心跳失败")
-    except ValueError:
-        logger.warning("自动心跳已在运行")
-    except Exception as e:
-        if "在运行" not in e:
-            logger.warning("自动心跳已在运行")
-
-    # 初始化机器人
-    xybot = XYBot(bot)
-    xybot.update_profile(bot.wxid, bot.nickname, bot.alias, bot.phone)
+    for account in accounts.accounts:
+        await accounts.start_heartbeat(account)
+
+    if cluster.mode == "ingestor":
+        # 接收进程只预处理消息，插件事件写入消息流由工作进程处理
+        publisher = StreamPublisher(create_redis(cluster, api_config), cluster)
+        for account in accounts.accounts:
+            client = account.client
+            await publisher.publish_profile(client.wxid, client.nickname, client.alias, client.phone)
+            account.xybot.set_publisher(publisher)
+        logger.success("已启用分布式模式，消息将写入消息流 {}", cluster.prefix)
 
     # 初始化数据库
     XYBotDB()
@@ -176,50 +108,26 @@ async def bot_core():
     keyval_db = KeyvalDB()
     await keyval_db.initialize()
 
-    # 启动调度器
-    scheduler.start()
-    logger.success("定时任务已启动")
+    # 插件处理函数性能分析和看门狗
+    profiler.configure(main_config.get("Profiler", {}))
+    profiler.start_watchdog()
 
-    # 加载插件目录下的所有插件
-    loaded_plugins = await plugin_manager.load_plugins_from_directory(bot, load_disabled_plugin=False)
-    logger.success(f"已加载插件: {loaded_plugins}")
+    # 事件循环延迟监控
+    loop_monitor.configure(main_config.get("LoopMonitor", {}))
+    loop_monitor.start()
 
-    # ========== 开始接受消息 ========== #
+    if cluster.mode != "ingestor":
+        # 启动调度器
+        scheduler.start()
+        logger.success("定时任务已启动")
 
-    # 先接受堆积消息
-    logger.info("处理堆积消息中")
-    count = 0
-    while True:
-        data = await bot.sync_message()
-        data = data.get("AddMsgs")
-        if not data:
-            if count > 2:
-                break
-            else:
-                count += 1
-                continue
-
-        logger.debug("接受到 {} 条消息", len(data))
-        await asyncio.sleep(1)
-    logger.success("处理堆积消息完毕")
-
-    logger.success("开始处理消息")
-    while True:
-        now = time.time()
+        # 加载插件目录下的所有插件，插件只加载一次由所有账号共用，定时任务使用第一个账号
+        loaded_plugins = await plugin_manager.load_plugins_from_directory(bot, load_disabled_plugin=False)
+        logger.success(f"已加载插件: {loaded_plugins}")
 
-        try:
-            data = await bot.sync_message()
-        except Exception as e:
-            logger.warning("获取新消息失败 {}", e)
-            await asyncio.sleep(5)
-            continue
+    # ========== 开始接受消息 ========== #
 
-        data = data.get("AddMsgs")
-        if data:
-            for message in data:
-                asyncio.create_task(xybot.process_message(message))
-        # 使用异步睡眠替代忙等待循环
-        await asyncio.sleep(0.5)
+    await accounts.run()
 
     # 在bot_core.py中的相关部分添加
 
@@ -253,3 +161,50 @@ async def bot_core():
         self.web_server = XyBotWebServer(self, config_path=self.config_path)
         self.web_runner = await self.web_server.start()
         self.logger.info(f"Web管理界面已启动，端口: {self.web_server.port}")
+
+
+async def worker_core(main_config: dict, cluster: StreamConfig):
+    """分布式模式的工作进程：从消息流读取事件并运行插件，回复通过共享限速器发送"""
+    api_config = main_config.get("WechatAPIServer", {})
+    redis_client = create_redis(cluster, api_config)
+
+    api_host = main_config.get("Cluster", {}).get("api-host", "127.0.0.1")
+
+    worker = StreamWorker(redis_client, cluster)
+    accounts = AccountManager(main_config, Path(__file__).resolve().parent)
+    for profile in await worker.wait_profiles():
+        client = accounts.add(profile["wxid"], host=api_host).client
+        client.wxid = profile["wxid"]
+        client.nickname = profile.get("nickname", "")
+        client.alias = profile.get("alias", "")
+        client.phone = profile.get("phone", "")
+        # 所有工作进程共用同一个账号的发送间隔
+        client.send_limiter = RedisRateLimiter(redis_client, cluster.send_key(client.wxid), cluster.send_interval)
+        worker.add_bot(client)
+        logger.info("工作进程 {} 使用账号: wxid: {}  昵称: {}", cluster.worker_id, client.wxid, client.nickname)
+    bot = accounts.primary.client
+
+    # 初始化数据库
+    XYBotDB()
+
+    message_db = MessageDB()
+    await message_db.initialize()
+
+    keyval_db = KeyvalDB()
+    await keyval_db.initialize()
+
+    profiler.configure(main_config.get("Profiler", {}))
+    profiler.start_watchdog()
+
+    loop_monitor.configure(main_config.get("LoopMonitor", {}))
+    loop_monitor.start()
+
+    # 定时任务只在0号工作进程运行，避免重复执行
+    if cluster.worker_id == 0:
+        scheduler.start()
+        logger.success("定时任务已启动")
+
+    loaded_plugins = await plugin_manager.load_plugins_from_directory(bot, load_disabled_plugin=False)
+    logger.success(f"已加载插件: {loaded_plugins}")
+
+    await worker.run()
@@ -1,16 +1,36 @@
+import atexit
+import contextvars
 import datetime
+import os
+import threading
+import time
 import tomllib
+from collections import OrderedDict, defaultdict
 from concurrent.futures import ThreadPoolExecutor
-from typing import Union
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
 
 from loguru import logger
-from sqlalchemy import Column, String, Integer, DateTime, create_engine, JSON, Boolean
-from sqlalchemy import update
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Boolean
+from sqlalchemy import func, insert, or_, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from database.engine import create_db_engine
+from database.rank_index import RankIndex
+from utils.metrics import instrument_engine, metrics
 from utils.singleton import Singleton
+from utils.tracing import tracer
+
+db_call_duration = metrics.histogram("xybot_db_call_seconds", "XYBotDB操作耗时（包含排队等待）", ("op",))
+ledger_flush_size = metrics.histogram("xybot_points_ledger_flush_size", "每次批量写入的积分流水条数",
+                                      buckets=(1, 5, 10, 50, 100, 250, 500, 1000))
+ledger_duplicates = metrics.counter("xybot_points_ledger_duplicates_total", "因幂等键重复被忽略的积分变动数")
+
+# 内存中记住的已写入幂等键数量，更早的幂等键由数据库的唯一约束去重
+RECENT_LEDGER_KEYS = 10000
+CLUSTER_RANK_REBUILD_INTERVAL = 60  # 分布式模式下未设置 rank-rebuild-interval 时的重建间隔（秒）
 
 Base = declarative_base()
 
@@ -27,6 +47,18 @@ class User(Base):
     llm_thread_id = Column(JSON, nullable=False, default=lambda: {}, comment='llm_thread_id')
 
 
+class PointLedger(Base):
+    """积分流水，只追加不修改"""
+    __tablename__ = 'point_ledger'
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='id')
+    wxid = Column(String(20), nullable=False, index=True, comment='wxid')
+    delta = Column(Integer, nullable=False, comment='delta')
+    reason = Column(String(32), nullable=False, default='', comment='reason')
+    idempotency_key = Column(String(128), nullable=True, unique=True, comment='idempotency_key')
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.now, comment='created_at')
+
+
 class Chatroom(Base):
     __tablename__ = 'chatroom'
 
@@ -36,13 +68,37 @@ class Chatroom(Base):
     llm_thread_id = Column(JSON, nullable=False, default=lambda: {}, comment='llm_thread_id')
 
 
+@dataclass
+class SignInResult:
+    """签到结果"""
+    signed_in: bool  # 为False时表示今天已经签到过了
+    old_streak: int = 0
+    streak: int = 0
+    streak_broken: bool = False
+    signin_points: int = 0
+    streak_points: int = 0
+
+    @property
+    def points(self) -> int:
+        return self.signin_points + self.streak_points
+
+
 class XYBotDB(metaclass=Singleton):
     def __init__(self):
         with open("main_config.toml", "rb") as f:
             main_config = tomllib.load(f)
 
         self.database_url = main_config["XYBot"]["XYBotDB-url"]
-        self.engine = create_engine(self.database_url)
+        self.points_flush_interval = main_config["XYBot"].get("points-flush-interval", 1.0)
+        self.points_batch_size = main_config["XYBot"].get("points-batch-size", 500)
+        self.rank_rebuild_interval = main_config["XYBot"].get("rank-rebuild-interval", 0)
+        # 分布式模式下其它进程也会修改积分，不重建的话排名会和数据库越差越远
+        cluster_mode = os.environ.get("XYBOT_MODE", main_config.get("Cluster", {}).get("mode", "standalone"))
+        if cluster_mode != "standalone" and self.rank_rebuild_interval <= 0:
+            self.rank_rebuild_interval = CLUSTER_RANK_REBUILD_INTERVAL
+            logger.info(f"数据库: 分布式模式({cluster_mode})下积分排名索引每{self.rank_rebuild_interval}秒从数据库重建")
+        self.engine = create_db_engine(self.database_url, main_config.get("DatabaseEngine", {}))
+        instrument_engine(self.engine, "xybot")
         self.DBSession = sessionmaker(bind=self.engine)
 
         # 创建表
@@ -52,14 +108,34 @@ class XYBotDB(metaclass=Singleton):
         # 创建线程池执行器
         self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
 
+        # 积分排名索引，只在数据库线程中读写
+        self._rank_index = RankIndex()
+        self._rank_built = 0.0
+        self._rebuild_rank_index()
+
+        # 积分流水缓冲区，由数据库线程批量写入
+        self._ledger_lock = threading.Lock()
+        self._ledger_buffer: List[dict] = []
+        self._pending_points: Dict[str, int] = defaultdict(int)  # 还未写入数据库的积分变动（包括正在写入的）
+        self._pending_keys: Set[str] = set()
+        self._recent_keys: "OrderedDict[str, None]" = OrderedDict()
+        self._flush_timer: Optional[threading.Timer] = None
+        metrics.gauge("xybot_points_ledger_pending", "等待写入数据库的积分流水条数").set_function(
+            lambda: len(self._ledger_buffer))
+        # 退出时写入剩余的流水（此时线程池已关闭，直接在当前线程写入）
+        atexit.register(self._flush_ledger)
+
     def _execute_in_queue(self, method, *args, **kwargs):
         """在队列中执行数据库操作"""
-        future = self.executor.submit(method, *args, **kwargs)
-        try:
-            return future.result(timeout=20)  # 20秒超时
-        except Exception as e:
-            logger.error(f"数据库操作失败: {method.__name__} - {str(e)}")
-            raise
+        with db_call_duration.labels(method.__name__).time(), \
+                tracer.span(f"XYBotDB.{method.__name__.lstrip('_')}", "client", **{"db.system": "sqlite"}):
+            # 复制上下文，使线程中执行的SQL语句也记录在当前追踪中
+            future = self.executor.submit(contextvars.copy_context().run, method, *args, **kwargs)
+            try:
+                return future.result(timeout=20)  # 20秒超时
+            except Exception as e:
+                logger.error(f"数据库操作失败: {method.__name__} - {str(e)}")
+                raise
 
     # USER
 
@@ -83,6 +159,7 @@ class XYBotDB(metaclass=Singleton):
                 session.add(user)
             logger.info(f"数据库: 用户{wxid}积分增加{num}")
             session.commit()
+            self._rank_index.add(wxid, num)
             return True
         except SQLAlchemyError as e:
             session.rollback()
@@ -97,6 +174,7 @@ class XYBotDB(metaclass=Singleton):
 
     def _set_points(self, wxid: str, num: int) -> bool:
         """Thread-safe point setting"""
+        self._flush_ledger()  # 先写入缓冲的积分变动，避免之后覆盖设置的积分
         session = self.DBSession()
         try:
             result = session.execute(
@@ -109,6 +187,7 @@ class XYBotDB(metaclass=Singleton):
                 session.add(user)
             logger.info(f"数据库: 用户{wxid}积分设置为{num}")
             session.commit()
+            self._rank_index.set(wxid, num)
             return True
         except SQLAlchemyError as e:
             session.rollback()
@@ -126,7 +205,8 @@ class XYBotDB(metaclass=Singleton):
         session = self.DBSession()
         try:
             user = session.query(User).filter_by(wxid=wxid).first()
-            return user.points if user else 0
+            # 加上还未写入数据库的积分变动
+            return (user.points if user else 0) + self._pending_delta(wxid)
         finally:
             session.close()
 
@@ -174,6 +254,70 @@ class XYBotDB(metaclass=Singleton):
         finally:
             session.close()
 
+    def sign_in(self, wxid: str, now: datetime.datetime,
+                reward_fn: Callable[[int], Tuple[int, int]]) -> SignInResult:
+        """
+        签到：在同一个事务中检查今天是否已签到、更新连续签到天数并增加积分
+
+        Args:
+            wxid: 用户wxid
+            now: 签到日期（当地时区的0点）
+            reward_fn: 根据连续签到天数计算奖励的函数，返回 (签到积分, 连续签到奖励积分)，在数据库线程中调用
+
+        Returns:
+            SignInResult: 签到结果，失败时抛出异常
+        """
+        return self._execute_in_queue(self._sign_in, wxid, now, reward_fn)
+
+    def _sign_in(self, wxid: str, now: datetime.datetime,
+                 reward_fn: Callable[[int], Tuple[int, int]]) -> SignInResult:
+        session = self.DBSession()
+        try:
+            user = session.query(User).filter_by(wxid=wxid).with_for_update().first()
+            if not user:
+                user = User(wxid=wxid, points=0, signin_stat=datetime.datetime.fromtimestamp(0), signin_streak=0)
+                session.add(user)
+
+            # 数据库中保存的是不带时区的当地日期，按日期比较
+            days = (now.date() - user.signin_stat.date()).days
+            if days < 1:
+                session.rollback()
+                return SignInResult(signed_in=False, old_streak=user.signin_streak, streak=user.signin_streak)
+
+            old_streak = user.signin_streak or 0
+            # 超过1天没签到则断开连续签到
+            streak_broken = days > 1
+            streak = 1 if streak_broken else old_streak + 1
+            signin_points, streak_points = reward_fn(streak)
+
+            user.signin_stat = now.replace(tzinfo=None)
+            user.signin_streak = streak
+            user.points = points = (user.points or 0) + signin_points + streak_points
+            session.add(PointLedger(wxid=wxid, delta=signin_points + streak_points, reason="signin",
+                                    idempotency_key=self._signin_ledger_key(session, wxid, now.date())))
+            session.commit()
+            self._rank_index.set(wxid, points)
+            logger.info(f"数据库: 用户{wxid}签到，连续签到{streak}天，积分增加{signin_points + streak_points}")
+            return SignInResult(True, old_streak, streak, streak_broken, signin_points, streak_points)
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"数据库: 用户{wxid}签到失败, 错误: {e}")
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def _signin_ledger_key(session, wxid: str, date: datetime.date) -> str:
+        """
+        签到流水的幂等键。管理员重置签到状态后同一天可以再次签到，
+        第n次（从0开始）签到的键加上":n"后缀，不会和当天之前的签到流水冲突
+        """
+        key = f"signin:{wxid}:{date.isoformat()}"
+        awarded = session.query(func.count(PointLedger.id)).filter(
+            or_(PointLedger.idempotency_key == key,
+                PointLedger.idempotency_key.startswith(f"{key}:", autoescape=True))).scalar()
+        return f"{key}:{awarded}" if awarded else key
+
     def reset_all_signin_stat(self) -> bool:
         """Reset all users' signin status"""
         session = self.DBSession()
@@ -190,10 +334,40 @@ class XYBotDB(metaclass=Singleton):
 
     def get_leaderboard(self, count: int) -> list:
         """Get points leaderboard"""
+        return self._execute_in_queue(self._get_leaderboard, count)
+
+    def _get_leaderboard(self, count: int) -> list:
+        self._prepare_rank_index()
+        return self._rank_index.top(count)
+
+    def get_rank(self, wxid: str) -> Tuple[Optional[int], int]:
+        """用户的积分名次（从1开始）和总人数，用户没有记录时名次为None"""
+        return self._execute_in_queue(self._get_rank, wxid)
+
+    def _get_rank(self, wxid: str) -> Tuple[Optional[int], int]:
+        self._prepare_rank_index()
+        return self._rank_index.rank(wxid), len(self._rank_index)
+
+    def get_members_leaderboard(self, wxids: list, count: int) -> list:
+        """指定用户（例如群成员）中的积分排行，不包括积分为0的用户"""
+        return self._execute_in_queue(self._get_members_leaderboard, wxids, count)
+
+    def _get_members_leaderboard(self, wxids: list, count: int) -> list:
+        self._prepare_rank_index()
+        return self._rank_index.top_within(wxids, count)
+
+    def _prepare_rank_index(self):
+        """写入缓冲的积分变动；其它进程也会修改积分时（分布式模式）定期从数据库重建索引"""
+        self._flush_ledger()
+        if 0 < self.rank_rebuild_interval < time.monotonic() - self._rank_built:
+            self._rebuild_rank_index()
+
+    def _rebuild_rank_index(self):
         session = self.DBSession()
         try:
-            users = session.query(User).order_by(User.points.desc()).limit(count).all()
-            return [(user.wxid, user.points) for user in users]
+            self._rank_index.load(session.query(User.wxid, User.points))
+            self._rank_built = time.monotonic()
+            logger.debug(f"数据库: 积分排名索引已重建，共{len(self._rank_index)}个用户")
         finally:
             session.close()
 
@@ -240,6 +414,7 @@ class XYBotDB(metaclass=Singleton):
 
     def _safe_trade_points(self, trader_wxid: str, target_wxid: str, num: int) -> bool:
         """Thread-safe points trading between users"""
+        self._flush_ledger()  # 先写入缓冲的积分变动，按真实余额判断
         session = self.DBSession()
         try:
             # Start transaction with row-level locking
@@ -259,7 +434,10 @@ class XYBotDB(metaclass=Singleton):
             if trader.points >= num:
                 trader.points -= num
                 target.points += num
+                trader_points, target_points = trader.points, target.points
                 session.commit()
+                self._rank_index.set(trader_wxid, trader_points)
+                self._rank_index.set(target_wxid, target_points)
                 logger.info(f"数据库: 用户{trader_wxid}给用户{target_wxid}转账{num}积分")
                 return True
             logger.info(f"数据库: 转账失败, 用户{trader_wxid}积分不足")
@@ -393,6 +571,135 @@ class XYBotDB(metaclass=Singleton):
         finally:
             session.close()
 
+    # POINT LEDGER
+
+    def record_points(self, wxid: str, delta: int, reason: str = "", key: Optional[str] = None) -> bool:
+        """
+        记录一笔积分变动，不等待写入数据库。
+
+        变动先进入缓冲区，每隔 points-flush-interval 秒或攒够 points-batch-size 条时在一个事务中写入积分流水并更新积分。
+        get_points 返回的积分已经包含还未写入的变动
+
+        Args:
+            wxid: 用户wxid
+            delta: 积分变动，扣除积分时为负数
+            reason: 变动原因，例如 "luckydraw.cost"
+            key: 幂等键，同一个插件操作（例如同一条消息、同一个红包）使用相同的键，重复的变动会被忽略
+
+        Returns:
+            bool: 变动是否被记录，幂等键重复时为False
+        """
+        with self._ledger_lock:
+            if key is not None and (key in self._pending_keys or key in self._recent_keys):
+                ledger_duplicates.inc()
+                logger.warning(f"数据库: 积分变动 {key} 重复，已忽略")
+                return False
+            self._ledger_buffer.append({
+                "wxid": wxid,
+                "delta": delta,
+                "reason": reason,
+                "idempotency_key": key,
+                "created_at": datetime.datetime.now(),
+            })
+            self._pending_points[wxid] += delta
+            if key is not None:
+                self._pending_keys.add(key)
+
+            if len(self._ledger_buffer) >= self.points_batch_size:
+                self._cancel_flush_timer()
+                self.executor.submit(self._flush_ledger)
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.points_flush_interval, self._schedule_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        return True
+
+    def flush_points(self) -> int:
+        """立即写入缓冲区中的积分变动，返回写入的条数"""
+        return self._execute_in_queue(self._flush_ledger)
+
+    def _cancel_flush_timer(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def _schedule_flush(self):
+        try:
+            self.executor.submit(self._flush_ledger)
+        except RuntimeError:  # 线程池已关闭
+            pass
+
+    def _pending_delta(self, wxid: str) -> int:
+        with self._ledger_lock:
+            return self._pending_points.get(wxid, 0)
+
+    def _flush_ledger(self) -> int:
+        """在一个事务中写入缓冲区的积分流水，并按用户合并更新积分"""
+        with self._ledger_lock:
+            self._cancel_flush_timer()
+            entries, self._ledger_buffer = self._ledger_buffer, []
+        if not entries:
+            return 0
+
+        session = self.DBSession()
+        try:
+            # 重启前已经写入的幂等键
+            keys = [entry["idempotency_key"] for entry in entries if entry["idempotency_key"] is not None]
+            existing = set()
+            for i in range(0, len(keys), 500):
+                existing.update(key for (key,) in session.query(PointLedger.idempotency_key)
+                                .filter(PointLedger.idempotency_key.in_(keys[i:i + 500])))
+            applied = [entry for entry in entries if entry["idempotency_key"] not in existing]
+
+            totals: Dict[str, int] = defaultdict(int)
+            for entry in applied:
+                totals[entry["wxid"]] += entry["delta"]
+
+            if applied:
+                session.execute(insert(PointLedger), applied)
+            for wxid, delta in totals.items():
+                result = session.execute(
+                    update(User)
+                    .where(User.wxid == wxid)
+                    .values(points=User.points + delta)
+                )
+                if result.rowcount == 0:
+                    session.add(User(wxid=wxid, points=delta))
+            session.commit()
+            for wxid, delta in totals.items():
+                self._rank_index.add(wxid, delta)
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"数据库: 写入{len(entries)}条积分流水失败，稍后重试, 错误: {e}")
+            with self._ledger_lock:
+                self._ledger_buffer[:0] = entries
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.points_flush_interval, self._schedule_flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+            return 0
+        finally:
+            session.close()
+
+        with self._ledger_lock:
+            for entry in entries:
+                wxid = entry["wxid"]
+                self._pending_points[wxid] -= entry["delta"]
+                if not self._pending_points[wxid]:
+                    del self._pending_points[wxid]
+                key = entry["idempotency_key"]
+                if key is not None:
+                    self._pending_keys.discard(key)
+                    self._recent_keys[key] = None
+            while len(self._recent_keys) > RECENT_LEDGER_KEYS:
+                self._recent_keys.popitem(last=False)
+
+        if len(applied) != len(entries):
+            ledger_duplicates.inc(len(entries) - len(applied))
+        ledger_flush_size.observe(len(entries))
+        logger.debug(f"数据库: 写入{len(applied)}条积分流水，涉及{len(totals)}个用户")
+        return len(applied)
+
     # CHATROOM
 
     def get_chatroom_list(self) -> list:
@@ -0,0 +1,127 @@
+"""
+数据库引擎工厂
+XYBotDB、MessageDB、KeyvalDB共用，按数据库类型应用main_config.toml中[DatabaseEngine]的设置：
+SQLite连接时设置WAL日志、同步级别、mmap、忙等待超时等PRAGMA，PostgreSQL/MySQL设置连接池大小，
+并开启SQL编译缓存和驱动的预编译语句缓存
+"""
+
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+DEFAULT_CONFIG = {
+    # SQLite
+    "journal-mode": "WAL",  # WAL模式下读写互不阻塞，异步的消息库和键值库并发写入时不容易出现database is locked
+    "synchronous": "NORMAL",  # WAL模式下NORMAL不会损坏数据库，只在断电时可能丢失最近的事务
+    "busy-timeout": 5000,  # 毫秒，数据库被锁时等待的时间
+    "cache-size-mb": 16,
+    "mmap-size-mb": 64,
+    "temp-store": "MEMORY",
+    # PostgreSQL/MySQL
+    "pool-size": 5,
+    "max-overflow": 10,
+    "pool-timeout": 30,
+    "pool-recycle": 1800,
+    "pool-pre-ping": True,
+    # SQLAlchemy编译缓存和驱动的预编译语句缓存数量
+    "statement-cache-size": 500,
+}
+
+
+def _options(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    options = dict(DEFAULT_CONFIG)
+    options.update(config or {})
+    return options
+
+
+def _is_memory(url) -> bool:
+    return not url.database or url.database == ":memory:" or "mode=memory" in str(url)
+
+
+def sqlite_pragmas(config: Optional[Dict[str, Any]] = None, memory: bool = False) -> Dict[str, Any]:
+    """连接SQLite时执行的PRAGMA，值为None的项不设置"""
+    options = _options(config)
+    pragmas = {
+        "busy_timeout": options["busy-timeout"],
+        "cache_size": -int(options["cache-size-mb"] * 1024) if options["cache-size-mb"] else None,
+        "temp_store": options["temp-store"],
+    }
+    if not memory:
+        # 内存数据库不支持WAL和mmap
+        pragmas["journal_mode"] = options["journal-mode"]
+        pragmas["synchronous"] = options["synchronous"]
+        pragmas["mmap_size"] = int(options["mmap-size-mb"] * 1024 * 1024) if options["mmap-size-mb"] else None
+    return {name: value for name, value in pragmas.items() if value is not None and value != ""}
+
+
+def _engine_kwargs(url, options: Dict[str, Any]) -> Dict[str, Any]:
+    backend = url.get_backend_name()
+    driver = url.get_driver_name()
+    cache_size = options["statement-cache-size"]
+    kwargs: Dict[str, Any] = {"query_cache_size": cache_size}
+    connect_args: Dict[str, Any] = {}
+
+    if backend == "sqlite":
+        # sqlite3 自己的预编译语句缓存（aiosqlite会把参数传给sqlite3.connect）
+        connect_args["cached_statements"] = cache_size
+    else:
+        kwargs.update(
+            pool_size=options["pool-size"],
+            max_overflow=options["max-overflow"],
+            pool_timeout=options["pool-timeout"],
+            pool_recycle=options["pool-recycle"],
+            pool_pre_ping=options["pool-pre-ping"],
+        )
+        if driver == "asyncpg":
+            connect_args["prepared_statement_cache_size"] = cache_size
+
+    if connect_args:
+        kwargs["connect_args"] = connect_args
+    return kwargs
+
+
+def _apply_pragmas(engine: Engine, pragmas: Dict[str, Any]):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def create_db_engine(url: str, config: Optional[Dict[str, Any]] = None, **kwargs) -> Engine:
+    """
+    创建同步引擎
+
+    Args:
+        url: 数据库地址
+        config: main_config.toml中的[DatabaseEngine]配置，缺少的项使用默认值
+        **kwargs: 传给create_engine的其它参数，会覆盖按配置生成的参数
+    """
+    parsed = make_url(url)
+    options = _options(config)
+    engine = create_engine(url, **{**_engine_kwargs(parsed, options), **kwargs})
+    if parsed.get_backend_name() == "sqlite":
+        _apply_pragmas(engine, sqlite_pragmas(options, _is_memory(parsed)))
+    return engine
+
+
+def create_async_db_engine(url: str, config: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncEngine:
+    """
+    创建异步引擎
+
+    Args:
+        url: 数据库地址
+        config: main_config.toml中的[DatabaseEngine]配置，缺少的项使用默认值
+        **kwargs: 传给create_async_engine的其它参数，会覆盖按配置生成的参数
+    """
+    parsed = make_url(url)
+    options = _options(config)
+    engine = create_async_engine(url, **{**_engine_kwargs(parsed, options), **kwargs})
+    if parsed.get_backend_name() == "sqlite":
+        _apply_pragmas(engine.sync_engine, sqlite_pragmas(options, _is_memory(parsed)))
+    return engine
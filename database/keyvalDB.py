@@ -6,9 +6,11 @@ from typing import Optional, Union, List
 
 from pydantic import validate_arguments
 from sqlalchemy import Column, String, Text, DateTime, delete, select
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_scoped_session
+from sqlalchemy.ext.asyncio import AsyncSession, async_scoped_session
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from database.engine import create_async_db_engine
+from utils.metrics import instrument_engine
 from utils.singleton import Singleton
 
 DeclarativeBase = declarative_base()
@@ -32,11 +34,8 @@ class KeyvalDB(metaclass=Singleton):
 
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.engine = create_async_engine(
-                db_url,
-                echo=False,
-                future=True
-            )
+            cls._instance.engine = create_async_db_engine(db_url, main_config.get("DatabaseEngine", {}), echo=False)
+            instrument_engine(cls._instance.engine, "keyval")
             cls._async_session_factory = async_scoped_session(
                 sessionmaker(
                     cls._instance.engine,
@@ -7,10 +7,13 @@ from typing import Optional, List
 from pydantic import validate_arguments
 from sqlalchemy import Column, String, Integer, DateTime, Text, Boolean, delete
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_scoped_session
+from sqlalchemy.ext.asyncio import AsyncSession, async_scoped_session
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from database.engine import create_async_db_engine
+from utils.metrics import instrument_engine
 from utils.singleton import Singleton
+from utils.tracing import tracer
 
 # 使用新的声明式基类
 DeclarativeBase = declarative_base()
@@ -39,11 +42,8 @@ class MessageDB(metaclass=Singleton):
 
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.engine = create_async_engine(
-                db_url,
-                echo=False,
-                future=True
-            )
+            cls._instance.engine = create_async_db_engine(db_url, main_config.get("DatabaseEngine", {}), echo=False)
+            instrument_engine(cls._instance.engine, "message")
             cls._async_session_factory = async_scoped_session(
                 sessionmaker(
                     cls._instance.engine,
@@ -60,6 +60,7 @@ class MessageDB(metaclass=Singleton):
             await conn.run_sync(DeclarativeBase.metadata.create_all)
 
     @validate_arguments(config=dict(arbitrary_types_allowed=True))
+    @tracer.traced("MessageDB.save_message", "client")
     async def save_message(self,
                            msg_id: int,
                            sender_wxid: str,
@@ -0,0 +1,183 @@
+"""
+积分排名索引
+用可索引跳表（每层记录跨过的节点数）按积分从高到低保存所有用户，积分变动时增量更新，
+查询前k名、某个用户的名次都是 O(log n)，不需要每次排行榜都 ORDER BY 整张用户表
+"""
+
+import heapq
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAX_LEVEL = 32
+P = 0.25
+
+
+class _Node:
+    __slots__ = ("key", "next", "span")
+
+    def __init__(self, key: Optional[Tuple[int, str]], level: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * level
+        self.span = [0] * level  # 到 next[i] 跨过的节点数
+
+
+class RankIndex:
+    """按积分从高到低排序的用户索引，积分相同时按wxid排序。不是线程安全的，由调用方保证串行访问"""
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+        self._scores: Dict[str, int] = {}
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, wxid: str) -> bool:
+        return wxid in self._scores
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < MAX_LEVEL and random.random() < P:
+            level += 1
+        return level
+
+    def _insert(self, key: Tuple[int, str]):
+        update = [self._head] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = rank[i + 1] if i < self._level - 1 else 0
+            while x.next[i] is not None and x.next[i].key < key:
+                rank[i] += x.span[i]
+                x = x.next[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = self._length
+            self._level = level
+
+        node = _Node(key, level)
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._length += 1
+
+    def _delete(self, key: Tuple[int, str]):
+        update = [self._head] * MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key < key:
+                x = x.next[i]
+            update[i] = x
+
+        x = x.next[0]
+        if x is None or x.key != key:
+            return
+        for i in range(self._level):
+            if update[i].next[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].next[i] = x.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+
+    def score(self, wxid: str) -> int:
+        """用户积分，不在索引中时为0"""
+        return self._scores.get(wxid, 0)
+
+    def set(self, wxid: str, points: int):
+        """设置用户积分"""
+        old = self._scores.get(wxid)
+        if old == points:
+            return
+        if old is not None:
+            self._delete((-old, wxid))
+        self._scores[wxid] = points
+        self._insert((-points, wxid))
+
+    def add(self, wxid: str, delta: int):
+        """增加用户积分"""
+        self.set(wxid, self.score(wxid) + delta)
+
+    def remove(self, wxid: str):
+        old = self._scores.pop(wxid, None)
+        if old is not None:
+            self._delete((-old, wxid))
+
+    def load(self, items: Iterable[Tuple[str, int]]):
+        """清空索引并载入 (wxid, 积分)"""
+        self.clear()
+        for wxid, points in items:
+            self.set(wxid, points)
+
+    def clear(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+        self._scores.clear()
+
+    def rank(self, wxid: str) -> Optional[int]:
+        """用户的名次（从1开始），不在索引中时返回None"""
+        points = self._scores.get(wxid)
+        if points is None:
+            return None
+        key = (-points, wxid)
+        rank = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key <= key:
+                rank += x.span[i]
+                x = x.next[i]
+            if x.key == key:
+                return rank
+        return None
+
+    def _node_at(self, rank: int) -> Optional[_Node]:
+        """第rank名（从1开始）的节点"""
+        traversed = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and traversed + x.span[i] <= rank:
+                traversed += x.span[i]
+                x = x.next[i]
+            if traversed == rank:
+                return x
+        return None
+
+    def top(self, count: int, offset: int = 0) -> List[Tuple[str, int]]:
+        """
+        从第offset+1名开始的count个用户
+
+        Returns:
+            [(wxid, 积分), ...]
+        """
+        if count <= 0 or offset >= self._length:
+            return []
+        node = self._node_at(offset + 1)
+        result = []
+        while node is not None and len(result) < count:
+            result.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return result
+
+    def top_within(self, wxids: Iterable[str], count: int) -> List[Tuple[str, int]]:
+        """
+        指定用户（例如群成员）中积分最高的count个，积分为0或不在索引中的用户不参与排名
+
+        Returns:
+            [(wxid, 积分), ...]
+        """
+        members = ((-self._scores[wxid], wxid) for wxid in set(wxids) if self._scores.get(wxid))
+        return [(wxid, -points) for points, wxid in heapq.nsmallest(count, members)]
@@ -60,7 +60,8 @@ class AdminPoint(PluginBase):
                 return
 
             change_point = int(command[1])
-            self.db.add_points(change_wxid, change_point)
+            self.db.record_points(change_wxid, change_point, "admin.add",
+                                  f"admin:{message.get('NewMsgId', message['MsgId'])}")
 
             nickname = await bot.get_nickname(change_wxid)
             new_point = self.db.get_points(change_wxid)
@@ -83,7 +84,8 @@ class AdminPoint(PluginBase):
                 return
 
             change_point = int(command[1])
-            self.db.add_points(change_wxid, -change_point)
+            self.db.record_points(change_wxid, -change_point, "admin.deduct",
+                                  f"admin:{message.get('NewMsgId', message['MsgId'])}")
 
             nickname = await bot.get_nickname(change_wxid)
             new_point = self.db.get_points(change_wxid)
@@ -1,3 +1,4 @@
+import asyncio
 import tomllib
 
 from WechatAPI import WechatAPIClient
@@ -87,7 +88,8 @@ class AdminWhitelist(PluginBase):
 
         elif command[0] == "白名单列表":
             whitelist = self.db.get_whitelist_list()
-            whitelist = "\n".join([f"{wxid} {await bot.get_nickname(wxid)}" for wxid in whitelist])
+            nicknames = await asyncio.gather(*(bot.get_nickname(wxid) for wxid in whitelist))
+            whitelist = "\n".join([f"{wxid} {nickname}" for wxid, nickname in zip(whitelist, nicknames)])
             await bot.send_text_message(message["FromWxid"], f"-----XYBot-----\n白名单列表：\n{whitelist}")
 
         else:
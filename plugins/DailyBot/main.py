@@ -1,7 +1,5 @@
 import tomllib
-import requests
 import os
-import aiohttp
 import re
 from typing import Optional, Union
 from urllib.parse import urlparse
@@ -14,6 +12,7 @@ import json
 from loguru import logger
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
+from utils.http_client import any_of, has_content_type, json_field
 from utils.plugin_base import PluginBase
 
 BASE_URL_VVHAN = "https://api.vvhan.com/api/"
@@ -251,42 +250,42 @@ class DailyBot(PluginBase):
             
             # 根据配置决定是否使用JSON格式
             params = {"type": "json"} if self.morning_news_text_enabled else {}
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    if 'image' in content_type:
-                        # 直接返回图片URL
-                        logger.info("[早报] 获取到图片URL: {}", response.url)
-                        return str(response.url)
-                    
-                    # 尝试解析JSON
-                    try:
-                        morning_news_info = await response.json()
-                        if isinstance(morning_news_info, dict) and morning_news_info.get('code') == '200':
-                            if self.morning_news_text_enabled:
-                                # 文本格式
-                                news_list = [news for news in morning_news_info["news"]]
-                                formatted_news = (
-                                    f"☕早安，打工人！\n"
-                                    f"{morning_news_info['date']} 今日早报\n\n"
-                                    f"{chr(10).join(news_list)}\n\n"
-                                    f"{morning_news_info['weiyu']}"
-                                )
-                                logger.info("[早报] 成功获取文本格式早报")
-                                return formatted_news
-                            else:
-                                # 图片格式
-                                img_url = morning_news_info['image']
-                                logger.info("[早报] 成功获取图片URL: {}", img_url)
-                                return img_url
-                    except:
-                        logger.error("[早报] JSON解析失败")
-                        
-                    error_msg = '早报信息获取失败，请稍后再试'
-                    logger.error("[早报] API请求失败")
-                    return error_msg
+            response = await self.http.get(url, params=params, cache_ttl=600,
+                                           cache_if=any_of(has_content_type("image/"), json_field("code", "200")))
+            content_type = response.headers.get('Content-Type', '')
+            
+            if 'image' in content_type:
+                # 直接返回图片URL
+                logger.info("[早报] 获取到图片URL: {}", response.url)
+                return str(response.url)
             
+            # 尝试解析JSON
+            try:
+                morning_news_info = await response.json()
+                if isinstance(morning_news_info, dict) and morning_news_info.get('code') == '200':
+                    if self.morning_news_text_enabled:
+                        # 文本格式
+                        news_list = [news for news in morning_news_info["news"]]
+                        formatted_news = (
+                            f"☕早安，打工人！\n"
+                            f"{morning_news_info['date']} 今日早报\n\n"
+                            f"{chr(10).join(news_list)}\n\n"
+                            f"{morning_news_info['weiyu']}"
+                        )
+                        logger.info("[早报] 成功获取文本格式早报")
+                        return formatted_news
+                    else:
+                        # 图片格式
+                        img_url = morning_news_info['image']
+                        logger.info("[早报] 成功获取图片URL: {}", img_url)
+                        return img_url
+            except:
+                logger.error("[早报] JSON解析失败")
+                
+            error_msg = '早报信息获取失败，请稍后再试'
+            logger.error("[早报] API请求失败")
+            return error_msg
+
         except Exception as e:
             logger.error("[早报] API请求异常: {}\n{}", str(e), traceback.format_exc())
             return "获取早报失败，请稍后再试"
@@ -294,50 +293,27 @@ class DailyBot(PluginBase):
     async def make_request(self, url: str, method: str = "GET", headers: Optional[dict] = None, 
                          params: Optional[dict] = None, data: Optional[str] = None) -> Union[dict, str]:
         """发送HTTP请求"""
-        conn = aiohttp.TCPConnector(ssl=False)  # 忽略SSL验证
-        async with aiohttp.ClientSession(connector=conn) as session:
-            if method.upper() == "GET":
-                async with session.get(url, headers=headers, params=params) as response:
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    # 如果是图片，直接返回URL
-                    if 'image' in content_type:
-                        return str(response.url)
-                        
-                    try:
-                        return await response.json()
-                    except:
-                        # 如果JSON解析失败，尝试手动解析
-                        text = await response.text()
-                        try:
-                            return json.loads(text)
-                        except:
-                            # 如果还是失败，检查是否是图片内容
-                            if content_type.startswith(('image/', 'application/octet-stream')):
-                                return str(response.url)
-                            raise ValueError(f"Failed to parse response as JSON: {text[:100]}")
-                            
-            elif method.upper() == "POST":
-                async with session.post(url, headers=headers, data=data) as response:
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    # 如果是图片，直接返回URL
-                    if 'image' in content_type:
-                        return str(response.url)
-                        
-                    try:
-                        return await response.json()
-                    except:
-                        text = await response.text()
-                        try:
-                            return json.loads(text)
-                        except:
-                            # 如果还是失败，检查是否是图片内容
-                            if content_type.startswith(('image/', 'application/octet-stream')):
-                                return str(response.url)
-                            raise ValueError(f"Failed to parse response as JSON: {text[:100]}")
-            else:
-                raise ValueError("Unsupported HTTP method")
+        if method.upper() == "GET":
+            response = await self.http.get(url, headers=headers, params=params, ssl=False)  # 忽略SSL验证
+        elif method.upper() == "POST":
+            response = await self.http.post(url, headers=headers, data=data, ssl=False)
+        else:
+            raise ValueError("Unsupported HTTP method")
+
+        content_type = response.headers.get('Content-Type', '')
+
+        # 如果是图片，直接返回URL
+        if 'image' in content_type:
+            return str(response.url)
+
+        try:
+            return await response.json()
+        except:
+            # 如果还是失败，检查是否是图片内容
+            if content_type.startswith(('image/', 'application/octet-stream')):
+                return str(response.url)
+            text = await response.text()
+            raise ValueError(f"Failed to parse response as JSON: {text[:100]}")
 
     async def download_image(self, url: str) -> Optional[bytes]:
         """下载图片内容"""
@@ -362,14 +338,10 @@ class DailyBot(PluginBase):
             
             # 使用带重试的请求
             for _ in range(3):  # 最多重试3次
-                response = requests.get(url, 
-                                     headers=headers, 
-                                     verify=False, 
-                                     timeout=30,
-                                     stream=True)  # 使用流式下载
+                response = await self.http.get(url, headers=headers, ssl=False, timeout=30, retries=0)
                 
-                if response.status_code == 200:
-                    content = response.content
+                if response.status == 200:
+                    content = await response.read()
                     # 简单验证图片内容
                     if len(content) > 1024 and content.startswith(b'\xff\xd8') or content.startswith(b'\x89PNG'):
                         logger.info("[图片下载] 下载成功，大小: {} bytes", len(content))
@@ -425,29 +397,29 @@ class DailyBot(PluginBase):
         """获取明星八卦"""
         url = self.bagua_api_url
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    # 如果是图片，直接返回URL
-                    if 'image' in content_type:
-                        logger.info("[八卦] 获取到图片URL: {}", response.url)
-                        return str(response.url)
-                    
-                    # 尝试解析JSON
-                    try:
-                        bagua_info = await response.json()
-                        if isinstance(bagua_info, dict) and bagua_info['code'] == 200:
-                            bagua_pic_url = bagua_info["data"]
-                            if await self.is_valid_image_url(bagua_pic_url):
-                                return bagua_pic_url
-                            else:
-                                return "周末不更新，请微博吃瓜"
-                    except:
-                        logger.error("[八卦] JSON解析失败")
-                        
-                    return "暂无明星八卦，吃瓜莫急"
-                    
+            response = await self.http.get(url, cache_ttl=600,
+                                           cache_if=any_of(has_content_type("image/"), json_field("code", 200)))
+            content_type = response.headers.get('Content-Type', '')
+            
+            # 如果是图片，直接返回URL
+            if 'image' in content_type:
+                logger.info("[八卦] 获取到图片URL: {}", response.url)
+                return str(response.url)
+            
+            # 尝试解析JSON
+            try:
+                bagua_info = await response.json()
+                if isinstance(bagua_info, dict) and bagua_info['code'] == 200:
+                    bagua_pic_url = bagua_info["data"]
+                    if await self.is_valid_image_url(bagua_pic_url):
+                        return bagua_pic_url
+                    else:
+                        return "周末不更新，请微博吃瓜"
+            except:
+                logger.error("[八卦] JSON解析失败")
+                
+            return "暂无明星八卦，吃瓜莫急"
+            
         except Exception as e:
             logger.error(f"获取明星八卦失败: {str(e)}")
             return "获取明星八卦失败"
@@ -456,27 +428,27 @@ class DailyBot(PluginBase):
         """获取KFC文案"""
         url = self.kfc_api_url
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    # 尝试解析JSON
-                    try:
-                        kfc_response = await response.json()
-                        if isinstance(kfc_response, dict) and 'text' in kfc_response:
-                            return kfc_response['text']
-                    except:
-                        # 如果JSON解析失败，尝试直接获取文本
-                        try:
-                            text = await response.text()
-                            # 有些API直接返回文本而不是JSON
-                            if text and len(text) > 10:  # 简单验证文本有效性
-                                return text.strip()
-                        except:
-                            logger.error("[KFC] 文本解析失败")
-                    
-                    return "今天不想发文案 (╯°□°）╯︵ ┻━┻"
-                    
+            # 每次请求返回不同的文案，不缓存
+            response = await self.http.get(url, cache_ttl=0)
+            content_type = response.headers.get('Content-Type', '')
+            
+            # 尝试解析JSON
+            try:
+                kfc_response = await response.json()
+                if isinstance(kfc_response, dict) and 'text' in kfc_response:
+                    return kfc_response['text']
+            except:
+                # 如果JSON解析失败，尝试直接获取文本
+                try:
+                    text = await response.text()
+                    # 有些API直接返回文本而不是JSON
+                    if text and len(text) > 10:  # 简单验证文本有效性
+                        return text.strip()
+                except:
+                    logger.error("[KFC] 文本解析失败")
+            
+            return "今天不想发文案 (╯°□°）╯︵ ┻━┻"
+            
         except Exception as e:
             logger.error(f"获取KFC文案失败: {str(e)}")
             return "获取KFC文案失败"
@@ -486,44 +458,42 @@ class DailyBot(PluginBase):
         url = self.eat_api_url
         try:
             logger.info("[吃什么] 开始请求API: {}", url)
-            conn = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=conn) as session:
-                async with session.get(url) as response:
-                    content_type = response.headers.get('Content-Type', '')
-                    logger.debug("[吃什么] 响应Content-Type: {}", content_type)
-                    
-                    # 获取响应文本
-                    text = await response.text()
-                    logger.debug("[吃什么] 响应内容: {}", text)
-                    
-                    # 尝试解析JSON，不管Content-Type
-                    try:
-                        eat_response = json.loads(text)
-                        if isinstance(eat_response, dict):
-                            meal1 = eat_response.get('meal1', '')
-                            meal2 = eat_response.get('meal2', '')
-                            mealwhat = eat_response.get('mealwhat', '')
-                            if meal1 and meal2 and mealwhat:
-                                result = f"A：吃{meal1}。\nB：吃{meal2}。\nC：{mealwhat}"
-                                logger.info("[吃什么] 成功获取建议")
-                                return result
-                            logger.warning("[吃什么] 响应缺少必要字段")
-                    except json.JSONDecodeError as e:
-                        logger.warning("[吃什么] JSON解析失败: {}", str(e))
-                        # 尝试从HTML中提取内容
-                        if '<meal1>' in text and '<meal2>' in text:
-                            import re
-                            meal1 = re.search(r'<meal1>(.*?)</meal1>', text)
-                            meal2 = re.search(r'<meal2>(.*?)</meal2>', text)
-                            mealwhat = re.search(r'<mealwhat>(.*?)</mealwhat>', text)
-                            if meal1 and meal2 and mealwhat:
-                                result = f"A：吃{meal1.group(1)}。\nB：吃{meal2.group(1)}。\nC：{mealwhat.group(1)}"
-                                logger.info("[吃什么] 成功获取HTML格式建议")
-                                return result
-                            logger.warning("[吃什么] HTML解析失败：未找到所有必要标签")
-                    
-                    return "今天吃什么呢？让我想想 🤔"
-                    
+            response = await self.http.get(url, ssl=False, cache_ttl=0)
+            content_type = response.headers.get('Content-Type', '')
+            logger.debug("[吃什么] 响应Content-Type: {}", content_type)
+            
+            # 获取响应文本
+            text = await response.text()
+            logger.debug("[吃什么] 响应内容: {}", text)
+            
+            # 尝试解析JSON，不管Content-Type
+            try:
+                eat_response = json.loads(text)
+                if isinstance(eat_response, dict):
+                    meal1 = eat_response.get('meal1', '')
+                    meal2 = eat_response.get('meal2', '')
+                    mealwhat = eat_response.get('mealwhat', '')
+                    if meal1 and meal2 and mealwhat:
+                        result = f"A：吃{meal1}。\nB：吃{meal2}。\nC：{mealwhat}"
+                        logger.info("[吃什么] 成功获取建议")
+                        return result
+                    logger.warning("[吃什么] 响应缺少必要字段")
+            except json.JSONDecodeError as e:
+                logger.warning("[吃什么] JSON解析失败: {}", str(e))
+                # 尝试从HTML中提取内容
+                if '<meal1>' in text and '<meal2>' in text:
+                    import re
+                    meal1 = re.search(r'<meal1>(.*?)</meal1>', text)
+                    meal2 = re.search(r'<meal2>(.*?)</meal2>', text)
+                    mealwhat = re.search(r'<mealwhat>(.*?)</mealwhat>', text)
+                    if meal1 and meal2 and mealwhat:
+                        result = f"A：吃{meal1.group(1)}。\nB：吃{meal2.group(1)}。\nC：{mealwhat.group(1)}"
+                        logger.info("[吃什么] 成功获取HTML格式建议")
+                        return result
+                    logger.warning("[吃什么] HTML解析失败：未找到所有必要标签")
+            
+            return "今天吃什么呢？让我想想 🤔"
+            
         except Exception as e:
             logger.error("[吃什么] 请求异常: {}\n{}", str(e), traceback.format_exc())
             return "我也不知道吃啥啊？"
@@ -545,35 +515,35 @@ class DailyBot(PluginBase):
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, headers=headers) as response:
-                    try:
-                        horoscope_data = await response.json()
-                        if isinstance(horoscope_data, dict) and horoscope_data.get('success'):
-                            data = horoscope_data['data']
-                            result = (
-                                f"{data['title']} ({data['time']}):\n\n"
-                                f"💡【每日建议】\n宜：{data['todo']['yi']}\n忌：{data['todo']['ji']}\n\n"
-                                f"📊【运势指数】\n"
-                                f"总运势：{data['index']['all']}\n"
-                                f"爱情：{data['index']['love']}\n"
-                                f"工作：{data['index']['work']}\n"
-                                f"财运：{data['index']['money']}\n"
-                                f"健康：{data['index']['health']}\n\n"
-                                f"🍀【幸运提示】\n数字：{data['luckynumber']}\n"
-                                f"颜色：{data['luckycolor']}\n"
-                                f"星座：{data['luckyconstellation']}\n\n"
-                                f"✍【简评】\n{data['shortcomment']}\n\n"
-                                f"📜【详细运势】\n"
-                                f"总运：{data['fortunetext']['all']}\n"
-                                f"爱情：{data['fortunetext']['love']}\n"
-                                f"工作：{data['fortunetext']['work']}\n"
-                                f"财运：{data['fortunetext']['money']}\n"
-                                f"健康：{data['fortunetext']['health']}\n"
-                            )
-                            return result
-                    except:
-                        logger.error("[星座] VVHAN API JSON解析失败")
+            response = await self.http.get(url, params=params, headers=headers, cache_ttl=3600,
+                                           cache_if=json_field("success", True))
+            try:
+                horoscope_data = await response.json()
+                if isinstance(horoscope_data, dict) and horoscope_data.get('success'):
+                    data = horoscope_data['data']
+                    result = (
+                        f"{data['title']} ({data['time']}):\n\n"
+                        f"💡【每日建议】\n宜：{data['todo']['yi']}\n忌：{data['todo']['ji']}\n\n"
+                        f"📊【运势指数】\n"
+                        f"总运势：{data['index']['all']}\n"
+                        f"爱情：{data['index']['love']}\n"
+                        f"工作：{data['index']['work']}\n"
+                        f"财运：{data['index']['money']}\n"
+                        f"健康：{data['index']['health']}\n\n"
+                        f"🍀【幸运提示】\n数字：{data['luckynumber']}\n"
+                        f"颜色：{data['luckycolor']}\n"
+                        f"星座：{data['luckyconstellation']}\n\n"
+                        f"✍【简评】\n{data['shortcomment']}\n\n"
+                        f"📜【详细运势】\n"
+                        f"总运：{data['fortunetext']['all']}\n"
+                        f"爱情：{data['fortunetext']['love']}\n"
+                        f"工作：{data['fortunetext']['work']}\n"
+                        f"财运：{data['fortunetext']['money']}\n"
+                        f"健康：{data['fortunetext']['health']}\n"
+                    )
+                    return result
+            except:
+                logger.error("[星座] VVHAN API JSON解析失败")
         except Exception as e:
             logger.error(f"[星座] VVHAN API请求失败: {str(e)}")
 
@@ -772,9 +742,8 @@ class DailyBot(PluginBase):
     async def is_valid_image_url(self, url: str) -> bool:
         """检查是否为有效的图片URL"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.head(url) as response:
-                    return response.status == 200
+            response = await self.http.head(url, cache_ttl=0)
+            return response.status == 200
         except Exception as e:
             logger.error(f"检查图片URL失败: {str(e)}")
             return False
@@ -786,20 +755,19 @@ class DailyBot(PluginBase):
 
         try:
             logger.info("[抽签] 开始请求API: {}", url)
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    data = await response.json()
-                    logger.debug("[抽签] API响应: {}", data)
-
-                    if data.get('code') == 200:
-                        title = data.get('title', "未获取到签标题")
-                        qian = data.get('qian', "未获取到签诗")
-                        jie = data.get('jie', "未获取到解签")
-                        logger.info("[抽签] 成功获取抽签结果: {}", title)
-                        return f"\n🎯 {title}\n\n📝 签诗：\n{qian}\n\n📖 解签：\n{jie}"
-                    else:
-                        logger.warning("[抽签] API返回错误: {}", data)
-                        return "抽签失败，请稍后再试"
+            response = await self.http.get(url, params=params, cache_ttl=0)
+            data = await response.json()
+            logger.debug("[抽签] API响应: {}", data)
+
+            if data.get('code') == 200:
+                title = data.get('title', "未获取到签标题")
+                qian = data.get('qian', "未获取到签诗")
+                jie = data.get('jie', "未获取到解签")
+                logger.info("[抽签] 成功获取抽签结果: {}", title)
+                return f"\n🎯 {title}\n\n📝 签诗：\n{qian}\n\n📖 解签：\n{jie}"
+            else:
+                logger.warning("[抽签] API返回错误: {}", data)
+                return "抽签失败，请稍后再试"
         except Exception as e:
             logger.error("[抽签] 请求异常: {}\n{}", str(e), traceback.format_exc())
             return f"抽签出错：{str(e)}" 
\ No newline at end of file
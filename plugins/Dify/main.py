@@ -212,55 +212,56 @@ class Dify(PluginBase):
         url = f"{self.base_url}/chat-messages"
 
         ai_resp = ""
-        async with aiohttp.ClientSession(proxy=self.http_proxy) as session:
-            async with session.post(url=url, headers=headers, data=payload) as resp:
-                if resp.status == 200:
-                    # 读取响应
-                    async for line in resp.content:  # 流式传输
-                        line = line.decode("utf-8").strip()
-                        if not line or line == "event: ping":  # 空行或ping
-                            continue
-                        elif line.startswith("data: "):  # 脑瘫吧，为什么前面要加 "data: " ？？？
-                            line = line[6:]
-
-                        try:
-                            resp_json = json.loads(line)
-                        except json.decoder.JSONDecodeError:
-                            logger.error(f"Dify返回的JSON解析错误，请检查格式: {line}")
-
-                        event = resp_json.get("event", "")
-                        if event == "message":  # LLM 返回文本块事件
-                            ai_resp += resp_json.get("answer", "")
-                        elif event == "message_replace":  # 消息内容替换事件
-                            ai_resp = resp_json("answer", "")
-                        elif event == "message_file":  # 文件事件 目前dify只输出图片
-                            await self.dify_handle_image(bot, message, resp_json.get("url", ""))
-                        elif event == "tts_message":  # TTS 音频流结束事件
-                            await self.dify_handle_audio(bot, message, resp_json.get("audio", ""))
-                        elif event == "error":  # 流式输出过程中出现的异常
-                            await self.dify_handle_error(bot, message,
-                                                         resp_json.get("task_id", ""),
-                                                         resp_json.get("message_id", ""),
-                                                         resp_json.get("status", ""),
-                                                         resp_json.get("code", ""),
-                                                         resp_json.get("message", ""))
-
-                    new_con_id = resp_json.get("conversation_id", "")
-                    if new_con_id and new_con_id != conversation_id:
-                        self.db.save_llm_thread_id(message["FromWxid"], new_con_id, "dify")
-
-                elif resp.status == 404:
-                    self.db.save_llm_thread_id(message["FromWxid"], "", "dify")
-                    return await self.dify(bot, message, query)
-
-                elif resp.status == 400:
-                    return await self.handle_400(bot, message, resp)
-
-                elif resp.status == 500:
-                    return await self.handle_500(bot, message)
-
-                else:
-                    return await self.handle_other_status(bot, message, resp)
+        # 流式响应不经过缓存，直接使用共用的连接池
+        async with self.http.session.post(url=url, headers=headers, data=payload, proxy=self.http_proxy or None,
+                                          timeout=aiohttp.ClientTimeout(total=300)) as resp:
+            if resp.status == 200:
+                # 读取响应
+                async for line in resp.content:  # 流式传输
+                    line = line.decode("utf-8").strip()
+                    if not line or line == "event: ping":  # 空行或ping
+                        continue
+                    elif line.startswith("data: "):  # 脑瘫吧，为什么前面要加 "data: " ？？？
+                        line = line[6:]
+
+                    try:
+                        resp_json = json.loads(line)
+                    except json.decoder.JSONDecodeError:
+                        logger.error(f"Dify返回的JSON解析错误，请检查格式: {line}")
+
+                    event = resp_json.get("event", "")
+                    if event == "message":  # LLM 返回文本块事件
+                        ai_resp += resp_json.get("answer", "")
+                    elif event == "message_replace":  # 消息内容替换事件
+                        ai_resp = resp_json("answer", "")
+                    elif event == "message_file":  # 文件事件 目前dify只输出图片
+                        await self.dify_handle_image(bot, message, resp_json.get("url", ""))
+                    elif event == "tts_message":  # TTS 音频流结束事件
+                        await self.dify_handle_audio(bot, message, resp_json.get("audio", ""))
+                    elif event == "error":  # 流式输出过程中出现的异常
+                        await self.dify_handle_error(bot, message,
+                                                     resp_json.get("task_id", ""),
+                                                     resp_json.get("message_id", ""),
+                                                     resp_json.get("status", ""),
+                                                     resp_json.get("code", ""),
+                                                     resp_json.get("message", ""))
+
+                new_con_id = resp_json.get("conversation_id", "")
+                if new_con_id and new_con_id != conversation_id:
+                    self.db.save_llm_thread_id(message["FromWxid"], new_con_id, "dify")
+
+            elif resp.status == 404:
+                self.db.save_llm_thread_id(message["FromWxid"], "", "dify")
+                return await self.dify(bot, message, query)
+
+            elif resp.status == 400:
+                return await self.handle_400(bot, message, resp)
+
+            elif resp.status == 500:
+                return await self.handle_500(bot, message)
+
+            else:
+                return await self.handle_other_status(bot, message, resp)
 
         if ai_resp:
             await self.dify_handle_text(bot, message, ai_resp)
@@ -276,9 +277,8 @@ class Dify(PluginBase):
 
         url = f"{self.base_url}/files/upload"
 
-        async with aiohttp.ClientSession(proxy=self.http_proxy) as session:
-            async with session.post(url, headers=headers, data=formdata) as resp:
-                resp_json = await resp.json()
+        resp = await self.http.post(url, headers=headers, data=formdata, proxy=self.http_proxy or None)
+        resp_json = await resp.json()
 
         return resp_json.get("id", "")
 
@@ -301,15 +301,13 @@ class Dify(PluginBase):
             await bot.send_at_message(message["FromWxid"], "\n" + text, [message["SenderWxid"]])
 
     async def download_file(self, url: str) -> bytes:
-        async with aiohttp.ClientSession(proxy=self.http_proxy) as session:
-            async with session.get(url) as resp:
-                return await resp.read()
+        resp = await self.http.get(url, proxy=self.http_proxy or None)
+        return await resp.read()
 
     async def dify_handle_image(self, bot: WechatAPIClient, message: dict, image: Union[str, bytes]):
         if isinstance(image, str) and image.startswith("http"):
-            async with aiohttp.ClientSession(proxy=self.http_proxy) as session:
-                async with session.get(image) as resp:
-                    image = bot.byte_to_base64(await resp.read())
+            resp = await self.http.get(image, proxy=self.http_proxy or None)
+            image = bot.byte_to_base64(await resp.read())
         elif isinstance(image, bytes):
             image = bot.byte_to_base64(image)
 
@@ -375,5 +373,5 @@ class Dify(PluginBase):
                                           [wxid])
                 return False
 
-            self.db.add_points(wxid, -self.price)
+            self.db.record_points(wxid, -self.price, "dify.chat", f"dify:{message.get('NewMsgId', message['MsgId'])}")
             return True
@@ -82,39 +82,39 @@ class DouyinParser(PluginBase):
                     'Range': 'bytes=0-'
                 }
                 
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(video_url, 
-                                         proxy=proxy, 
-                                         headers=headers,
-                                         allow_redirects=True, 
-                                         timeout=60) as response:  # 延长超时时间到60秒
-                        if response.status == 200 or response.status == 206:
-                            # 获取所有重定向历史
-                            history = [str(resp.url) for resp in response.history]
-                            real_url = str(response.url)
-                            
-                            # 记录重定向链接历史，用于调试
-                            if history:
-                                logger.debug("[抖音] 重定向历史: {}", history)
-                            
-                            # 检查是否获取到了真实的视频URL
-                            if real_url != video_url and ('v3-' in real_url.lower() or 'douyinvod.com' in real_url.lower()):
-                                logger.info("[抖音] 成功获取真实链接: {}", real_url)
-                                return real_url
-                            else:
-                                logger.warning("[抖音] 未能获取到真实视频链接，准备重试")
-                                if retry < max_retries - 1:  # 如果不是最后一次尝试，则等待后重试
-                                    await asyncio.sleep(retry_delay)
-                                    continue
-                                return video_url
+                # 只需要重定向后的地址，不读取视频内容，直接使用共用的连接池
+                async with self.http.session.get(video_url,
+                                                 proxy=proxy,
+                                                 headers=headers,
+                                                 allow_redirects=True,
+                                                 timeout=60) as response:  # 延长超时时间到60秒
+                    if response.status == 200 or response.status == 206:
+                        # 获取所有重定向历史
+                        history = [str(resp.url) for resp in response.history]
+                        real_url = str(response.url)
+                        
+                        # 记录重定向链接历史，用于调试
+                        if history:
+                            logger.debug("[抖音] 重定向历史: {}", history)
+                        
+                        # 检查是否获取到了真实的视频URL
+                        if real_url != video_url and ('v3-' in real_url.lower() or 'douyinvod.com' in real_url.lower()):
+                            logger.info("[抖音] 成功获取真实链接: {}", real_url)
+                            return real_url
                         else:
-                            logger.error("[抖音] 获取视频真实链接失败, 状态码: {}", response.status)
-                            logger.debug("[抖音] 响应头: {}", response.headers)
-                            if retry < max_retries - 1:
+                            logger.warning("[抖音] 未能获取到真实视频链接，准备重试")
+                            if retry < max_retries - 1:  # 如果不是最后一次尝试，则等待后重试
                                 await asyncio.sleep(retry_delay)
                                 continue
                             return video_url
-                        
+                    else:
+                        logger.error("[抖音] 获取视频真实链接失败, 状态码: {}", response.status)
+                        logger.debug("[抖音] 响应头: {}", response.headers)
+                        if retry < max_retries - 1:
+                            await asyncio.sleep(retry_delay)
+                            continue
+                        return video_url
+                    
             except Exception as e:
                 logger.error("[抖音] 获取真实链接失败: {} (第{}次尝试)", str(e), retry + 1)
                 if retry < max_retries - 1:
@@ -137,30 +137,29 @@ class DouyinParser(PluginBase):
 
             logger.debug("[抖音] 请求API: {}, 参数: {}", api_url, repr(params))  # 添加日志
 
-            async with aiohttp.ClientSession() as session:
-                # 使用代理
-                proxy = f"http://{self.http_proxy}" if self.http_proxy and not self.http_proxy.startswith(('http://', 'https://')) else self.http_proxy
-                async with session.get(api_url, params=params, timeout=30, proxy=proxy) as response:  # 使用代理
-                    if response.status != 200:
-                        raise DouyinParserError(f"API请求失败，状态码: {response.status}")
+            # 使用代理，同一个分享链接短时间内只解析一次
+            proxy = f"http://{self.http_proxy}" if self.http_proxy and not self.http_proxy.startswith(('http://', 'https://')) else self.http_proxy
+            response = await self.http.get(api_url, params=params, timeout=30, proxy=proxy, cache_ttl=300)
+            if response.status != 200:
+                raise DouyinParserError(f"API请求失败，状态码: {response.status}")
 
-                    data = await response.json()
-                    logger.debug("[抖音] API响应数据: {}", data)  # 添加日志
+            data = await response.json()
+            logger.debug("[抖音] API响应数据: {}", data)  # 添加日志
 
-                    if data.get("code") == 200:
-                        result = data.get("data", {})
-                        if not result:
-                            raise DouyinParserError("API返回数据为空")
+            if data.get("code") == 200:
+                result = data.get("data", {})
+                if not result:
+                    raise DouyinParserError("API返回数据为空")
 
-                        # 获取真实视频链接
-                        if result.get('video'):
-                            result['video'] = await self._get_real_video_url(result['video'])
+                # 获取真实视频链接
+                if result.get('video'):
+                    result['video'] = await self._get_real_video_url(result['video'])
 
-                        result = self._clean_response_data(result)
-                        logger.debug("[抖音] 清理后的数据: {}", result)
-                        return result
-                    else:
-                        raise DouyinParserError(data.get("message", "未知错误"))
+                result = self._clean_response_data(result)
+                logger.debug("[抖音] 清理后的数据: {}", result)
+                return result
+            else:
+                raise DouyinParserError(data.get("message", "未知错误"))
 
         except (aiohttp.ClientTimeout, aiohttp.ClientError) as e:
             logger.error("[抖音] 解析失败: {}", str(e))
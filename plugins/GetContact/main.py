@@ -2,7 +2,6 @@ import asyncio
 import tomllib
 from datetime import datetime
 
-import aiohttp
 from loguru import logger
 from tabulate import tabulate
 
@@ -107,10 +106,8 @@ class GetContact(PluginBase):
 
         payload = {"content": table}
 
-        conn_ssl = aiohttp.TCPConnector(ssl=False)
-        async with aiohttp.request("POST", url="https://easychuan.cn/texts", connector=conn_ssl, json=payload) as req:
-            resp = await req.json()
-        await conn_ssl.close()
+        req = await self.http.post("https://easychuan.cn/texts", json=payload, ssl=False)
+        resp = await req.json()
 
         await bot.send_link_message(message["FromWxid"],
                                     url=f"https://easychuan.cn/r/{resp['fetch_code']}?t=t",
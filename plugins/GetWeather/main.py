@@ -1,10 +1,10 @@
 import tomllib
 
-import aiohttp
 import jieba
 
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
+from utils.http_client import json_field
 from utils.plugin_base import PluginBase
 
 
@@ -54,10 +54,10 @@ class GetWeather(PluginBase):
         request_loc = "".join(command)
 
         geo_api_url = f'https://geoapi.qweather.com/v2/city/lookup?key={self.api_key}&number=1&location={request_loc}'
-        conn_ssl = aiohttp.TCPConnector(ssl=False)
-        async with aiohttp.request('GET', url=geo_api_url, connector=conn_ssl) as response:
-            geoapi_json = await response.json()
-            await conn_ssl.close()
+        # 城市信息基本不变，缓存一天；接口出错时也返回200，只缓存code为200的结果
+        response = await self.http.get(geo_api_url, ssl=False, cache_ttl=86400,
+                                       cache_if=json_field("code", "200"))
+        geoapi_json = await response.json()
 
         if geoapi_json['code'] == '404':
             await bot.send_at_message(message["FromWxid"], "\n⚠️查无此地！", [message["SenderWxid"]])
@@ -73,18 +73,16 @@ class GetWeather(PluginBase):
         city_id = geoapi_json["location"][0]["id"]
 
         # 请求现在天气api
-        conn_ssl = aiohttp.TCPConnector(verify_ssl=False)
         now_weather_api_url = f'https://devapi.qweather.com/v7/weather/now?key={self.api_key}&location={city_id}'
-        async with aiohttp.request('GET', url=now_weather_api_url, connector=conn_ssl) as response:
-            now_weather_api_json = await response.json()
-            await conn_ssl.close()
+        response = await self.http.get(now_weather_api_url, ssl=False, cache_ttl=600,
+                                       cache_if=json_field("code", "200"))
+        now_weather_api_json = await response.json()
 
         # 请求预报天气api
-        conn_ssl = aiohttp.TCPConnector(verify_ssl=False)
         weather_forecast_api_url = f'https://devapi.qweather.com/v7/weather/7d?key={self.api_key}&location={city_id}'
-        async with aiohttp.request('GET', url=weather_forecast_api_url, connector=conn_ssl) as response:
-            weather_forecast_api_json = await response.json()
-            await conn_ssl.close()
+        response = await self.http.get(weather_forecast_api_url, ssl=False, cache_ttl=1800,
+                                       cache_if=json_field("code", "200"))
+        weather_forecast_api_json = await response.json()
 
         out_message = self.compose_weather_message(country, adm1, adm2, now_weather_api_json, weather_forecast_api_json)
         await bot.send_at_message(message["FromWxid"], "\n" + out_message, [message["SenderWxid"]])
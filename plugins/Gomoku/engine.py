@@ -0,0 +1,94 @@
+"""
+五子棋棋盘
+棋盘保存在一个 bytearray 中（每格1字节，17x17只占289字节），落子后只检查经过这颗棋子的四条线，
+并用落子计数判断平局，不需要每步扫描整个棋盘
+"""
+
+from typing import Iterator, Optional, Tuple
+
+SIZE = 17
+WIN_LENGTH = 5
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+DRAW = 3
+
+# 横、竖、两条斜线
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+
+class GomokuBoard:
+    """一局五子棋的棋盘"""
+
+    __slots__ = ("size", "cells", "moves", "last_move", "result")
+
+    def __init__(self, size: int = SIZE):
+        self.size = size
+        self.cells = bytearray(size * size)
+        self.moves = 0
+        self.last_move: Optional[Tuple[int, int]] = None
+        self.result = EMPTY  # 游戏结束后为获胜方的棋子颜色或DRAW
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def get(self, x: int, y: int) -> int:
+        return self.cells[y * self.size + x]
+
+    @property
+    def full(self) -> bool:
+        return self.moves >= self.size * self.size
+
+    def place(self, x: int, y: int, stone: int) -> int:
+        """
+        落子
+
+        Args:
+            x: 列，从0开始
+            y: 行，从0开始（从上往下）
+            stone: BLACK 或 WHITE
+
+        Returns:
+            int: 这步棋获胜时返回stone，棋盘下满时返回DRAW，否则返回EMPTY
+        """
+        index = y * self.size + x
+        if self.cells[index] != EMPTY:
+            raise ValueError(f"({x}, {y}) 已有棋子")
+        self.cells[index] = stone
+        self.moves += 1
+        self.last_move = (x, y)
+
+        if self.wins_at(x, y):
+            self.result = stone
+        elif self.full:
+            self.result = DRAW
+        return self.result
+
+    def wins_at(self, x: int, y: int) -> bool:
+        """经过(x, y)的四条线中是否有连成五子的"""
+        for dx, dy in DIRECTIONS:
+            if self._count(x, y, dx, dy) + self._count(x, y, -dx, -dy) - 1 >= WIN_LENGTH:
+                return True
+        return False
+
+    def _count(self, x: int, y: int, dx: int, dy: int) -> int:
+        """从(x, y)开始沿(dx, dy)方向同色棋子的数量（包括(x, y)）"""
+        cells = self.cells
+        size = self.size
+        stone = cells[y * size + x]
+        count = 0
+        while 0 <= x < size and 0 <= y < size and cells[y * size + x] == stone:
+            count += 1
+            if count >= WIN_LENGTH:
+                break
+            x += dx
+            y += dy
+        return count
+
+    def stones(self) -> Iterator[Tuple[int, int, int]]:
+        """所有棋子 (x, y, 颜色)"""
+        size = self.size
+        for index, stone in enumerate(self.cells):
+            if stone:
+                yield index % size, index // size, stone
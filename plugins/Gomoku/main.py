@@ -1,12 +1,10 @@
-import asyncio
-import base64
 import tomllib
 from random import sample
 
-from PIL import Image, ImageDraw
-
 from WechatAPI import WechatAPIClient
 from database.XYBotDB import XYBotDB
+from plugins.Gomoku.engine import BLACK, DRAW, EMPTY, WHITE, GomokuBoard
+from plugins.Gomoku.renderer import BoardRenderer
 from utils.decorators import *
 from utils.plugin_base import PluginBase
 
@@ -35,6 +33,11 @@ class Gomoku(PluginBase):
 
         self.db = XYBotDB()
 
+        # 棋盘绘制，底图和棋子贴图只加载一次
+        self.renderer = BoardRenderer(image_format=config.get("image-format", "PNG"),
+                                      jpeg_quality=config.get("jpeg-quality", 85),
+                                      png_compress_level=config.get("png-compress-level", 1))
+
         # 游戏状态存储
         self.gomoku_games = {}  # 存储所有进行中的游戏
         self.gomoku_players = {}  # 存储玩家与游戏的对应关系
@@ -104,10 +107,9 @@ class Gomoku(PluginBase):
             'turn': None,
             'status': 'inviting',
             'chatroom': room_id,
-            'timeout_task': asyncio.create_task(
-                self._handle_invite_timeout(bot, game_id, sender, invitee_wxid, room_id)
-            )
         }
+        self.deadlines.schedule(game_id, self.timeout, self._handle_invite_timeout,
+                                bot, game_id, sender, invitee_wxid, room_id)
 
     async def accept_game(self, bot: WechatAPIClient, message: dict):
         """接受五子棋游戏"""
@@ -146,12 +148,12 @@ class Gomoku(PluginBase):
             await bot.send_text_message(room_id, '-----XYBot-----\n❌请在原群聊中接受邀请！')
             return
 
-        # 取消超时任务
-        game['timeout_task'].cancel()
+        # 取消超时
+        self.deadlines.cancel(game_id)
 
         # 初始化游戏
         game['status'] = 'playing'
-        game['board'] = [[0 for _ in range(17)] for _ in range(17)]
+        game['board'] = GomokuBoard()
         game['turn'] = game['black']
 
         # 发送游戏开始信息
@@ -175,13 +177,12 @@ class Gomoku(PluginBase):
         await bot.send_text_message(room_id, start_msg)
 
         # 发送棋盘
-        board_base64 = self._draw_board(game_id)
+        board_base64 = await self.renderer.render(game_id, game['board'])
         await bot.send_image_message(room_id, board_base64)
 
         # 设置回合超时
-        game['timeout_task'] = asyncio.create_task(
-            self._handle_turn_timeout(bot, game_id, game['black'], room_id)
-        )
+        self.deadlines.schedule(game_id, self.timeout, self._handle_turn_timeout,
+                                bot, game_id, game['black'], room_id)
 
     async def play_game(self, bot: WechatAPIClient, message: dict):
         """处理下棋操作"""
@@ -228,38 +229,39 @@ class Gomoku(PluginBase):
             await bot.send_text_message(room_id, '-----XYBot-----\n❌坐标超出范围！')
             return
 
-        if game['board'][y][x] != 0:
+        if game['board'].get(x, y) != EMPTY:
             await bot.send_text_message(room_id, '-----XYBot-----\n❌该位置已有棋子！')
             return
 
-        # 取消超时任务
-        game['timeout_task'].cancel()
+        # 取消超时
+        self.deadlines.cancel(game_id)
 
-        # 落子
-        game['board'][y][x] = 1 if sender == game['black'] else 2
+        # 落子，只检查经过这颗棋子的线
+        result = game['board'].place(x, y, BLACK if sender == game['black'] else WHITE)
 
         # 绘制并发送新棋盘
-        board_base64 = self._draw_board(game_id, highlight=(x, y))
+        self.renderer.place(game_id, game['board'], x, y)
+        board_base64 = await self.renderer.render(game_id, game['board'], highlight=(x, y))
         await bot.send_image_message(room_id, board_base64)
 
         # 检查是否获胜
-        winner = self._check_winner(game_id)
-        if winner:
-            if winner == 'draw':
+        if result != EMPTY:
+            if result == DRAW:
                 await bot.send_text_message(room_id, f'-----XYBot-----\n🎉五子棋游戏 {game_id} 结束！\n\n平局！⚖️')
             else:
-                winner_wxid = game['black'] if winner == 'black' else game['white']
+                winner_wxid = game['black'] if result == BLACK else game['white']
                 winner_nick = await bot.get_nickname(winner_wxid)
                 await bot.send_text_message(
                     room_id,
                     f'-----XYBot-----\n🎉五子棋游戏 {game_id} 结束！\n\n'
-                    f'{"⚫️黑方" if winner == "black" else "⚪️白方"}：{winner_nick} 获胜！🏆'
+                    f'{"⚫️黑方" if result == BLACK else "⚪️白方"}：{winner_nick} 获胜！🏆'
                 )
 
             # 清理游戏数据
             self.gomoku_players.pop(game['black'])
             self.gomoku_players.pop(game['white'])
             self.gomoku_games.pop(game_id)
+            self.renderer.discard(game_id)
             return
 
         # 切换回合
@@ -284,9 +286,8 @@ class Gomoku(PluginBase):
         await bot.send_text_message(room_id, turn_msg)
 
         # 设置新的回合超时
-        game['timeout_task'] = asyncio.create_task(
-            self._handle_turn_timeout(bot, game_id, game['turn'], room_id)
-        )
+        self.deadlines.schedule(game_id, self.timeout, self._handle_turn_timeout,
+                                bot, game_id, game['turn'], room_id)
 
     def _generate_game_id(self) -> str:
         """生成游戏ID"""
@@ -296,79 +297,9 @@ class Gomoku(PluginBase):
             if game_id not in self.gomoku_games:
                 return game_id
 
-    def _draw_board(self, game_id: str, highlight: tuple = None) -> str:
-        """绘制棋盘并返回base64编码"""
-        board_img = Image.open('resource/images/gomoku_board_original.png')
-        draw = ImageDraw.Draw(board_img)
-
-        board = self.gomoku_games[game_id]['board']
-
-        # 绘制棋子
-        for y in range(17):
-            for x in range(17):
-                if board[y][x] != 0:
-                    color = 'black' if board[y][x] == 1 else 'white'
-                    draw.ellipse(
-                        (24 + x * 27 - 8, 24 + y * 27 - 8,
-                         24 + x * 27 + 8, 24 + y * 27 + 8),
-                        fill=color
-                    )
-
-        # 绘制高亮
-        if highlight:
-            x, y = highlight
-            draw.ellipse(
-                (24 + x * 27 - 8, 24 + y * 27 - 8,
-                 24 + x * 27 + 8, 24 + y * 27 + 8),
-                outline='red',
-                width=2
-            )
-
-        # 转换为bytes
-        from io import BytesIO
-        img_byte_arr = BytesIO()
-        board_img.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-
-        # 转换为base64
-        return base64.b64encode(img_byte_arr).decode()
-
-    def _check_winner(self, game_id: str) -> str:
-        """检查是否有获胜者"""
-        board = self.gomoku_games[game_id]['board']
-
-        # 检查所有方向
-        directions = [(0, 1), (1, 0), (1, 1), (1, -1)]
-
-        for y in range(17):
-            for x in range(17):
-                if board[y][x] == 0:
-                    continue
-
-                for dx, dy in directions:
-                    count = 1
-                    nx, ny = x + dx, y + dy
-
-                    while (0 <= nx < 17 and 0 <= ny < 17 and
-                           board[ny][nx] == board[y][x]):
-                        count += 1
-                        nx += dx
-                        ny += dy
-
-                    if count >= 5:
-                        return 'black' if board[y][x] == 1 else 'white'
-
-        # 检查平局
-        if all(board[y][x] != 0 for y in range(17) for x in range(17)):
-            return 'draw'
-
-        return ''
-
     async def _handle_invite_timeout(self, bot: WechatAPIClient, game_id: str,
                                      inviter: str, invitee: str, room_id: str):
         """处理邀请超时"""
-        await asyncio.sleep(self.timeout)
-
         if (game_id in self.gomoku_games and
                 self.gomoku_games[game_id]['status'] == 'inviting'):
             # 清理游戏数据
@@ -385,8 +316,6 @@ class Gomoku(PluginBase):
     async def _handle_turn_timeout(self, bot: WechatAPIClient, game_id: str,
                                    player: str, room_id: str):
         """处理回合超时"""
-        await asyncio.sleep(self.timeout)
-
         if (game_id in self.gomoku_games and
                 self.gomoku_games[game_id]['status'] == 'playing' and
                 self.gomoku_games[game_id]['turn'] == player):
@@ -397,6 +326,7 @@ class Gomoku(PluginBase):
             self.gomoku_players.pop(game['black'])
             self.gomoku_players.pop(game['white'])
             self.gomoku_games.pop(game_id)
+            self.renderer.discard(game_id)
 
             loser_nick = await bot.get_nickname(player)
             winner_nick = await bot.get_nickname(winner)
@@ -0,0 +1,115 @@
+"""
+五子棋棋盘绘制
+棋盘底图和棋子贴图只加载/绘制一次，每局保存当前的棋盘画面，落子时只贴上新的棋子，
+输出时在副本上贴上高亮圈，编码（PNG/JPEG）在工作线程中进行，不阻塞事件循环
+"""
+
+import asyncio
+import base64
+import time
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from plugins.Gomoku.engine import BLACK, WHITE, GomokuBoard
+from utils.metrics import metrics
+
+render_duration = metrics.histogram("xybot_gomoku_render_seconds", "五子棋每步棋盘绘制耗时，stage为draw(贴图)或encode(编码)",
+                                    ("stage",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+# 棋盘坐标到图片像素的换算，与原来的绘制方式一致
+ORIGIN = 24
+GRID = 27
+RADIUS = 8
+
+
+class BoardRenderer:
+    """绘制所有对局的棋盘，每局一个画面"""
+
+    def __init__(self, background: str = "resource/images/gomoku_board_original.png", image_format: str = "PNG",
+                 jpeg_quality: int = 85, png_compress_level: int = 6):
+        """
+        Args:
+            background: 棋盘底图
+            image_format: 输出格式，PNG 或 JPEG
+            jpeg_quality: JPEG质量
+            png_compress_level: PNG压缩等级(0-9)，越小编码越快、图片越大
+        """
+        self.image_format = image_format.upper()
+        self.jpeg_quality = jpeg_quality
+        self.png_compress_level = png_compress_level
+
+        with Image.open(background) as image:
+            self.base = image.convert("RGB" if self.image_format == "JPEG" else "RGBA")
+
+        self.sprites = {
+            BLACK: self._sprite(fill="black"),
+            WHITE: self._sprite(fill="white"),
+        }
+        self.highlight = self._sprite(outline="red", width=2)
+        self._frames: Dict[str, Image.Image] = {}
+
+    @staticmethod
+    def _sprite(**kwargs) -> Image.Image:
+        size = RADIUS * 2 + 1
+        sprite = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        ImageDraw.Draw(sprite).ellipse((0, 0, size - 1, size - 1), **kwargs)
+        return sprite
+
+    @staticmethod
+    def _position(x: int, y: int) -> Tuple[int, int]:
+        return ORIGIN + x * GRID - RADIUS, ORIGIN + y * GRID - RADIUS
+
+    def _frame(self, game_id: str, board: GomokuBoard) -> Image.Image:
+        """对局当前的画面，没有时按棋盘重新绘制"""
+        frame = self._frames.get(game_id)
+        if frame is None:
+            frame = self.base.copy()
+            for x, y, stone in board.stones():
+                sprite = self.sprites[stone]
+                frame.paste(sprite, self._position(x, y), sprite)
+            self._frames[game_id] = frame
+        return frame
+
+    def place(self, game_id: str, board: GomokuBoard, x: int, y: int):
+        """把(x, y)上的棋子贴到对局画面上"""
+        if game_id not in self._frames:
+            self._frame(game_id, board)  # 重新绘制时已经包含这颗棋子
+            return
+        sprite = self.sprites[board.get(x, y)]
+        self._frames[game_id].paste(sprite, self._position(x, y), sprite)
+
+    def discard(self, game_id: str):
+        """对局结束后丢弃画面"""
+        self._frames.pop(game_id, None)
+
+    def _encode(self, image: Image.Image) -> str:
+        start = time.perf_counter()
+        buffer = BytesIO()
+        if self.image_format == "JPEG":
+            image.save(buffer, format="JPEG", quality=self.jpeg_quality)
+        else:
+            image.save(buffer, format="PNG", compress_level=self.png_compress_level)
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        render_duration.labels("encode").observe(time.perf_counter() - start)
+        return encoded
+
+    async def render(self, game_id: str, board: GomokuBoard, highlight: Optional[Tuple[int, int]] = None) -> str:
+        """
+        输出对局当前的棋盘图片
+
+        Args:
+            game_id: 对局ID
+            board: 棋盘
+            highlight: 高亮的坐标，一般为最后一步
+
+        Returns:
+            str: 图片的base64编码
+        """
+        start = time.perf_counter()
+        image = self._frame(game_id, board).copy()
+        if highlight:
+            image.paste(self.highlight, self._position(*highlight), self.highlight)
+        render_duration.labels("draw").observe(time.perf_counter() - start)
+        return await asyncio.to_thread(self._encode, image)
@@ -3,10 +3,9 @@ import tomllib
 from datetime import datetime
 from random import randint
 
-import aiohttp
-
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
+from utils.http_client import json_field
 from utils.plugin_base import PluginBase
 
 
@@ -45,11 +44,12 @@ class GoodMorning(PluginBase):
             if id.endswith("@chatroom"):
                 chatrooms.append(id)
 
-        async with aiohttp.request("GET", "https://zj.v.api.aa1.cn/api/bk/?num=1&type=json") as req:
-            resp = await req.json()
-            history_today = "N/A"
-            if resp.get("content"):
-                history_today = str(resp.get("content")[0])
+        req = await self.http.get("https://zj.v.api.aa1.cn/api/bk/?num=1&type=json", cache_ttl=3600,
+                                  cache_if=json_field("content"))
+        resp = await req.json()
+        history_today = "N/A"
+        if resp.get("content"):
+            history_today = str(resp.get("content")[0])
 
         weekend = ["一", "二", "三", "四", "五", "六", "日"]
         message = ("----- XYBot -----\n"
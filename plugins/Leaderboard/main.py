@@ -40,16 +40,10 @@ class Leaderboard(PluginBase):
 
         if "群" in command[0]:
             chatroom_members = await bot.get_chatroom_member_list(message["FromWxid"])
-            data = []
-            for member in chatroom_members:
-                wxid = member["UserName"]
-                points = self.db.get_points(wxid)
-                if points == 0:
-                    continue
-                data.append((member["NickName"], points))
-
-            data.sort(key=lambda x: x[1], reverse=True)
-            data = data[:self.max_count]
+            nicknames = {member["UserName"]: member["NickName"] for member in chatroom_members}
+            # 从积分排名索引中取群成员的排名，不需要逐个查询积分
+            data = [(nicknames[wxid], points)
+                    for wxid, points in self.db.get_members_leaderboard(list(nicknames), self.max_count)]
 
             out_message = "-----XYBot积分群排行榜-----"
             rank_emojis = ["👑", "🥈", "🥉"]
@@ -0,0 +1,84 @@
+"""
+抽奖奖池
+奖池在加载配置时编译成累积概率数组，一次抽奖请求的所有抽取用NumPy一次生成随机数，
+再用 searchsorted 二分查找奖品，复杂度为 O(次数 · log 奖品数)。
+次数较少时NumPy的调用开销比抽奖本身大，改用 bisect 逐次查找
+"""
+
+import random
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+Prize = Tuple[str, int, str]  # (名称, 积分, 符号)
+
+# 次数少于这个值时用 bisect 逐次抽取
+SMALL_BATCH = 32
+
+
+class PrizeTable:
+    """一个奖池的奖品和累积概率"""
+
+    def __init__(self, probability: dict):
+        """
+        Args:
+            probability: 配置中的奖池，键为概率字符串，值为 {name, points, symbol}
+        """
+        self.prizes: List[Prize] = []
+        weights = []
+        for p, prize in probability.items():
+            weights.append(float(p))
+            self.prizes.append((prize["name"], prize["points"], prize["symbol"]))
+        # 与逐个累加概率的结果相同，随机数不超过累积概率时抽中该奖品
+        self.cumulative = np.cumsum(np.array(weights, dtype=np.float64))
+        self.points = np.array([prize[1] for prize in self.prizes], dtype=np.int64)
+        self._cumulative = self.cumulative.tolist()
+
+    def draw(self, count: int, upper: float = 1.0, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        抽取count次
+
+        Args:
+            count: 次数
+            upper: 随机数的上限，保底抽奖使用较小的上限，只能抽到靠前的奖品
+            rng: 随机数生成器
+
+        Returns:
+            np.ndarray: 抽中奖品的下标，随机数超过总概率（概率之和小于1）的抽取没有奖品，不包含在结果中
+        """
+        if count <= 0:
+            return np.empty(0, dtype=np.intp)
+        rng = rng or np.random.default_rng()
+        values = rng.uniform(0, upper, count)
+        indices = np.searchsorted(self.cumulative, values, side="left")
+        return indices[indices < len(self.prizes)]
+
+    def sample(self, count: int, guaranteed: int = 0, guaranteed_upper: float = 1.0,
+               rng: Optional[np.random.Generator] = None) -> Tuple[List[Prize], int]:
+        """
+        抽奖，先抽保底次数，再抽剩下的次数
+
+        Args:
+            count: 总次数
+            guaranteed: 其中保底抽奖的次数
+            guaranteed_upper: 保底抽奖随机数的上限
+            rng: 随机数生成器
+
+        Returns:
+            (抽中的奖品列表, 赢取的总积分)
+        """
+        prizes = self.prizes
+        if count < SMALL_BATCH:
+            cumulative = self._cumulative
+            wins = []
+            for i in range(count):
+                index = bisect_left(cumulative, random.uniform(0, guaranteed_upper if i < guaranteed else 1.0))
+                if index < len(prizes):
+                    wins.append(prizes[index])
+            return wins, sum(prize[1] for prize in wins)
+
+        rng = rng or np.random.default_rng()
+        indices = np.concatenate((self.draw(guaranteed, guaranteed_upper, rng),
+                                  self.draw(count - guaranteed, 1.0, rng)))
+        return [prizes[i] for i in indices.tolist()], int(self.points[indices].sum())
@@ -1,10 +1,11 @@
-import random
 import tomllib
 
+import numpy as np
 from loguru import logger
 
 from WechatAPI import WechatAPIClient
 from database.XYBotDB import XYBotDB
+from plugins.LuckyDraw.lottery import PrizeTable
 from utils.decorators import *
 from utils.plugin_base import PluginBase
 
@@ -32,12 +33,15 @@ class LuckyDraw(PluginBase):
             name = item["name"]
             cost = item["cost"]
             probability = item["probability"]
-            self.probabilities[name] = {"cost": cost, "probability": probability}
+            # 奖池在加载时编译成累积概率表
+            self.probabilities[name] = {"cost": cost, "probability": probability, "table": PrizeTable(probability)}
 
         self.max_draw = config["max-draw"]
         self.draw_per_guarantee = config["draw-per-guarantee"]
         self.guaranteed_max_probability = config["guaranteed-max-probability"]
 
+        self.rng = np.random.default_rng()
+
         self.db = XYBotDB()
 
     @on_text_message
@@ -76,51 +80,18 @@ class LuckyDraw(PluginBase):
                                         f"-----XYBot-----\n😭你积分不足以你抽{draw_count}次{draw_name}抽奖哦！")
             return
 
-        draw_probability = self.probabilities[draw_name]["probability"]
         cost = self.probabilities[draw_name]["cost"] * draw_count
 
-        self.db.add_points(target_wxid, -cost)
-
-        wins = []
+        # 同一条消息只扣除和发放一次积分
+        action_id = f"luckydraw:{message.get('NewMsgId', message['MsgId'])}"
+        self.db.record_points(target_wxid, -cost, "luckydraw.cost", f"{action_id}:cost")
 
-        # 保底抽奖
+        # 先抽保底次数，再抽剩下的次数，所有抽取一次完成
         min_guaranteed = draw_count // self.draw_per_guarantee  # 保底抽奖次数
-        for _ in range(min_guaranteed):  # 先把保底抽了
-            random_num = random.uniform(0, self.guaranteed_max_probability)
-            cumulative_probability = 0
-            for p, prize in draw_probability.items():
-                cumulative_probability += float(p)
-                if random_num <= cumulative_probability:
-                    win_name = prize["name"]
-                    win_points = prize["points"]
-                    win_symbol = prize["symbol"]
-
-                    wins.append(
-                        (win_name, win_points, win_symbol)
-                    )  # 把结果加入赢取列表
-                    break
-
-            # 正常抽奖
-        for _ in range(draw_count - min_guaranteed):  # 把剩下的抽了
-            random_num = random.uniform(0, 1)
-            cumulative_probability = 0
-            for p, prize in draw_probability.items():
-                cumulative_probability += float(p)
-                if random_num <= cumulative_probability:
-                    win_name = prize["name"]
-                    win_points = prize["points"]
-                    win_symbol = prize["symbol"]
-
-                    wins.append(
-                        (win_name, win_points, win_symbol)
-                    )  # 把结果加入赢取列表
-                    break
-
-        total_win_points = 0
-        for win_name, win_points, win_symbol in wins:  # 统计赢取的积分
-            total_win_points += win_points
-
-        self.db.add_points(target_wxid, total_win_points)  # 把赢取的积分加入数据库
+        wins, total_win_points = self.probabilities[draw_name]["table"].sample(
+            draw_count, min_guaranteed, self.guaranteed_max_probability, self.rng)
+
+        self.db.record_points(target_wxid, total_win_points, "luckydraw.win", f"{action_id}:win")  # 把赢取的积分加入数据库
         logger.info(f"用户 {target_wxid} 在 {draw_name} 抽了 {draw_count}次 赢取了{total_win_points}积分")
         output = self.make_message(wins, draw_name, draw_count, total_win_points, cost)
         await bot.send_at_message(message["FromWxid"], output, [target_wxid])
@@ -1,9 +1,8 @@
 import tomllib
 
-import aiohttp
-
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
+from utils.http_client import json_field
 from utils.plugin_base import PluginBase
 
 
@@ -42,10 +41,10 @@ class Music(PluginBase):
 
         song_name = content[len(command[0]):].strip()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                    f"https://www.hhlqilongzhu.cn/api/dg_wyymusic.php?gm={song_name}&n=1&br=2&type=json") as resp:
-                data = await resp.json()
+        resp = await self.http.get("https://www.hhlqilongzhu.cn/api/dg_wyymusic.php",
+                                   params={"gm": song_name, "n": 1, "br": 2, "type": "json"}, cache_ttl=3600,
+                                   cache_if=json_field("code", 200))
+        data = await resp.json()
 
         if data["code"] != 200:
             await bot.send_at_message(message["FromWxid"], f"-----XYBot-----\n❌点歌失败！\n{data}",
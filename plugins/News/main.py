@@ -2,10 +2,9 @@ import asyncio
 import tomllib
 from random import choice
 
-import aiohttp
-
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
+from utils.http_client import has_content_type, json_field
 from utils.plugin_base import PluginBase
 
 
@@ -41,9 +40,9 @@ class News(PluginBase):
             return
 
         if "随机" in command[0]:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-                async with session.get("https://cn.apihz.cn/api/xinwen/baidu.php?id=88888888&key=88888888") as resp:
-                    data = await resp.json()
+            resp = await self.http.get("https://cn.apihz.cn/api/xinwen/baidu.php?id=88888888&key=88888888",
+                                       timeout=10, cache_ttl=60, cache_if=json_field("code", 200))
+            data = await resp.json()
 
             if data["code"] != 200:
                 await bot.send_text_message(message["FromWxid"], "-----XYBot-----\n新闻获取失败！")
@@ -63,9 +62,9 @@ class News(PluginBase):
                                         thumb_url=new["img"])
 
         else:
-            async with aiohttp.ClientSession() as session:
-                async with session.get("http://zj.v.api.aa1.cn/api/60s-v2/?cc=XYBot") as resp:
-                    image_byte = await resp.read()
+            resp = await self.http.get("http://zj.v.api.aa1.cn/api/60s-v2/?cc=XYBot", cache_ttl=600,
+                                       cache_if=has_content_type("image/"))
+            image_byte = await resp.read()
             await bot.send_image_message(message["FromWxid"], image_byte)
 
     @schedule('cron', hour=12)
@@ -87,9 +86,9 @@ class News(PluginBase):
             if id.endswith("@chatroom"):
                 chatrooms.append(id)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://zj.v.api.aa1.cn/api/60s-v2/?cc=XYBot") as resp:
-                iamge_byte = await resp.read()
+        resp = await self.http.get("http://zj.v.api.aa1.cn/api/60s-v2/?cc=XYBot", cache_ttl=600,
+                                   cache_if=has_content_type("image/"))
+        iamge_byte = await resp.read()
 
         for id in chatrooms:
             await bot.send_image_message(id, iamge_byte)
@@ -114,9 +113,9 @@ class News(PluginBase):
             if id.endswith("@chatroom"):
                 chatrooms.append(id)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://v.api.aa1.cn/api/60s-v3/?cc=XYBot") as resp:
-                iamge_byte = await resp.read()
+        resp = await self.http.get("http://v.api.aa1.cn/api/60s-v3/?cc=XYBot", cache_ttl=600,
+                                   cache_if=has_content_type("image/"))
+        iamge_byte = await resp.read()
 
         for id in chatrooms:
             await bot.send_image_message(id, iamge_byte)
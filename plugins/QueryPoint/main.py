@@ -38,8 +38,11 @@ class QueryPoint(PluginBase):
         query_wxid = message["SenderWxid"]
 
         points = self.db.get_points(query_wxid)
+        rank, total = self.db.get_rank(query_wxid)
 
         output = ("\n"
                   f"-----XYBot-----\n"
                   f"你有 {points} 点积分！😄")
+        if rank:
+            output += f"\n你在 {total} 人中排第 {rank} 名！🏆"
         await bot.send_at_message(message["FromWxid"], output, [query_wxid])
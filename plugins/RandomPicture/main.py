@@ -1,7 +1,6 @@
 import tomllib
 import traceback
 
-import aiohttp
 from loguru import logger
 
 from WechatAPI import WechatAPIClient
@@ -39,14 +38,12 @@ class RandomPicture(PluginBase):
         api_url = "https://api.52vmy.cn/api/img/tu/man?type=text"
 
         try:
-            conn_ssl = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.request("GET", url=api_url, connector=conn_ssl) as req:
-                pic_url = await req.text()
+            # 每次请求返回不同的图片，不缓存
+            req = await self.http.get(api_url, ssl=False, cache_ttl=0)
+            pic_url = (await req.text()).strip()
 
-            async with aiohttp.request("GET", url=pic_url, connector=conn_ssl) as req:
-                content = await req.read()
-
-            await conn_ssl.close()
+            req = await self.http.get(pic_url, ssl=False, cache_ttl=0)
+            content = await req.read()
 
             await bot.send_image_message(message["FromWxid"], image=content)
 
@@ -0,0 +1,138 @@
+"""
+红包口令图片池
+口令图片（验证码 + 模糊边缘遮罩 + 红包背景 + PNG编码）在工作线程中预先生成，发红包时直接从池中取出，
+取出后在后台补充。背景图和遮罩只加载/生成一次。
+后台补充和池为空时的即时生成都在同一个单线程的线程池中进行，CaptchaRenderer不会被多个线程同时使用
+"""
+
+import asyncio
+import base64
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Container, Deque, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter
+from captcha.image import ImageCaptcha
+from loguru import logger
+
+CAPTCHA_CHARS = "abdfghkmnpqtwxy23467889"
+
+# 验证码在红包背景上的尺寸和边缘空间
+CAPTCHA_WIDTH = 400
+CAPTCHA_HEIGHT = 150
+PADDING = 40
+RADIUS = 20
+
+
+class CaptchaRenderer:
+    """生成红包口令图片，只在一个工作线程中使用"""
+
+    def __init__(self, background: str = "resource/images/redpacket.png"):
+        with Image.open(background) as image:
+            self.background = image.copy()
+        self.captcha = ImageCaptcha()
+
+        # 带圆角和高斯模糊边缘的遮罩，所有图片共用
+        mask = Image.new('L', (CAPTCHA_WIDTH + PADDING * 2, CAPTCHA_HEIGHT + PADDING * 2), 0)
+        ImageDraw.Draw(mask).rounded_rectangle(
+            [PADDING, PADDING, CAPTCHA_WIDTH + PADDING, CAPTCHA_HEIGHT + PADDING],
+            radius=RADIUS,
+            fill=255
+        )
+        self.mask = mask.filter(ImageFilter.GaussianBlur(radius=20))
+
+        # 验证码位置在橙色区域居中
+        self.position = ((self.background.width - (CAPTCHA_WIDTH + PADDING * 2)) // 2, self.background.height - 320)
+
+    def render(self) -> Tuple[str, str]:
+        """
+        生成一张口令图片
+
+        Returns:
+            (口令, 图片的base64编码)
+        """
+        code = ''.join(random.sample(CAPTCHA_CHARS, 5))
+        captcha_image = self.captcha.generate_image(code).resize((CAPTCHA_WIDTH, CAPTCHA_HEIGHT))
+
+        # 把验证码贴到透明图层中心，再应用模糊遮罩
+        captcha_layer = Image.new('RGBA', self.mask.size, (255, 255, 255, 0))
+        captcha_layer.paste(captcha_image, (PADDING, PADDING))
+        captcha_layer.putalpha(self.mask)
+
+        image = self.background.copy()
+        image.paste(captcha_layer, self.position, captcha_layer)
+
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        return code, base64.b64encode(buffer.getvalue()).decode()
+
+
+class CaptchaPool:
+    """预先生成的口令图片，少于size张时在后台补充"""
+
+    def __init__(self, renderer: CaptchaRenderer, size: int = 8):
+        self.renderer = renderer
+        self.size = size
+        self._items: Deque[Tuple[str, str]] = deque()
+        self._wanted = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wanted.set()
+            self._task = asyncio.create_task(self._fill())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _render(self) -> Tuple[str, str]:
+        """在唯一的绘制线程中生成一张口令图片"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="captcha")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.renderer.render)
+
+    async def take(self, exclude: Container[str] = ()) -> Tuple[str, str]:
+        """
+        取出一张口令图片，池为空时立即生成（排在绘制线程中正在进行的补充之后）
+
+        Args:
+            exclude: 不能使用的口令（正在进行中的红包）
+
+        Returns:
+            (口令, 图片的base64编码)
+        """
+        self._wanted.set()
+        while self._items:
+            code, image = self._items.popleft()
+            if code not in exclude:
+                return code, image
+        while True:
+            code, image = await self._render()
+            if code not in exclude:
+                return code, image
+
+    async def _fill(self):
+        while True:
+            await self._wanted.wait()
+            self._wanted.clear()
+            while len(self._items) < self.size:
+                try:
+                    self._items.append(await self._render())
+                except Exception as e:
+                    logger.error("生成红包口令图片失败: {}", e)
+                    await asyncio.sleep(5)
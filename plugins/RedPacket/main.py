@@ -1,16 +1,13 @@
-import base64
 import random
 import re
 import time
 import tomllib
-from io import BytesIO
 
-from PIL import Image, ImageDraw, ImageFilter
-from captcha.image import ImageCaptcha
 from loguru import logger
 
 from WechatAPI import WechatAPIClient
 from database.XYBotDB import XYBotDB
+from plugins.RedPacket.captcha_pool import CaptchaPool, CaptchaRenderer
 from utils.decorators import *
 from utils.plugin_base import PluginBase
 
@@ -38,6 +35,17 @@ class RedPacket(PluginBase):
         self.red_packets = {}
         self.db = XYBotDB()
 
+        # 预先生成的口令图片
+        self.captcha_pool = CaptchaPool(CaptchaRenderer(), config.get("captcha-pool-size", 8))
+
+    async def on_enable(self, bot=None):
+        await super().on_enable(bot)
+        self.captcha_pool.start()
+
+    async def on_disable(self):
+        await super().on_disable()
+        await self.captcha_pool.stop()
+
     @on_text_message
     async def handle_text(self, bot: WechatAPIClient, message: dict):
         if not self.enable:
@@ -84,52 +92,8 @@ class RedPacket(PluginBase):
 
         points_list = self._split_integer(points, amount)
 
-        # 生成验证码图片
-        captcha, captcha_image = self._generate_captcha()
-
-        # 加载红包背景图
-        background = Image.open("resource/images/redpacket.png")
-
-        # 调整验证码图片大小
-        captcha_width = 400  # 进一步增加验证码宽度
-        captcha_height = 150  # 进一步增加验证码高度
-        captcha_image = captcha_image.resize((captcha_width, captcha_height))
-
-        # 创建一个带有圆角矩形和模糊边缘效果的遮罩
-        padding = 40  # 增加边缘空间
-        mask = Image.new('L', (captcha_width + padding * 2, captcha_height + padding * 2), 0)
-        draw = ImageDraw.Draw(mask)
-
-        # 绘制圆角矩形
-        radius = 20  # 圆角半径
-        draw.rounded_rectangle(
-            [padding, padding, captcha_width + padding, captcha_height + padding],
-            radius=radius,
-            fill=255
-        )
-
-        # 应用高斯模糊创建柔和边缘
-        mask = mask.filter(ImageFilter.GaussianBlur(radius=20))
-
-        # 创建一个新的白色背景图层用于验证码
-        captcha_layer = Image.new('RGBA', (captcha_width + padding * 2, captcha_height + padding * 2),
-                                  (255, 255, 255, 0))
-        # 将验证码图片粘贴到图层的中心
-        captcha_layer.paste(captcha_image, (padding, padding))
-        # 应用模糊遮罩
-        captcha_layer.putalpha(mask)
-
-        # 计算验证码位置使其在橙色区域居中
-        x = (background.width - (captcha_width + padding * 2)) // 2
-        y = background.height - 320  # 调整位置
-
-        # 将带有模糊边缘的验证码图片粘贴到背景图
-        background.paste(captcha_layer, (x, y), captcha_layer)
-
-        # 转换为base64
-        buffer = BytesIO()
-        background.save(buffer, format='PNG')
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
+        # 从池中取出预先生成的口令图片
+        captcha, image_base64 = await self.captcha_pool.take(self.red_packets)
 
         # 保存红包信息
         self.red_packets[captcha] = {
@@ -143,7 +107,9 @@ class RedPacket(PluginBase):
             "sender_nick": sender_nick
         }
 
-        self.db.add_points(sender_wxid, -points)
+        self.red_packets[captcha]["id"] = packet_id = f"redpacket:{message.get('NewMsgId', message['MsgId'])}"
+        self.db.record_points(sender_wxid, -points, "redpacket.send", f"{packet_id}:send")
+        self.deadlines.schedule(captcha, self.max_time, self._expire_packet, bot, captcha)
         logger.info(f"用户 {sender_wxid} 发了个红包 {captcha}，总计 {points} 点积分")
 
         # 发送文字消息和图片
@@ -183,53 +149,41 @@ class RedPacket(PluginBase):
             self.red_packets[captcha]["grabbed"].append(grabber_wxid)
 
             grabber_nick = await bot.get_nickname(grabber_wxid)
-            self.db.add_points(grabber_wxid, grabbed_points)
+            self.db.record_points(grabber_wxid, grabbed_points, "redpacket.grab",
+                                  f"{self.red_packets[captcha]['id']}:grab:{grabber_wxid}")
 
             out_message = f"-----XYBot-----\n🧧恭喜 {grabber_nick} 抢到了 {grabbed_points} 点积分！👏"
             await bot.send_text_message(from_wxid, out_message)
 
             if not self.red_packets[captcha]["list"]:
                 self.red_packets.pop(captcha)
+                self.deadlines.cancel(captcha)
 
         except IndexError:
             await bot.send_at_message(from_wxid, "\n-----XYBot-----\n红包已被抢完！😭", [grabber_wxid])
 
-    @schedule('interval', seconds=300)
-    async def check_expired_packets(self, bot: WechatAPIClient):
-        logger.info("[计划任务]检查是否有超时的红包")
-        for captcha in list(self.red_packets.keys()):
-            packet = self.red_packets[captcha]
-            if time.time() - packet["time"] > self.max_time:
-                points_left = sum(packet["list"])
-                sender_wxid = packet["sender"]
-                chatroom = packet["chatroom"]
-                sender_nick = packet["sender_nick"]
-
-                self.db.add_points(sender_wxid, points_left)
-                self.red_packets.pop(captcha)
+    async def _expire_packet(self, bot: WechatAPIClient, captcha: str):
+        """红包发出max_time秒后仍未被抢完，归还剩余积分"""
+        packet = self.red_packets.pop(captcha, None)
+        if packet is None:
+            return
 
-                out_message = (
-                    f"-----XYBot-----\n"
-                    f"🧧发现有红包 {captcha} 超时！已归还剩余 {points_left} 积分给 {sender_nick}"
-                )
-                await bot.send_text_message(chatroom, out_message)
+        points_left = sum(packet["list"])
+        sender_wxid = packet["sender"]
+        chatroom = packet["chatroom"]
+        sender_nick = packet["sender_nick"]
 
-    @staticmethod
-    def _generate_captcha():
-        chars = "abdfghkmnpqtwxy23467889"
-        captcha = ''.join(random.sample(chars, 5))
+        self.db.record_points(sender_wxid, points_left, "redpacket.refund", f"{packet['id']}:refund")
+        logger.info(f"红包 {captcha} 超时，归还 {points_left} 点积分给 {sender_wxid}")
 
-        image = ImageCaptcha().generate_image(captcha)
-        return captcha, image
+        out_message = (
+            f"-----XYBot-----\n"
+            f"🧧发现有红包 {captcha} 超时！已归还剩余 {points_left} 积分给 {sender_nick}"
+        )
+        await bot.send_text_message(chatroom, out_message)
 
     @staticmethod
     def _split_integer(num: int, count: int) -> list:
-        result = [1] * count
-        remaining = num - count
-
-        while remaining > 0:
-            index = random.randint(0, count - 1)
-            result[index] += 1
-            remaining -= 1
-
-        return result
+        """把num随机分成count份，每份至少为1：在1到num-1之间随机选count-1个不同的切点，切点之间的长度就是每份的大小"""
+        cuts = sorted(random.sample(range(1, num), count - 1))
+        return [b - a for a, b in zip([0] + cuts, cuts + [num])]
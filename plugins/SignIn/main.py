@@ -1,3 +1,4 @@
+import asyncio
 import tomllib
 from datetime import datetime
 from random import randint
@@ -48,6 +49,11 @@ class SignIn(PluginBase):
             self.today_signin_count = 0
             self.last_reset_date = current_date
 
+    def _reward(self, streak: int) -> tuple:
+        """随机签到积分和连续签到奖励积分"""
+        streak_points = min(streak // self.streak_cycle, self.max_streak_point)
+        return randint(self.min_points, self.max_points), streak_points
+
     @on_text_message
     async def handle_text(self, bot: WechatAPIClient, message: dict):
         if not self.enable:
@@ -64,35 +70,21 @@ class SignIn(PluginBase):
 
         sign_wxid = message["SenderWxid"]
 
-        last_sign = self.db.get_signin_stat(sign_wxid)
         now = datetime.now(tz=pytz.timezone(self.timezone)).replace(hour=0, minute=0, second=0, microsecond=0)
 
-        # 确保 last_sign 用了时区
-        if last_sign and last_sign.tzinfo is None:
-            last_sign = pytz.timezone(self.timezone).localize(last_sign)
-        last_sign = last_sign.replace(hour=0, minute=0, second=0, microsecond=0)
+        # 检查、更新连续签到天数和增加积分在同一个事务中完成，连续两次签到不会重复领取积分
+        result = await asyncio.to_thread(self.db.sign_in, sign_wxid, now, self._reward)
 
-        if last_sign and (now - last_sign).days < 1:
+        if not result.signed_in:
             output = "\n-----XYBot-----\n你今天已经签到过了！😠"
             await bot.send_at_message(message["FromWxid"], output, [sign_wxid])
             return
 
-        # 检查是否断开连续签到（超过1天没签到）
-        if last_sign and (now - last_sign).days > 1:
-            old_streak = self.db.get_signin_streak(sign_wxid)
-            streak = 1  # 重置连续签到天数
-            streak_broken = True
-        else:
-            old_streak = self.db.get_signin_streak(sign_wxid)
-            streak = old_streak + 1 if old_streak else 1  # 如果是第一次签到，从1开始
-            streak_broken = False
-
-        self.db.set_signin_stat(sign_wxid, now)
-        self.db.set_signin_streak(sign_wxid, streak)  # 设置连续签到天数
-        streak_points = min(streak // self.streak_cycle, self.max_streak_point)  # 计算连续签到奖励
-
-        signin_points = randint(self.min_points, self.max_points)  # 随机积分
-        self.db.add_points(sign_wxid, signin_points + streak_points)  # 增加积分
+        old_streak = result.old_streak
+        streak = result.streak
+        streak_broken = result.streak_broken
+        signin_points = result.signin_points
+        streak_points = result.streak_points
 
         # 增加签到计数并获取排名
         self.today_signin_count += 1
@@ -3,8 +3,6 @@ import random
 import time
 import tomllib
 
-import aiohttp
-
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
 from utils.plugin_base import PluginBase
@@ -59,24 +57,24 @@ class TencentLke(PluginBase):
             'session_id': message["FromWxid"]
         })
         url = f"https://wss.lke.cloud.tencent.com/v1/qbot/chat/sse"
-        async with aiohttp.ClientSession(proxy="") as session:
-            async with session.post(url=url, headers=headers, data=payload, timeout=10) as resp:
-                last_line = None
-                async for line in resp.content:  # 流式传输
-                    line = line.decode("utf-8").strip()
-                    if (line != ""):
-                        last_line = line
-
-                last_line = last_line.strip().replace("data:", "")
-                resp_json = json.loads(last_line)
-
-                if (resp_json['type'] == "reply"):
-                    try:
-                        AIResult = resp_json['payload']["content"]
-                        if (AIResult != ""):
-                            await bot.send_text_message(message.get("FromWxid"), AIResult)
-
-                    except json.JSONDecodeError as e:
-                        return
-
-                return
+        # 流式响应不经过缓存，直接使用共用的连接池
+        async with self.http.session.post(url=url, headers=headers, data=payload, timeout=10) as resp:
+            last_line = None
+            async for line in resp.content:  # 流式传输
+                line = line.decode("utf-8").strip()
+                if (line != ""):
+                    last_line = line
+
+            last_line = last_line.strip().replace("data:", "")
+            resp_json = json.loads(last_line)
+
+            if (resp_json['type'] == "reply"):
+                try:
+                    AIResult = resp_json['payload']["content"]
+                    if (AIResult != ""):
+                        await bot.send_text_message(message.get("FromWxid"), AIResult)
+
+                except json.JSONDecodeError as e:
+                    return
+
+            return
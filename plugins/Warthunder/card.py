@@ -0,0 +1,241 @@
+"""
+战争雷霆玩家卡片绘制
+渐变背景、半透明圆角矩形和字体在每个进程中只生成/加载一次，matplotlib的字体注册和全局rcParams也只设置一次。
+绘制在独立的进程池中进行（见 init_worker 和 render_card），不占用主进程的GIL，
+也不会有多个线程同时修改matplotlib全局状态的问题
+"""
+
+from io import BytesIO
+from typing import List, Optional
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.font_manager as fm
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+FONT_PATH = "resource/font/华文细黑.ttf"
+
+WIDTH, HEIGHT = 1800, 2560
+TOP_COLOR = (127, 127, 213)
+BOTTOM_COLOR = (145, 234, 228)
+MARGIN = 50  # 边距
+RADIUS = 30  # 圆角半径
+
+COUNTRY_TRANSLATION = {'USA': '美国', 'USSR': '苏联', 'Germany': '德国', 'GreatBritain': '英国', 'Japan': '日本',
+                       'China': '中国', 'Italy': '意大利', 'France': '法国', 'Sweden': '瑞典', 'Israel': '以色列'}
+
+TITLES = {"victories": "获胜数", "completed_missions": "完成任务", "victories_battles_ratio": "胜率",
+          "deaths": "死亡数", "lions_earned": "获得银狮", "play_time": "游玩时间",
+          "air_targets_destroyed": "击毁空中目标", "ground_targets_destroyed": "击毁地面目标",
+          "naval_targets_destroyed": "击毁海上目标"}
+AIR_TITLES = {"air_battles": "空战次数", "total_targets_destroyed": "共击毁目标",
+              "air_targets_destroyed": "击毁空中目标", "ground_targets_destroyed": "击毁地面目标",
+              "naval_targets_destroyed": "击毁海上目标", "air_battles_fighters": "战斗机次数",
+              "air_battles_bombers": "轰炸机次数", "air_battles_attackers": "攻击机次数",
+              "time_played_air_battles": "空战时长", "time_played_fighter": "战斗机时长",
+              "time_played_bomber": "轰炸机时长", "time_played_attackers": "攻击机时长"}
+GROUND_TITLES = {"ground_battles": "陆战次数", "total_targets_destroyed": "共击毁目标",
+                 "air_targets_destroyed": "击毁空中目标", "ground_targets_destroyed": "击毁地面目标",
+                 "naval_targets_destroyed": "击毁海上目标", "ground_battles_tanks": "坦克次数",
+                 "ground_battles_spgs": "坦歼次数", "ground_battles_heavy_tanks": "重坦次数",
+                 "ground_battles_spaa": "防空车次数", "time_played_ground_battles": "陆战时长",
+                 "tank_battle_time": "坦克时长", "tank_destroyer_battle_time": "坦歼时长",
+                 "heavy_tank_battle_time": "重坦时长", "spaa_battle_time": "防空车时长"}
+NAVAL_TITLES = {
+    "naval_battles": "海战次数",
+    "total_targets_destroyed": "共击毁目标",
+    "air_targets_destroyed": "击毁空中目标",
+    "ground_targets_destroyed": "击毁地面目标",
+    "naval_targets_destroyed": "击毁海上目标",
+    "ship_battles": "战舰次数",
+    "motor_torpedo_boat_battles": "鱼雷艇次数",
+    "motor_gun_boat_battles": "炮艇次数",
+    "motor_torpedo_gun_boat_battles": "鱼雷炮艇次数",
+    "sub_chaser_battles": "潜艇次数",
+    "destroyer_battles": "驱逐舰次数",
+    "naval_ferry_barge_battles": "浮船次数",
+    "time_played_naval": "海战时长",
+    "time_played_on_ship": "战舰时长",
+    "time_played_on_motor_torpedo_boat": "鱼雷艇时长",
+    "time_played_on_motor_gun_boat": "炮艇时长",
+    "time_played_on_motor_torpedo_gun_boat": "鱼雷炮艇时长",
+    "time_played_on_sub_chaser": "潜艇时长",
+    "time_played_on_destroyer": "驱逐舰时长",
+    "time_played_on_naval_ferry_barge": "浮船时长"
+}
+
+
+class CardLayers:
+    """卡片中与玩家无关的部分"""
+
+    def __init__(self, font_path: str = FONT_PATH):
+        # 对角线渐变（从左上到右下），再叠加半透明圆角矩形
+        y, x = np.indices((HEIGHT, WIDTH))
+        weight = ((x + y) / (WIDTH + HEIGHT))[..., np.newaxis]
+        gradient = np.array(TOP_COLOR) * (1 - weight) + np.array(BOTTOM_COLOR) * weight
+        background = Image.fromarray(gradient.astype(np.uint8)).convert('RGBA')
+
+        overlay = Image.new("RGBA", background.size, (0, 0, 0, 0))
+        ImageDraw.Draw(overlay).rounded_rectangle(
+            (MARGIN, MARGIN, WIDTH - MARGIN, HEIGHT - MARGIN),
+            radius=RADIUS,
+            fill=(255, 255, 255, 180))
+        self.background = Image.alpha_composite(background, overlay)
+
+        self.title_font = ImageFont.truetype(font_path, size=60)
+        self.normal_font = ImageFont.truetype(font_path, size=45)
+        self.section_font = self.title_font.font_variant(size=45)
+        self.small_font = self.normal_font.font_variant(size=35)
+        self.blank_avatar = Image.new("RGBA", (300, 300), (255, 255, 255, 255))
+
+        # 饼图使用的字体
+        fm.fontManager.addfont(font_path)
+        plt.rcParams['font.family'] = [fm.FontProperties(fname=font_path).get_name()]
+        plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+        plt.rcParams['font.size'] = 23
+
+
+_layers: Optional[CardLayers] = None
+
+
+def init_worker(font_path: str = FONT_PATH):
+    """进程池的初始化函数，进程启动时生成静态图层"""
+    global _layers
+    _layers = CardLayers(font_path)
+
+
+def warm_up():
+    """让进程池提前启动进程"""
+    return _layers is not None
+
+
+def _show_actual(pct: float, allvals: List[int]) -> str:
+    return f"{int(np.round(pct / 100. * sum(allvals)))}"  # 将百分比转换为实际值
+
+
+def _pie_chart(owned_vehicles: List[int], country_labels: List[str]) -> Image.Image:
+    fig = Figure(figsize=(6, 6), facecolor=(0, 0, 0, 0))
+    ax = fig.add_subplot(111)
+
+    color = plt.cm.Pastel1(np.linspace(0, 1, len(owned_vehicles)))  # 使用柔和的颜色方案
+    ax.pie(owned_vehicles,
+           labels=country_labels,
+           autopct=lambda pct: _show_actual(pct, owned_vehicles),
+           pctdistance=0.5,
+           labeldistance=1.1,
+           colors=color)
+    ax.set_title('载具数据', fontsize=27)
+
+    buf = BytesIO()
+    FigureCanvas(fig).print_png(buf)
+    buf.seek(0)
+    return Image.open(buf).resize((650, 650))
+
+
+def _draw_section(draw: ImageDraw.ImageDraw, layers: CardLayers, x: int, y: int, title: str, titles: dict,
+                  stats: dict, wrap_y: Optional[int] = None):
+    """一栏数据，超过wrap_y时换到右边一列"""
+    draw.text((x, y), title, fill="black", font=layers.section_font)
+    top = y = y + 60
+    for key, value in titles.items():
+        draw.text((x, y), f"{value}: {stats[key]}", fill="black", font=layers.small_font)
+        y += 37
+        if wrap_y is not None and y > wrap_y:
+            x, y = 1400, top
+
+
+def render_card(data: dict, avatar: Optional[bytes] = None) -> bytes:
+    """
+    绘制玩家卡片
+
+    Args:
+        data: API返回的玩家数据
+        avatar: 头像图片，为空时使用空白头像
+
+    Returns:
+        bytes: PNG图片
+    """
+    global _layers
+    if _layers is None:
+        _layers = CardLayers()
+    layers = _layers
+
+    img = layers.background.copy()
+    draw = ImageDraw.Draw(img)
+
+    # 最上方标题
+    draw.text((80, 60), "XYBotV2 战争雷霆玩家查询", fill="black", font=layers.title_font)
+
+    # 头像
+    avatar_img = layers.blank_avatar
+    if avatar:
+        try:
+            avatar_img = Image.open(BytesIO(avatar)).resize((300, 300))
+        except Exception:
+            pass
+    img.paste(avatar_img, (80, 160))
+
+    # 玩家基础信息
+    clan_and_nick = f"{data['clan_name']}  {data['nickname']}" if data.get('clan_name') else data['nickname']
+    draw.text((400, 160), clan_and_nick, fill="black", font=layers.normal_font)
+    draw.text((400, 250), f"等级: {data['player_level']}", fill="black", font=layers.normal_font)
+    draw.text((400, 340), f"注册日期: {data['register_date']}", fill="black", font=layers.normal_font)
+
+    # 载具数据饼图
+    owned_vehicles = []
+    country_labels = []
+    for country, rewards in dict(data["vehicles_and_rewards"]).items():
+        vehicles = rewards.get("owned_vehicles", 0)
+        if vehicles > 0:
+            owned_vehicles.append(vehicles)
+            country_labels.append(COUNTRY_TRANSLATION.get(country, country))
+    if owned_vehicles:
+        img.alpha_composite(_pie_chart(owned_vehicles, country_labels), (1000, 40))
+
+    # KDA数据
+    total_kills = 0
+    total_deaths = 0
+    for mode in ['arcade', 'realistic', 'simulation']:
+        stats = data.get('statistics', {}).get(mode, {})
+        total_kills += stats.get('air_targets_destroyed', 0)
+        total_kills += stats.get('ground_targets_destroyed', 0)
+        total_kills += stats.get('naval_targets_destroyed', 0)
+        total_deaths += stats.get('deaths', 0)
+    kda = round(total_kills / total_deaths if total_deaths > 0 else 0, 2)
+
+    draw.text((80, 480), "KDA数据:", fill="black", font=layers.title_font)
+    draw.text((75, 560), f"击杀: {total_kills}", fill="black", font=layers.normal_font)
+    draw.text((350, 560), f"死亡: {total_deaths}", fill="black", font=layers.normal_font)
+    draw.text((600, 560), f"KDA: {kda}", fill="black", font=layers.normal_font)
+
+    statistics = data['statistics']
+    arcade = statistics['arcade']
+    realistic = statistics['realistic']
+
+    # 娱乐街机
+    _draw_section(draw, layers, 80, 650, "娱乐街机:", TITLES, arcade)
+    _draw_section(draw, layers, 400, 650, "街机-空战:", AIR_TITLES, arcade['aviation'])
+    _draw_section(draw, layers, 750, 650, "街机-陆战:", GROUND_TITLES, arcade['ground'])
+    _draw_section(draw, layers, 1100, 650, "街机-海战:", NAVAL_TITLES, arcade['fleet'], wrap_y=1063)
+
+    # 历史性能
+    _draw_section(draw, layers, 80, 1250, "历史性能:", TITLES, realistic)
+    _draw_section(draw, layers, 400, 1250, "空历:", AIR_TITLES, realistic['aviation'])
+    _draw_section(draw, layers, 750, 1250, "陆历:", GROUND_TITLES, realistic['ground'])
+    _draw_section(draw, layers, 1100, 1250, "历史性能-海战:", NAVAL_TITLES, realistic['fleet'], wrap_y=1663)
+
+    # 真实模拟，载具数据与原来一样使用历史性能的数据
+    _draw_section(draw, layers, 80, 1850, "真实模拟:", TITLES, statistics['simulation'])
+    _draw_section(draw, layers, 400, 1850, "真实模拟-空战:", AIR_TITLES, realistic['aviation'])
+    _draw_section(draw, layers, 750, 1850, "真实模拟-陆战:", GROUND_TITLES, realistic['ground'])
+    _draw_section(draw, layers, 1100, 1850, "真实模拟-海战:", NAVAL_TITLES, realistic['fleet'], wrap_y=2263)
+
+    buffer = BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
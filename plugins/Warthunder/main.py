@@ -1,21 +1,27 @@
 import asyncio
-import io
+import multiprocessing
 import os
 import tomllib
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
 
-import aiohttp
-import matplotlib.font_manager as fm
-import matplotlib.pyplot as plt
-import numpy as np
-import requests
-from PIL import Image, ImageDraw, ImageFont
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-from matplotlib.figure import Figure
+from loguru import logger
 
 from WechatAPI import WechatAPIClient
+from plugins.Warthunder import card
 from utils.decorators import *
+from utils.http_client import json_field
 from utils.plugin_base import PluginBase
+from utils.singleflight import SingleFlight
+
+
+class PlayerQueryError(Exception):
+    """API返回了错误码"""
+
+    def __init__(self, code: int):
+        super().__init__(code)
+        self.code = code
 
 
 class Warthunder(PluginBase):
@@ -39,7 +45,32 @@ class Warthunder(PluginBase):
         self.command = config["command"]
         self.command_format = config["command-format"]
 
-        self.font_path = "resource/font/华文细黑.ttf"
+        self.font_path = card.FONT_PATH
+        self.avatar_dir = "resource/images/avatar"
+        self.render_workers = config.get("render-workers", 1)
+
+        # 绘制好的卡片按玩家缓存，同一个玩家的并发查询只查询和绘制一次。一张卡片有几MB，按总大小限制缓存
+        self.cards = SingleFlight("warthunder_card", ttl=config.get("card-cache-ttl", 600), max_entries=16,
+                                  max_bytes=int(config.get("card-cache-mb", 32) * 1024 * 1024))
+        self.card_pool: Optional[ProcessPoolExecutor] = None
+
+    async def on_enable(self, bot=None):
+        await super().on_enable(bot)
+        self._start_pool()
+
+    async def on_disable(self):
+        await super().on_disable()
+        if self.card_pool is not None:
+            self.card_pool.shutdown(wait=False, cancel_futures=True)
+            self.card_pool = None
+
+    def _start_pool(self):
+        # spawn启动的进程不会继承主进程的线程和事件循环
+        self.card_pool = ProcessPoolExecutor(max_workers=self.render_workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=card.init_worker, initargs=(self.font_path,))
+        # 提前启动进程，第一次查询不用等待进程启动和静态图层生成
+        self.card_pool.submit(card.warm_up)
 
     @on_text_message
     async def handle_text(self, bot: WechatAPIClient, message: dict):
@@ -62,314 +93,94 @@ class Warthunder(PluginBase):
                   f"正在查询玩家 {player_name} 的数据，请稍等...😄")
         a, b, c = await bot.send_at_message(message["FromWxid"], output, [message["SenderWxid"]])
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://wtapi.yangres.com/player?nick={player_name}") as resp:
-                data = await resp.json()
+        try:
+            image = await self.cards.do(player_name, self._query_card, player_name)
+        except PlayerQueryError as e:
+            code = e.code
+        except Exception:
+            logger.exception("查询战争雷霆玩家 {} 失败", player_name)
+            await bot.send_at_message(message["FromWxid"],
+                                      "-----XYBot-----\n🙅对不起，查询失败！\n请稍后再试！",
+                                      [message["SenderWxid"]])
+            await bot.revoke_message(message["FromWxid"], a, b, c)
+            return
+        else:
+            code = 200
 
-        if data["code"] == 404:
+        if code == 404:
             await bot.send_at_message(message["FromWxid"],
                                       f"-----XYBot-----\n🈚️玩家不存在！\n请检查玩家昵称，区分大小写哦！",
                                       [message["SenderWxid"]])
             await bot.revoke_message(message["FromWxid"], a, b, c)
             return
-        elif data["code"] == 500:
+        elif code == 500:
             await bot.send_at_message(message["FromWxid"],
                                       f"-----XYBot-----\n🙅对不起，API服务出现错误！\n请稍后再试！",
                                       [message["SenderWxid"]])
             await bot.revoke_message(message["FromWxid"], a, b, c)
             return
-        elif data["code"] == 400:
+        elif code == 400:
             await bot.send_at_message(message["FromWxid"],
                                       f"-----XYBot-----\n🙅对不起，API客户端出现错误！\n请稍后再试！",
                                       [message["SenderWxid"]])
             await bot.revoke_message(message["FromWxid"], a, b, c)
             return
 
-        image = await self.generate_card(data["data"])
-
         await bot.send_image_message(message["FromWxid"], image)
         await bot.revoke_message(message["FromWxid"], a, b, c)
 
-    async def generate_card(self, data: dict):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._generate_card, data)
-
-    def _generate_card(self, data: dict) -> bytes:
-        width, height = 1800, 2560
-        top_color = np.array([127, 127, 213])
-        bottom_color = np.array([145, 234, 228])
-
-        # 生成坐标网格
-        y, x = np.indices((height, width))
-        # 计算对角线权重（从左上到右下）
-        weight = (x + y) / (width + height)
-
-        # 向量化计算渐变
-        gradient = top_color * (1 - weight[..., np.newaxis]) + bottom_color * weight[..., np.newaxis]
-        gradient = gradient.astype(np.uint8)
-        img = Image.fromarray(gradient).convert('RGBA')
-
-        # 设置矩形参数
-        margin = 50  # 边距
-        radius = 30  # 圆角半径
-
-        # 绘制半透明圆角矩形
-        overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-        draw_overlay = ImageDraw.Draw(overlay)
-        draw_overlay.rounded_rectangle(
-            (margin, margin, width - margin, height - margin),
-            radius=radius,
-            fill=(255, 255, 255, 180))
-        img = Image.alpha_composite(img, overlay)
-
-        # 开始画数据
-        fm.fontManager.addfont(self.font_path)
-        plt.rcParams['font.family'] = ['STXihei']
-        plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
-        plt.rcParams['font.size'] = 23
-        # 使用自定义字体文件
-        title_font = ImageFont.truetype(self.font_path, size=60)
-        normal_font = ImageFont.truetype(self.font_path, size=45)
-
-        draw = ImageDraw.Draw(img)
-
-        # 最上方标题
-        draw.text((80, 60), "XYBotV2 战争雷霆玩家查询", fill="black", font=title_font)
-
-        # 头像
-        avatar = self._download_avatar(data["avatar"]).resize((300, 300))
-        img.paste(avatar, (80, 160))
-
-        # 玩家基础信息
-        clan_and_nick = f"{data['clan_name']}  {data['nickname']}" if data.get('clan_name') else data['nickname']
-        draw.text((400, 160), clan_and_nick, fill="black", font=normal_font)
-        draw.text((400, 250), f"等级: {data['player_level']}", fill="black", font=normal_font)
-        draw.text((400, 340), f"注册日期: {data['register_date']}", fill="black", font=normal_font)
-
-        # 载具数据饼图
-        owned_vehicles = []
-        country_labels = []
-        country_translation = {'USA': '美国', 'USSR': '苏联', 'Germany': '德国', 'GreatBritain': '英国',
-                               'Japan': '日本',
-                               'China': '中国', 'Italy': '意大利', 'France': '法国', 'Sweden': '瑞典',
-                               'Israel': '以色列'}
-
-        countries = dict(data["vehicles_and_rewards"]).keys()
-        for c in countries:
-            vehicles = data["vehicles_and_rewards"][c].get("owned_vehicles", 0)
-            if vehicles > 0:
-                owned_vehicles.append(vehicles)
-                country_labels.append(country_translation.get(c, c))
-
-        if owned_vehicles:
-            fig = Figure(figsize=(6, 6), facecolor=(0, 0, 0, 0))
-            ax = fig.add_subplot(111)
-
-            color = plt.cm.Pastel1(np.linspace(0, 1, len(owned_vehicles)))  # 使用柔和的颜色方案
-            ax.pie(owned_vehicles,
-                   labels=country_labels,
-                   autopct=lambda pct: self._show_actual(pct, owned_vehicles),
-                   pctdistance=0.5,
-                   labeldistance=1.1,
-                   colors=color)
-            ax.set_title('载具数据', fontsize=27)
-
-            canvas = FigureCanvas(fig)
-            buf = BytesIO()
-            canvas.print_png(buf)
-            buf.seek(0)
-            pie_img = Image.open(buf)
-
-            pie_img = pie_img.resize((650, 650))
-            img.alpha_composite(pie_img, (1000, 40))
-
-        # KDA数据
-        total_kills = 0
-        total_deaths = 0
-        for mode in ['arcade', 'realistic', 'simulation']:
-            stats = data.get('statistics', {}).get(mode, {})
-            total_kills += stats.get('air_targets_destroyed', 0)
-            total_kills += stats.get('ground_targets_destroyed', 0)
-            total_kills += stats.get('naval_targets_destroyed', 0)
-            total_deaths += stats.get('deaths', 0)
-        kda = round(total_kills / total_deaths if total_deaths > 0 else 0, 2)
-
-        draw.text((80, 480), f"KDA数据:", fill="black", font=title_font)
-        draw.text((75, 560), f"击杀: {total_kills}", fill="black", font=normal_font)
-        draw.text((350, 560), f"死亡: {total_deaths}", fill="black", font=normal_font)
-        draw.text((600, 560), f"KDA: {kda}", fill="black", font=normal_font)
-
-        title_font = title_font.font_variant(size=45)
-        normal_font = normal_font.font_variant(size=35)
-
-        # 数据部分
-        titles = {"victories": "获胜数", "completed_missions": "完成任务", "victories_battles_ratio": "胜率",
-                  "deaths": "死亡数", "lions_earned": "获得银狮", "play_time": "游玩时间",
-                  "air_targets_destroyed": "击毁空中目标", "ground_targets_destroyed": "击毁地面目标",
-                  "naval_targets_destroyed": "击毁海上目标"}
-        air_titles = {"air_battles": "空战次数", "total_targets_destroyed": "共击毁目标",
-                      "air_targets_destroyed": "击毁空中目标", "ground_targets_destroyed": "击毁地面目标",
-                      "naval_targets_destroyed": "击毁海上目标", "air_battles_fighters": "战斗机次数",
-                      "air_battles_bombers": "轰炸机次数", "air_battles_attackers": "攻击机次数",
-                      "time_played_air_battles": "空战时长", "time_played_fighter": "战斗机时长",
-                      "time_played_bomber": "轰炸机时长", "time_played_attackers": "攻击机时长"}
-        ground_titles = {"ground_battles": "陆战次数", "total_targets_destroyed": "共击毁目标",
-                         "air_targets_destroyed": "击毁空中目标", "ground_targets_destroyed": "击毁地面目标",
-                         "naval_targets_destroyed": "击毁海上目标", "ground_battles_tanks": "坦克次数",
-                         "ground_battles_spgs": "坦歼次数", "ground_battles_heavy_tanks": "重坦次数",
-                         "ground_battles_spaa": "防空车次数", "time_played_ground_battles": "陆战时长",
-                         "tank_battle_time": "坦克时长", "tank_destroyer_battle_time": "坦歼时长",
-                         "heavy_tank_battle_time": "重坦时长", "spaa_battle_time": "防空车时长"}
-        naval_title = {
-            "naval_battles": "海战次数",
-            "total_targets_destroyed": "共击毁目标",
-            "air_targets_destroyed": "击毁空中目标",
-            "ground_targets_destroyed": "击毁地面目标",
-            "naval_targets_destroyed": "击毁海上目标",
-            "ship_battles": "战舰次数",
-            "motor_torpedo_boat_battles": "鱼雷艇次数",
-            "motor_gun_boat_battles": "炮艇次数",
-            "motor_torpedo_gun_boat_battles": "鱼雷炮艇次数",
-            "sub_chaser_battles": "潜艇次数",
-            "destroyer_battles": "驱逐舰次数",
-            "naval_ferry_barge_battles": "浮船次数",
-            "time_played_naval": "海战时长",
-            "time_played_on_ship": "战舰时长",
-            "time_played_on_motor_torpedo_boat": "鱼雷艇时长",
-            "time_played_on_motor_gun_boat": "炮艇时长",
-            "time_played_on_motor_torpedo_gun_boat": "鱼雷炮艇时长",
-            "time_played_on_sub_chaser": "潜艇时长",
-            "time_played_on_destroyer": "驱逐舰时长",
-            "time_played_on_naval_ferry_barge": "浮船时长"
-        }
-
-        # 娱乐街机
-        draw.text((80, 650), f"娱乐街机:", fill="black", font=title_font)
-        y = 710
-        for key, value in titles.items():
-            draw.text((80, y), f"{value}: {data['statistics']['arcade'][key]}", fill="black", font=normal_font)
-            y += 37
-
-        # 娱乐街机 - 空战
-        draw.text((400, 650), f"街机-空战:", fill="black", font=title_font)
-        y = 710
-        for key, value in air_titles.items():
-            draw.text((400, y), f"{value}: {data['statistics']['arcade']['aviation'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-
-        # 娱乐街机 - 陆战
-        draw.text((750, 650), f"街机-陆战:", fill="black", font=title_font)
-        y = 710
-        for key, value in ground_titles.items():
-            draw.text((750, y), f"{value}: {data['statistics']['arcade']['ground'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-
-        # 娱乐街机 - 海战
-        draw.text((1100, 650), f"街机-海战:", fill="black", font=title_font)
-        x, y = 1100, 710
-        for key, value in naval_title.items():
-            draw.text((x, y), f"{value}: {data['statistics']['arcade']['fleet'][key]}", fill="black", font=normal_font)
-            y += 37
-            if y > 1063:
-                x = 1400
-                y = 710
-
-        # 历史性能
-        draw.text((80, 1250), f"历史性能:", fill="black", font=title_font)
-        y = 1310
-        for key, value in titles.items():
-            draw.text((80, y), f"{value}: {data['statistics']['realistic'][key]}", fill="black", font=normal_font)
-            y += 37
-
-        # 历史性能 - 空战
-        draw.text((400, 1250), f"空历:", fill="black", font=title_font)
-        y = 1310
-        for key, value in air_titles.items():
-            draw.text((400, y), f"{value}: {data['statistics']['realistic']['aviation'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-
-        # 历史性能 - 陆战
-        draw.text((750, 1250), f"陆历:", fill="black", font=title_font)
-        y = 1310
-        for key, value in ground_titles.items():
-            draw.text((750, y), f"{value}: {data['statistics']['realistic']['ground'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-
-        # 历史性能 - 海战
-        draw.text((1100, 1250), f"历史性能-海战:", fill="black", font=title_font)
-        x, y = 1100, 1310
-        for key, value in naval_title.items():
-            draw.text((x, y), f"{value}: {data['statistics']['realistic']['fleet'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-            if y > 1663:
-                x = 1400
-                y = 1310
-
-        # 真实模拟
-        draw.text((80, 1850), f"真实模拟:", fill="black", font=title_font)
-        y = 1910
-        for key, value in titles.items():
-            draw.text((80, y), f"{value}: {data['statistics']['simulation'][key]}", fill="black", font=normal_font)
-            y += 37
-
-        # 真实模拟 - 空战
-        draw.text((400, 1850), f"真实模拟-空战:", fill="black", font=title_font)
-        y = 1910
-        for key, value in air_titles.items():
-            draw.text((400, y), f"{value}: {data['statistics']['realistic']['aviation'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-
-        # 真实模拟 - 陆战
-        draw.text((750, 1850), f"真实模拟-陆战:", fill="black", font=title_font)
-        y = 1910
-        for key, value in ground_titles.items():
-            draw.text((750, y), f"{value}: {data['statistics']['realistic']['ground'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-
-        # 真实模拟 - 海战
-        draw.text((1100, 1850), f"真实模拟-海战:", fill="black", font=title_font)
-        x, y = 1100, 1910
-        for key, value in naval_title.items():
-            draw.text((x, y), f"{value}: {data['statistics']['realistic']['fleet'][key]}", fill="black",
-                      font=normal_font)
-            y += 37
-            if y > 2263:
-                x = 1400
-                y = 1910
-
-        byte_array = io.BytesIO()
-        img.save(byte_array, "PNG")
-        return byte_array.getvalue()
-
-    @staticmethod
-    def _download_avatar(url: str) -> Image.Image:
+    async def _query_card(self, player_name: str) -> bytes:
+        """查询玩家数据并绘制卡片"""
+        resp = await self.http.get("https://wtapi.yangres.com/player", params={"nick": player_name}, cache_ttl=300,
+                                   cache_if=json_field("code", 200))
+        data = await resp.json()
+        if data["code"] in (400, 404, 500):
+            raise PlayerQueryError(data["code"])
+
+        avatar = await self._fetch_avatar(data["data"]["avatar"])
+        return await self.generate_card(data["data"], avatar)
+
+    async def generate_card(self, data: dict, avatar: Optional[bytes] = None) -> bytes:
+        """在进程池中绘制卡片，进程异常退出时重新启动进程池并重试一次"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            if self.card_pool is None:
+                self._start_pool()
+            pool = self.card_pool
+            try:
+                return await loop.run_in_executor(pool, card.render_card, data, avatar)
+            except BrokenProcessPool:
+                logger.warning("战争雷霆卡片绘制进程异常退出，重新启动进程池")
+                # 同时失败的其它查询可能已经换了新的进程池
+                if self.card_pool is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self.card_pool = None
+                if attempt:
+                    raise
+
+    async def _fetch_avatar(self, url: str) -> Optional[bytes]:
+        """下载头像，按文件名缓存在磁盘上，失败时返回None（使用空白头像）"""
+        file_path = os.path.join(self.avatar_dir, url.split('/')[-1])
         try:
-            # 创建缓存目录
-            cache_dir = "resource/images/avatar"
-            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(file_path):
+                return await asyncio.to_thread(self._read_file, file_path)
 
-            # 使用URL的最后部分作为文件名
-            file_path = os.path.join(cache_dir, url.split('/')[-1])
+            resp = await self.http.get(url)
+            resp.raise_for_status()
+            content = await resp.read()
+            await asyncio.to_thread(self._write_file, file_path, content)
+            return content
+        except Exception as e:
+            logger.warning("下载战争雷霆头像失败: {}", e)
+            return None
 
-            # 检查缓存
-            if os.path.exists(file_path):
-                return Image.open(file_path)
-            else:
-                resp = requests.get(url)
-                with open(file_path, "wb") as f:
-                    f.write(resp.content)
-                return Image.open(file_path)
-        except:
-            return Image.new("RGBA", (150, 150), (255, 255, 255, 255))
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
 
     @staticmethod
-    def _show_actual(pct, allvals):
-        absolute = int(np.round(pct / 100. * sum(allvals)))  # 将百分比转换为实际值[3][9]
-        return f"{absolute}"
+    def _write_file(path: str, content: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
@@ -0,0 +1,316 @@
+"""
+多账号管理
+在同一个进程、同一个事件循环中登录多个微信账号。所有账号共用一个WechatAPI服务、
+插件、数据库连接池和缓存，每个账号有自己的客户端、同步循环和发送队列（发送限速）。
+
+收到的消息会带上 Account 字段（接收消息的机器人wxid），插件处理函数收到的bot
+就是接收消息的账号的客户端，回复会从同一个账号发出。每个账号的同步位置会被保存，
+重启后从上次的位置继续，重复下发的消息会被丢弃
+"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+import WechatAPI
+from utils.metrics import metrics
+from utils.sync_cursor import SyncCursor
+from utils.xybot import XYBot
+
+sync_duration = metrics.histogram("xybot_sync_duration_seconds", "同步新消息请求的耗时")
+sync_errors = metrics.counter("xybot_sync_errors_total", "同步新消息失败的次数")
+messages_received = metrics.counter("xybot_messages_received_total", "收到的新消息数")
+messages_in_flight = metrics.gauge("xybot_messages_in_flight", "正在处理中的消息数")
+
+
+def _message_done(task: asyncio.Task):
+    messages_in_flight.dec()
+
+
+class Account:
+    """一个登录的微信账号"""
+
+    def __init__(self, name: str, client: WechatAPI.WechatAPIClient, robot_stat_path: Path):
+        self.name = name
+        self.client = client
+        self.robot_stat_path = robot_stat_path
+        self.xybot: Optional[XYBot] = None
+        self.cursor: Optional[SyncCursor] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def wxid(self) -> str:
+        return self.client.wxid
+
+
+class AccountManager:
+    """管理多个账号的登录、心跳和消息同步"""
+
+    def __init__(self, main_config: Dict[str, Any], script_dir: Path):
+        """
+        Args:
+            main_config: main_config.toml的内容
+            script_dir: 项目根目录
+        """
+        self.main_config = main_config
+        self.script_dir = script_dir
+        self.api_port = main_config.get("WechatAPIServer", {}).get("port", 9000)
+        self.ignore_protect = main_config.get("XYBot", {}).get("ignore-protection", False)
+        self.backlog_policy = main_config.get("XYBot", {}).get("backlog-policy", "skip")
+        self.dedupe_size = main_config.get("XYBot", {}).get("dedupe-size", 10000)
+        self.preload_contacts = main_config.get("XYBot", {}).get("preload-contacts", True)
+        self.accounts: List[Account] = []
+
+        metrics.gauge("xybot_outbound_queue_depth", "待发送消息队列长度").set_function(self.queue_depth)
+
+    @staticmethod
+    def account_names(main_config: Dict[str, Any]) -> List[str]:
+        """配置的账号名称，未配置时只有一个默认账号"""
+        return main_config.get("XYBot", {}).get("accounts", []) or ["default"]
+
+    @property
+    def primary(self) -> Account:
+        """第一个账号，用于插件初始化和定时任务"""
+        return self.accounts[0]
+
+    def add(self, name: str, host: str = "127.0.0.1") -> Account:
+        """
+        添加账号，第一个账号的登录信息保存在 resource/robot_stat.json，
+        其它账号保存在 resource/robot_stat_<名称>.json
+
+        Args:
+            name: 账号名称
+            host: WechatAPI服务地址
+        """
+        client = WechatAPI.WechatAPIClient(host, self.api_port)
+        client.ignore_protect = self.ignore_protect
+        filename = "robot_stat.json" if not self.accounts else f"robot_stat_{name}.json"
+        account = Account(name, client, self.script_dir / "resource" / filename)
+        self.accounts.append(account)
+        return account
+
+    def get(self, wxid: str) -> Optional[Account]:
+        """按wxid查找账号"""
+        for account in self.accounts:
+            if account.wxid == wxid:
+                return account
+        return None
+
+    def queue_depth(self) -> int:
+        """所有账号待发送消息的总数"""
+        return sum(account.client._message_queue.qsize() for account in self.accounts)
+
+    async def login(self, account: Account):
+        """登录账号，优先使用已保存的登录信息唤醒登录，否则使用二维码登录"""
+        bot = account.client
+        robot_stat_path = account.robot_stat_path
+
+        # 检查并创建robot_stat.json文件
+        if not os.path.exists(robot_stat_path):
+            default_config = {
+                "wxid": "",
+                "device_name": "",
+                "device_id": ""
+            }
+            os.makedirs(os.path.dirname(robot_stat_path), exist_ok=True)
+            with open(robot_stat_path, "w") as f:
+                json.dump(default_config, f)
+            robot_stat = default_config
+        else:
+            with open(robot_stat_path, "r") as f:
+                robot_stat = json.load(f)
+
+        wxid = robot_stat.get("wxid", None)
+        device_name = robot_stat.get("device_name", None)
+        device_id = robot_stat.get("device_id", None)
+
+        logger.info("登录账号 {}", account.name)
+
+        if not await bot.is_logged_in(wxid):
+            while not await bot.is_logged_in(wxid):
+                # 需要登录
+                try:
+                    if await bot.get_cached_info(wxid):
+                        # 尝试唤醒登录
+                        uuid = await bot.awaken_login(wxid)
+                        logger.success("获取到登录uuid: {}", uuid)
+                    else:
+                        # 二维码登录
+                        if not device_name:
+                            device_name = bot.create_device_name()
+                        if not device_id:
+                            device_id = bot.create_device_id()
+                        uuid, url = await bot.get_qr_code(device_id=device_id, device_name=device_name, print_qr=True)
+                        logger.success("获取到登录uuid: {}", uuid)
+                        logger.success("获取到登录二维码: {}", url)
+                except:
+                    # 二维码登录
+                    if not device_name:
+                        device_name = bot.create_device_name()
+                    if not device_id:
+                        device_id = bot.create_device_id()
+                    uuid, url = await bot.get_qr_code(device_id=device_id, device_name=device_name, print_qr=True)
+                    logger.success("获取到登录uuid: {}", uuid)
+                    logger.success("获取到登录二维码: {}", url)
+
+                while True:
+                    stat, data = await bot.check_login_uuid(uuid, device_id=device_id)
+                    if stat:
+                        break
+                    logger.info("等待登录中，过期倒计时：{}", data)
+                    await asyncio.sleep(5)
+
+            # 保存登录信息
+            robot_stat["wxid"] = bot.wxid
+            robot_stat["device_name"] = device_name
+            robot_stat["device_id"] = device_id
+            with open(robot_stat_path, "w") as f:
+                json.dump(robot_stat, f)
+
+            # 获取登录账号信息
+            bot.wxid = data.get("acctSectResp").get("userName")
+            bot.nickname = data.get("acctSectResp").get("nickName")
+            bot.alias = data.get("acctSectResp").get("alias")
+            bot.phone = data.get("acctSectResp").get("bindMobile")
+
+        else:  # 已登录
+            bot.wxid = wxid
+            profile = await bot.get_profile()
+
+            bot.nickname = profile.get("NickName").get("string")
+            bot.alias = profile.get("Alias")
+            bot.phone = profile.get("BindMobile").get("string")
+
+        logger.info("登录账号信息: wxid: {}  昵称: {}  微信号: {}  手机号: {}", bot.wxid, bot.nickname, bot.alias,
+                    bot.phone)
+        logger.info("登录设备信息: device_name: {}  device_id: {}", device_name, device_id)
+        logger.success("账号 {} 登录成功", account.name)
+
+        # 初始化机器人
+        account.xybot = XYBot(bot)
+        account.xybot.update_profile(bot.wxid, bot.nickname, bot.alias, bot.phone)
+        account.cursor = SyncCursor(bot.wxid, self.dedupe_size)
+
+    async def login_all(self):
+        """依次登录所有账号，二维码登录需要逐个扫码"""
+        for account in self.accounts:
+            await self.login(account)
+
+        wxids = [account.wxid for account in self.accounts]
+        if len(set(wxids)) != len(wxids):
+            raise ValueError(f"多个账号登录了同一个微信: {wxids}")
+
+    async def start_heartbeat(self, account: Account):
+        """开启自动心跳"""
+        try:
+            success = await account.client.start_auto_heartbeat()
+            if success:
+                logger.success("账号 {} 已开启自动心跳", account.name)
+            else:
+                logger.warning("账号 {} 开启自动心跳失败", account.name)
+        except ValueError:
+            logger.warning("账号 {} 自动心跳已在运行", account.name)
+        except Exception as e:
+            if "在运行" not in str(e):
+                logger.warning("账号 {} 自动心跳已在运行", account.name)
+
+    def _process(self, account: Account, messages: List[Dict[str, Any]]):
+        """把消息交给账号的XYBot处理，消息会带上接收账号的wxid"""
+        messages_received.inc(len(messages))
+        for message in messages:
+            message["Account"] = account.wxid
+            messages_in_flight.inc()
+            task = asyncio.create_task(account.xybot.process_message(message))
+            task.add_done_callback(_message_done)
+            task.add_done_callback(lambda t, m=message: self._message_processed(account, m, t))
+
+    @staticmethod
+    def _message_processed(account: Account, message: Dict[str, Any], task: asyncio.Task):
+        """消息处理完成（包括插件出错）后才推进同步位置，被取消（退出时）的消息重启后会重新处理"""
+        if not task.cancelled():
+            account.cursor.done(message)
+
+    async def handle_backlog(self, account: Account):
+        """
+        从上次保存的同步位置接受登录前堆积的消息，backlog-policy为replay时交给插件处理，
+        为skip时丢弃。已处理过的消息不会再次处理
+        """
+        bot = account.client
+        cursor = account.cursor
+        await cursor.load()
+        replay = self.backlog_policy == "replay"
+        count = 0
+        while True:
+            data = await bot.sync_message(cursor.synckey)
+            cursor.update(data)
+            raw = data.get("AddMsgs")
+            messages = cursor.accept(raw, backlog=True)
+            if not raw:
+                await cursor.save()
+                if count > 2:
+                    break
+                else:
+                    count += 1
+                    continue
+
+            if replay:
+                logger.debug("账号 {} 重放 {} 条堆积消息", account.name, len(messages))
+                self._process(account, messages)
+            else:
+                logger.debug("账号 {} 跳过 {} 条堆积消息", account.name, len(messages))
+                for message in messages:
+                    cursor.done(message)
+            await cursor.save()
+            await asyncio.sleep(1)
+
+    async def receive(self, account: Account):
+        """同步新消息并交给账号的XYBot处理，重复下发的消息会被丢弃"""
+        bot = account.client
+        cursor = account.cursor
+        while True:
+            try:
+                with sync_duration.time():
+                    data = await bot.sync_message(cursor.synckey)
+            except Exception as e:
+                sync_errors.inc()
+                logger.warning("账号 {} 获取新消息失败 {}", account.name, e)
+                await asyncio.sleep(5)
+                continue
+
+            cursor.update(data)
+            messages = cursor.accept(data.get("AddMsgs"))
+            if messages:
+                self._process(account, messages)
+            try:
+                await cursor.save()
+            except Exception as e:
+                logger.warning("账号 {} 保存同步位置失败 {}", account.name, e)
+            # 使用异步睡眠替代忙等待循环
+            await asyncio.sleep(0.5)
+
+    @staticmethod
+    async def _preload_contacts(account: Account):
+        """在后台把联系人昵称读取到缓存中"""
+        try:
+            await account.client.preload_contacts()
+        except Exception as e:
+            logger.warning("账号 {} 读取联系人失败: {}", account.name, e)
+
+    async def run(self):
+        """处理所有账号的堆积消息，然后开始同步新消息，一直运行"""
+        logger.info("处理堆积消息中")
+        await asyncio.gather(*(self.handle_backlog(account) for account in self.accounts))
+        logger.success("处理堆积消息完毕")
+
+        if self.preload_contacts:
+            for account in self.accounts:
+                asyncio.create_task(self._preload_contacts(account))
+
+        logger.success("开始处理消息")
+        for account in self.accounts:
+            account.task = asyncio.create_task(self.receive(account), name=f"sync-{account.name}")
+        await asyncio.gather(*(account.task for account in self.accounts))
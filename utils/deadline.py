@@ -0,0 +1,226 @@
+"""
+截止时间调度
+所有插件的超时（五子棋邀请/回合超时、红包过期等）放在同一个最小堆里，按键安排、重新安排和取消。
+事件循环上只挂一个定时器，指向最早的截止时间，到期时触发所有已到期的回调再重新挂上，
+不需要每个超时一个 sleep 的任务。取消和重新安排只做标记，过期的堆元素在弹出时丢弃
+"""
+
+import asyncio
+import heapq
+import inspect
+import itertools
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+
+from loguru import logger
+
+from utils.metrics import metrics
+
+deadlines_pending = metrics.gauge("xybot_deadlines_pending", "等待触发的截止时间数")
+deadlines_fired = metrics.counter("xybot_deadlines_fired_total", "已触发的截止时间数", ("group",))
+deadline_lateness = metrics.histogram("xybot_deadline_lateness_seconds", "回调实际触发时间比截止时间晚的秒数",
+                                      buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+
+class _Entry:
+    __slots__ = ("when", "seq", "key", "callback", "args", "cancelled")
+
+    def __init__(self, when: float, seq: int, key: Hashable, callback: Callable, args: tuple):
+        self.when = when
+        self.seq = seq
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other: "_Entry") -> bool:
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+class DeadlineScheduler:
+    """按键管理的截止时间，同一个键同时只有一个等待中的回调"""
+
+    def __init__(self):
+        self._heap: List[_Entry] = []
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_when: Optional[float] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable, *args) -> None:
+        """
+        在delay秒后调用callback(*args)，键已有等待中的回调时替换它
+
+        Args:
+            key: 键，例如 ("Gomoku", 游戏ID)
+            delay: 延迟秒数
+            callback: 回调，可以是普通函数或异步函数；异步函数作为独立的任务运行
+            *args: 回调参数
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._reset(loop)
+
+        old = self._entries.get(key)
+        if old is not None:
+            old.cancelled = True
+
+        entry = _Entry(loop.time() + max(delay, 0), next(self._seq), key, callback, args)
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        deadlines_pending.set(len(self._entries))
+        self._arm()
+
+    def reschedule(self, key: Hashable, delay: float) -> bool:
+        """
+        把键的回调推迟（或提前）到delay秒后，保留原来的回调和参数
+
+        Returns:
+            bool: 键没有等待中的回调时返回False
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        self.schedule(key, delay, entry.callback, *entry.args)
+        return True
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        取消键的回调
+
+        Returns:
+            bool: 键没有等待中的回调时返回False
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry.cancelled = True
+        deadlines_pending.set(len(self._entries))
+        self._discard_cancelled()
+        return True
+
+    def remaining(self, key: Hashable) -> Optional[float]:
+        """键的回调还有多少秒触发，没有时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return max(entry.when - self._loop.time(), 0)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._entries)
+
+    def _reset(self, loop: asyncio.AbstractEventLoop):
+        """换了事件循环（例如重启），之前的截止时间已经没有意义"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._heap.clear()
+        self._entries.clear()
+        self._tasks.clear()
+        self._loop = loop
+        self._timer = None
+        self._timer_when = None
+
+    def _discard_cancelled(self):
+        """丢弃堆顶已取消的元素，让定时器指向最早的有效截止时间"""
+        heap = self._heap
+        while heap and heap[0].cancelled:
+            heapq.heappop(heap)
+        if not heap and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._timer_when = None
+
+    def _arm(self):
+        """定时器指向最早的截止时间，已经指向更早或相同的时间时不动"""
+        self._discard_cancelled()
+        if not self._heap:
+            return
+        when = self._heap[0].when
+        if self._timer is not None:
+            if self._timer_when <= when:
+                return
+            self._timer.cancel()
+        self._timer = self._loop.call_at(when, self._fire)
+        self._timer_when = when
+
+    def _fire(self):
+        self._timer = None
+        self._timer_when = None
+        heap = self._heap
+        now = self._loop.time()
+        while heap and heap[0].when <= now:
+            entry = heapq.heappop(heap)
+            if entry.cancelled:
+                continue
+            del self._entries[entry.key]
+            group = entry.key[0] if isinstance(entry.key, tuple) and entry.key else ""
+            deadlines_fired.labels(str(group)).inc()
+            deadline_lateness.observe(now - entry.when)
+            self._run(entry)
+        deadlines_pending.set(len(self._entries))
+        self._arm()
+
+    def _run(self, entry: _Entry):
+        try:
+            result = entry.callback(*entry.args)
+        except Exception:
+            logger.exception("截止时间 {} 的回调出错", entry.key)
+            return
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(lambda t, key=entry.key: self._task_done(key, t))
+
+    def _task_done(self, key: Hashable, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).error("截止时间 {} 的回调出错", key)
+
+
+class PluginDeadlines:
+    """一个插件的截止时间，键加上插件名作为前缀，插件禁用时全部取消"""
+
+    def __init__(self, scheduler: DeadlineScheduler, owner: str):
+        self.scheduler = scheduler
+        self.owner = owner
+        self._keys: Set[Hashable] = set()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return (self.owner, key) in self.scheduler
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable, *args) -> None:
+        """在delay秒后调用callback(*args)，键已有等待中的回调时替换它"""
+        self._keys.add(key)
+        self.scheduler.schedule((self.owner, key), delay, self._fire, key, callback, args)
+
+    def reschedule(self, key: Hashable, delay: float) -> bool:
+        """把键的回调推迟（或提前）到delay秒后"""
+        return self.scheduler.reschedule((self.owner, key), delay)
+
+    def cancel(self, key: Hashable) -> bool:
+        """取消键的回调"""
+        self._keys.discard(key)
+        return self.scheduler.cancel((self.owner, key))
+
+    def remaining(self, key: Hashable) -> Optional[float]:
+        return self.scheduler.remaining((self.owner, key))
+
+    def cancel_all(self) -> int:
+        """取消插件所有等待中的回调，返回取消的数量"""
+        cancelled = sum(self.scheduler.cancel((self.owner, key)) for key in self._keys)
+        self._keys.clear()
+        return cancelled
+
+    def _fire(self, key: Hashable, callback: Callable, args: tuple) -> Any:
+        self._keys.discard(key)
+        return callback(*args)
+
+
+deadline_scheduler = DeadlineScheduler()
@@ -57,6 +57,23 @@ def remove_job_safe(scheduler: AsyncIOScheduler, job_id: str):
         pass
 
 
+def handler_timeout(seconds: float):
+    """
+    设置事件处理函数的超时时间（秒），覆盖[Profiler]中的配置，0表示不限制
+
+    例子:
+
+    - @on_text_message
+      @handler_timeout(120)
+    """
+
+    def decorator(func):
+        setattr(func, '_timeout', seconds)
+        return func
+
+    return decorator
+
+
 def on_text_message(priority=50):
     """文本消息装饰器"""
 
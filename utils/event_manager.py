@@ -1,6 +1,9 @@
 import copy
 from typing import Callable, Dict, List
 
+from utils.profiler import profiler
+from utils.tracing import tracer
+
 
 class EventManager:
     _handlers: Dict[str, List[tuple[Callable, object, int]]] = {}
@@ -32,7 +35,10 @@ class EventManager:
             handler_args = (api_client, copy.deepcopy(message))
             new_kwargs = {k: copy.deepcopy(v) for k, v in kwargs.items()}
 
-            result = await handler(*handler_args, **new_kwargs)
+            # 记录耗时，超时的处理函数返回None，继续执行后续处理函数
+            with tracer.span(f"{type(instance).__name__}.{handler.__name__}", **{"xybot.event": event_type}) as span:
+                result = await profiler.run(handler, instance, event_type, *handler_args, **new_kwargs)
+                span.set_attribute("xybot.handler_result", str(result))
 
             if isinstance(result, bool):
                 # True 继续执行 False 停止执行
@@ -0,0 +1,372 @@
+"""
+插件共用的HTTP客户端
+所有插件共用一个连接池（按主机限制连接数）和DNS缓存，幂等请求失败时按指数退避重试，
+GET请求的响应按Cache-Control/ETag或插件指定的缓存时间缓存，缓存键包括地址和插件传入的请求头，
+同一地址、相同请求头的并发GET请求只发送一次，并按主机记录请求耗时、状态码、重试和缓存命中情况。
+很多接口出错时也返回200，可以用cache_if检查响应内容，不通过的响应不会被缓存
+
+用法（插件中）:
+    resp = await self.http.get(url, params=params, cache_ttl=60, cache_if=json_field("code", 200))
+    data = await resp.json()
+"""
+
+import asyncio
+import hashlib
+import json as jsonlib
+import random
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+import aiohttp
+from loguru import logger
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from utils.metrics import metrics
+from utils.singleflight import SingleFlight
+from utils.tracing import tracer
+
+request_duration = metrics.histogram("xybot_http_request_seconds", "插件HTTP请求耗时", ("host",))
+requests_total = metrics.counter("xybot_http_requests_total", "插件HTTP请求数", ("host", "status"))
+request_retries = metrics.counter("xybot_http_retries_total", "插件HTTP请求重试次数", ("host",))
+cache_results = metrics.counter("xybot_http_cache_total", "插件HTTP响应缓存查询结果", ("host", "result"))
+
+# 这些状态码说明服务端暂时不可用，幂等请求可以重试
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 不作为缓存键的请求头，插件随机选择的User-Agent不应让同一个请求的缓存分成多份
+UNKEYED_HEADERS = {"user-agent"}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+_MAX_AGE = re.compile(r"(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*(\d+)", re.IGNORECASE)
+
+
+class HttpResponse:
+    """已读取完的响应，可以被缓存和多次读取"""
+
+    def __init__(self, status: int, headers: CIMultiDictProxy, body: bytes, url: URL, from_cache: bool = False):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+        self.from_cache = from_cache
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    @property
+    def charset(self) -> str:
+        match = re.search(r"charset=([\w-]+)", self.headers.get("Content-Type", ""), re.IGNORECASE)
+        return match.group(1) if match else "utf-8"
+
+    async def read(self) -> bytes:
+        return self.body
+
+    async def text(self, encoding: Optional[str] = None) -> str:
+        return self.body.decode(encoding or self.charset, errors="replace")
+
+    async def json(self, content_type: Optional[str] = None, **kwargs) -> Any:
+        """解析JSON，不检查Content-Type（很多第三方接口返回的Content-Type不规范）"""
+        return jsonlib.loads(await self.text(), **kwargs)
+
+    def json_nowait(self) -> Any:
+        """同步解析JSON，供cache_if使用，解析失败时返回None"""
+        try:
+            return jsonlib.loads(self.body.decode(self.charset, errors="replace"))
+        except ValueError:
+            return None
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise aiohttp.ClientResponseError(None, (), status=self.status, message=f"{self.url} 返回 {self.status}",
+                                              headers=self.headers)
+
+
+CachePredicate = Callable[[HttpResponse], bool]
+
+
+def json_field(name: str, *accepted: Any) -> CachePredicate:
+    """
+    cache_if用：JSON响应中name字段的值为accepted之一时才缓存，不传accepted时字段非空即可
+
+    用法:
+        await http.get(url, cache_ttl=600, cache_if=json_field("code", "200"))
+        await http.get(url, cache_ttl=600, cache_if=json_field("content"))
+    """
+
+    def predicate(response: HttpResponse) -> bool:
+        data = response.json_nowait()
+        if not isinstance(data, dict):
+            return False
+        return data.get(name) in accepted if accepted else bool(data.get(name))
+
+    return predicate
+
+
+def has_content_type(*prefixes: str) -> CachePredicate:
+    """cache_if用：Content-Type以prefixes之一开头时才缓存，例如接口出错时返回的是JSON而不是图片"""
+
+    def predicate(response: HttpResponse) -> bool:
+        return response.headers.get("Content-Type", "").lower().startswith(prefixes)
+
+    return predicate
+
+
+def any_of(*predicates: CachePredicate) -> CachePredicate:
+    """cache_if用：满足任一条件时缓存，例如接口可能返回图片，也可能返回带code的JSON"""
+
+    def predicate(response: HttpResponse) -> bool:
+        return any(check(response) for check in predicates)
+
+    return predicate
+
+
+@dataclass
+class _CacheEntry:
+    response: HttpResponse
+    expires: float
+    etag: str = ""
+    last_modified: str = ""
+    size: int = field(default=0)
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires
+
+    @property
+    def revalidatable(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+class ResponseCache:
+    """按请求URL缓存GET响应，超过条目数或总大小时淘汰最久未使用的响应"""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: _CacheEntry):
+        entry.size = len(entry.response.body)
+        if entry.size > self.max_bytes:
+            return
+        self.pop(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.size
+
+    def pop(self, key: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+
+class HttpClient:
+    """插件共用的HTTP客户端，使用模块级单例 http_client"""
+
+    def __init__(self):
+        self.limit = 100
+        self.limit_per_host = 10
+        self.dns_cache_ttl = 300
+        self.timeout = 20.0
+        self.retries = 2
+        self.backoff = 0.5
+        self.max_backoff = 8.0
+        self.cache = ResponseCache()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flights = SingleFlight("http")
+
+    def configure(self, config: Dict[str, Any]):
+        """
+        读取main_config.toml中的[HttpClient]配置
+
+        Args:
+            config: 配置字典
+        """
+        self.limit = config.get("limit", self.limit)
+        self.limit_per_host = config.get("limit-per-host", self.limit_per_host)
+        self.dns_cache_ttl = config.get("dns-cache-ttl", self.dns_cache_ttl)
+        self.timeout = config.get("timeout", self.timeout)
+        self.retries = config.get("retries", self.retries)
+        self.backoff = config.get("backoff", self.backoff)
+        self.max_backoff = config.get("max-backoff", self.max_backoff)
+        self.cache = ResponseCache(config.get("cache-entries", 512),
+                                   config.get("cache-size-mb", 64) * 1024 * 1024)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """共用的ClientSession，需要流式读取响应时可以直接使用，超时时间需要自己指定"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.dns_cache_ttl)
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[tracer.http_trace_config()])
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get(self, url, **kwargs) -> HttpResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs) -> HttpResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def head(self, url, **kwargs) -> HttpResponse:
+        return await self.request("HEAD", url, **kwargs)
+
+    async def request(self, method: str, url, *, params: Optional[Dict[str, Any]] = None,
+                      headers: Optional[Dict[str, str]] = None, cache_ttl: Optional[float] = None,
+                      cache_if: Optional[CachePredicate] = None, retries: Optional[int] = None,
+                      timeout: Optional[float] = None, **kwargs) -> HttpResponse:
+        """
+        发送请求并读取完整响应
+
+        Args:
+            method: 请求方法
+            url: 请求地址
+            params: 查询参数
+            headers: 请求头
+            cache_ttl: 响应缓存时间（秒），为空时按响应的Cache-Control缓存，为0时不缓存，只对GET请求生效
+            cache_if: 检查200响应是否可以缓存，返回False时不缓存（例如接口在响应内容中返回错误码）
+            retries: 失败重试次数，为空时幂等请求使用默认次数，其它请求不重试
+            timeout: 超时时间（秒），为空时使用默认超时
+            **kwargs: 传给aiohttp的其它参数，例如data、json、proxy、ssl
+
+        Returns:
+            HttpResponse: 响应
+        """
+        method = method.upper()
+        url = URL(url)
+        if params:
+            url = url.update_query({k: str(v) for k, v in params.items()})
+        host = url.host or ""
+        headers = CIMultiDict(headers or {})
+
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout or self.timeout)
+
+        if method != "GET" or cache_ttl == 0:
+            return await self._send(method, url, host, headers, retries, kwargs)
+
+        key = self._cache_key(url, headers)
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            cache_results.labels(host, "hit").inc()
+            return entry.response
+        # 同一个地址的并发请求只发送一次
+        return await self._flights.do(key, self._fetch, key, url, host, headers, cache_ttl, cache_if, retries, kwargs)
+
+    @staticmethod
+    def _cache_key(url: URL, headers: CIMultiDict) -> str:
+        """缓存键：地址加上插件传入的请求头（例如Authorization），请求头不同的请求不会共用响应"""
+        items = sorted((name.lower(), value) for name, value in headers.items() if name.lower() not in UNKEYED_HEADERS)
+        if not items:
+            return str(url)
+        return f"{url}#{hashlib.sha256(repr(items).encode()).hexdigest()[:32]}"
+
+    async def _fetch(self, key: str, url: URL, host: str, headers: CIMultiDict, cache_ttl: Optional[float],
+                     cache_if: Optional[CachePredicate], retries: int, kwargs: Dict[str, Any]) -> HttpResponse:
+        """发送可缓存的GET请求，缓存过期但有ETag/Last-Modified时发送条件请求"""
+        entry = self.cache.get(key)
+        if entry is not None and entry.revalidatable:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        response = await self._send("GET", url, host, headers, retries, kwargs)
+
+        if entry is not None and response.status == 304:
+            cache_results.labels(host, "revalidated").inc()
+            entry.expires = time.monotonic() + self._ttl(response.headers, cache_ttl)
+            return entry.response
+        cache_results.labels(host, "miss").inc()
+        if response.status == 200 and cache_if is not None and not cache_if(response):
+            cache_results.labels(host, "rejected").inc()
+            self.cache.pop(key)
+        elif response.status == 200:
+            ttl = self._ttl(response.headers, cache_ttl)
+            etag = response.headers.get("ETag", "")
+            last_modified = response.headers.get("Last-Modified", "")
+            if ttl > 0 or etag or last_modified:
+                self.cache.put(key, _CacheEntry(HttpResponse(response.status, response.headers, response.body,
+                                                             response.url, from_cache=True),
+                                                time.monotonic() + ttl, etag, last_modified))
+            else:
+                self.cache.pop(key)
+        return response
+
+    async def _send(self, method: str, url: URL, host: str, headers: CIMultiDict, retries: int,
+                    kwargs: Dict[str, Any]) -> HttpResponse:
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            status = "error"
+            response = None
+            try:
+                async with self.session.request(method, url, headers=headers, **kwargs) as resp:
+                    body = await resp.read()
+                    status = str(resp.status)
+                    response = HttpResponse(resp.status, resp.headers, body, resp.url)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    raise
+                logger.debug("请求 {} 失败，准备重试: {}", url, e)
+            finally:
+                request_duration.labels(host).observe(time.perf_counter() - start)
+                requests_total.labels(host, status).inc()
+
+            if response is not None and (response.status not in RETRY_STATUSES or attempt >= retries):
+                return response
+
+            request_retries.labels(host).inc()
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def _backoff(self, attempt: int, response: Optional[HttpResponse]) -> float:
+        """重试前的等待时间，优先使用Retry-After，否则为带随机抖动的指数退避"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _ttl(headers: CIMultiDictProxy, cache_ttl: Optional[float]) -> float:
+        """缓存时间，插件指定的时间优先，否则使用Cache-Control的max-age"""
+        if cache_ttl is not None:
+            return cache_ttl
+        cache_control = headers.get("Cache-Control", "")
+        if "no-store" in cache_control or "no-cache" in cache_control or "private" in cache_control:
+            return 0
+        match = _MAX_AGE.search(cache_control)
+        return float(match.group(1)) if match else 0
+
+
+http_client = HttpClient()
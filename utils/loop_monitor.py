@@ -0,0 +1,169 @@
+"""
+事件循环延迟监控
+定时采样事件循环的调度延迟并导出分位数；调试模式下由独立线程检测
+事件循环被阻塞的情况，记录当时正在运行的协程和堆栈
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from utils.metrics import metrics
+from utils.profiler import format_thread_stack
+
+loop_lag = metrics.histogram("xybot_loop_lag_seconds", "事件循环调度延迟",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+loop_lag_quantile = metrics.gauge("xybot_loop_lag_quantile_seconds", "最近一段时间内事件循环调度延迟的分位数",
+                                  ("quantile",))
+loop_blocked = metrics.counter("xybot_loop_blocked_total", "事件循环被阻塞超过阈值的次数")
+
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def _describe_task(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "<无>"
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or repr(coro)
+    return f"{task.get_name()} ({name})"
+
+
+class LoopMonitor:
+    """事件循环延迟监控器"""
+
+    def __init__(self):
+        self.enabled = True
+        self.interval = 0.5
+        self.window = 600
+        self.debug = False
+        self.block_threshold = 0.1
+
+        self._samples: Deque[float] = deque(maxlen=self.window)
+        self._incidents: Deque[Dict[str, Any]] = deque(maxlen=50)
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._beat_handle: Optional[asyncio.TimerHandle] = None
+        self._detector: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        for q in QUANTILES:
+            loop_lag_quantile.labels(self._quantile_label(q)).set_function(lambda q=q: self.quantile(q))
+
+    @staticmethod
+    def _quantile_label(q: float) -> str:
+        return "max" if q == 1.0 else str(q)
+
+    def configure(self, config: Dict[str, Any]):
+        """
+        从配置加载设置
+
+        Args:
+            config: main_config.toml中的[LoopMonitor]配置
+        """
+        self.enabled = config.get("enabled", True)
+        self.interval = config.get("sample-interval", 0.5)
+        self.window = config.get("window", 600)
+        self.debug = config.get("debug", False)
+        self.block_threshold = config.get("block-threshold-ms", 100) / 1000
+        self._samples = deque(self._samples, maxlen=self.window)
+
+    def start(self):
+        """启动采样任务，调试模式下同时启动阻塞检测线程，需在事件循环中调用"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.create_task(self._sample())
+
+        if self.debug:
+            self._stop.clear()
+            self._beat()
+            self._detector = threading.Thread(target=self._detect, name="loop-block-detector", daemon=True)
+            self._detector.start()
+
+    async def stop(self):
+        """停止监控"""
+        self._stop.set()
+        if self._beat_handle is not None:
+            self._beat_handle.cancel()
+            self._beat_handle = None
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._samples.append(lag)
+            loop_lag.observe(lag)
+
+    def quantile(self, q: float) -> float:
+        """最近窗口内调度延迟的分位数（秒）"""
+        return _quantile(sorted(self._samples), q)
+
+    def _beat(self):
+        """在事件循环中定时更新心跳"""
+        self._last_beat = time.perf_counter()
+        if not self._stop.is_set():
+            self._beat_handle = self._loop.call_later(self.block_threshold / 4, self._beat)
+
+    def _detect(self):
+        """独立线程中检查心跳，超过阈值说明事件循环被阻塞"""
+        reported_beat = None
+        incident = None
+        check_interval = self.block_threshold / 4
+        while not self._stop.wait(check_interval):
+            last_beat = self._last_beat
+            if incident is not None and last_beat != reported_beat:
+                # 事件循环已恢复，更新实际阻塞时长
+                incident["blocked_ms"] = round((last_beat - reported_beat) * 1000, 1)
+                incident = None
+
+            blocked = time.perf_counter() - last_beat
+            if blocked < self.block_threshold or last_beat == reported_beat:
+                continue
+
+            reported_beat = last_beat
+            task = asyncio.tasks._current_tasks.get(self._loop)
+            incident = {
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "blocked_ms": round(blocked * 1000, 1),
+                "task": _describe_task(task),
+                "stack": format_thread_stack(self._loop_thread_id)
+            }
+            self._incidents.append(incident)
+            loop_blocked.inc()
+            logger.warning("事件循环已被阻塞 {} 毫秒，当前任务: {}，堆栈:\n{}",
+                           incident["blocked_ms"], incident["task"], incident["stack"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前延迟分位数和最近的阻塞记录"""
+        samples = sorted(self._samples)
+        return {
+            "interval": self.interval,
+            "samples": len(samples),
+            "lag": {self._quantile_label(q): _quantile(samples, q) for q in QUANTILES},
+            "debug": self.debug,
+            "block_threshold_ms": self.block_threshold * 1000,
+            "incidents": list(self._incidents)
+        }
+
+
+loop_monitor = LoopMonitor()
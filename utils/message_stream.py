@@ -0,0 +1,373 @@
+"""
+分布式消息处理
+接收进程登录微信并预处理消息，把要交给插件的事件写入Redis Stream；
+多个工作进程通过消费者组读取事件并运行插件，回复通过共享限速器发送
+
+消息流按会话（接收账号和FromWxid）分成多个分区，分区按编号分配给各工作进程，每个分区同一时间
+只由一个工作进程顺序处理，保证同一会话内的消息按顺序处理。事件处理完才会确认(XACK)。
+
+工作进程定时写入带TTL的心跳键。某个工作进程的心跳超过claim-idle-ms没有更新时，它的分区由
+下一个存活的工作进程接管：认领它长时间未确认的事件(XAUTOCLAIM)并继续读取新事件；它重启后
+先处理自己仍未确认的事件，其它工作进程在下一次心跳检查时交还分区。交接的短时间内同一分区的
+事件可能被两个工作进程处理，事件处理保证至少一次而不是恰好一次
+"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set, Tuple
+
+from loguru import logger
+
+from utils.event_manager import EventManager
+from utils.metrics import metrics
+
+events_published = metrics.counter("xybot_stream_events_published_total", "写入消息流的事件数", ("event",))
+events_consumed = metrics.counter("xybot_stream_events_consumed_total", "工作进程处理的事件数", ("event", "result"))
+events_claimed = metrics.counter("xybot_stream_events_claimed_total", "从其它消费者认领的超时未确认事件数")
+partitions_owned = metrics.gauge("xybot_stream_partitions_owned", "当前工作进程正在处理的分区数（包括接管的分区）")
+event_lag = metrics.histogram("xybot_stream_event_lag_seconds", "事件从写入消息流到开始处理的延迟",
+                              buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+# 原子地预约下一个发送时间，返回需要等待的秒数
+_RESERVE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local next_slot = tonumber(redis.call('GET', KEYS[1]) or '0')
+if next_slot < now then
+    next_slot = now
+end
+redis.call('SET', KEYS[1], tostring(next_slot + interval), 'PX', math.ceil(interval * 1000) + 60000)
+return tostring(next_slot - now)
+"""
+
+
+@dataclass
+class StreamConfig:
+    """main_config.toml中的[Cluster]配置"""
+    mode: str = "standalone"
+    redis_url: str = ""
+    prefix: str = "xybot:events"
+    partitions: int = 8
+    workers: int = 1
+    worker_id: int = 0
+    maxlen: int = 100000
+    batch: int = 16
+    block_ms: int = 1000
+    claim_idle_ms: int = 60000
+    send_interval: float = 1.0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "StreamConfig":
+        """读取配置，环境变量XYBOT_MODE和XYBOT_WORKER_ID优先"""
+        return cls(
+            mode=os.environ.get("XYBOT_MODE", config.get("mode", "standalone")),
+            redis_url=config.get("redis-url", ""),
+            prefix=config.get("stream-prefix", "xybot:events"),
+            partitions=config.get("partitions", 8),
+            workers=config.get("workers", 1),
+            worker_id=int(os.environ.get("XYBOT_WORKER_ID", config.get("worker-id", 0))),
+            maxlen=config.get("stream-maxlen", 100000),
+            batch=config.get("batch", 16),
+            block_ms=config.get("block-ms", 1000),
+            claim_idle_ms=config.get("claim-idle-ms", 60000),
+            send_interval=config.get("send-interval", 1.0),
+        )
+
+    @property
+    def group(self) -> str:
+        return f"{self.prefix}:workers"
+
+    @property
+    def accounts_key(self) -> str:
+        return f"{self.prefix}:accounts"
+
+    def send_key(self, wxid: str) -> str:
+        """账号的发送限速键，每个账号单独限速"""
+        return f"{self.prefix}:next-send:{wxid}"
+
+    def stream(self, partition: int) -> str:
+        return f"{self.prefix}:{partition}"
+
+    def heartbeat_key(self, worker_id: int) -> str:
+        """工作进程的心跳键，过期表示该工作进程已退出"""
+        return f"{self.prefix}:alive:{worker_id}"
+
+    def owner(self, partition: int, alive: Set[int]) -> int:
+        """分区当前由哪个工作进程处理：分配到的工作进程存活时由它处理，否则由之后第一个存活的工作进程接管"""
+        assigned = partition % self.workers
+        for offset in range(self.workers):
+            worker_id = (assigned + offset) % self.workers
+            if worker_id in alive:
+                return worker_id
+        return assigned
+
+
+def partition_for(conversation: str, partitions: int) -> int:
+    """会话所在的分区，同一会话总是落在同一分区"""
+    return zlib.crc32(conversation.encode("utf-8")) % partitions
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def _decode(value: Dict[str, Any]) -> Any:
+    if len(value) == 1 and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+def dumps_message(message: Dict[str, Any]) -> str:
+    """序列化消息，bytes内容（例如语音）会转换为base64"""
+    return json.dumps(message, ensure_ascii=False, default=_encode)
+
+
+def loads_message(data: str) -> Dict[str, Any]:
+    return json.loads(data, object_hook=_decode)
+
+
+def create_redis(config: StreamConfig, api_config: Dict[str, Any]):
+    """
+    创建Redis客户端，未配置redis-url时使用WechatAPIServer的Redis配置
+
+    Args:
+        config: 消息流配置
+        api_config: main_config.toml中的[WechatAPIServer]配置
+    """
+    import redis.asyncio as redis
+
+    if config.redis_url:
+        return redis.from_url(config.redis_url, decode_responses=True)
+    return redis.Redis(host=api_config.get("redis-host", "127.0.0.1"),
+                       port=api_config.get("redis-port", 6379),
+                       password=api_config.get("redis-password", "") or None,
+                       db=api_config.get("redis-db", 0),
+                       decode_responses=True)
+
+
+class RedisRateLimiter:
+    """多个进程共用的发送限速器，保证同一账号两次发送之间至少间隔interval秒"""
+
+    def __init__(self, redis_client, key: str, interval: float):
+        self.redis = redis_client
+        self.key = key
+        self.interval = interval
+        self._reserve = redis_client.register_script(_RESERVE_SCRIPT)
+
+    async def acquire(self):
+        """预约一个发送时间并等待到该时间"""
+        delay = float(await self._reserve(keys=[self.key], args=[self.interval]))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class StreamPublisher:
+    """接收进程使用，把预处理后的事件写入对应分区的消息流"""
+
+    def __init__(self, redis_client, config: StreamConfig):
+        self.redis = redis_client
+        self.config = config
+
+    async def publish_profile(self, wxid: str, nickname: str, alias: str, phone: str):
+        """发布机器人账号信息，工作进程启动时读取，多账号时每个账号发布一次"""
+        await self.redis.hset(self.config.accounts_key, wxid, json.dumps({
+            "wxid": wxid or "", "nickname": nickname or "", "alias": alias or "", "phone": phone or ""
+        }, ensure_ascii=False))
+
+    async def publish(self, event_type: str, message: Dict[str, Any]) -> str:
+        """
+        写入事件
+
+        Returns:
+            事件ID
+        """
+        conversation = f"{message.get('Account', '')}:{message.get('FromWxid', '')}"
+        partition = partition_for(conversation, self.config.partitions)
+        entry_id = await self.redis.xadd(self.config.stream(partition), {
+            "event": event_type,
+            "message": dumps_message(message),
+            "ts": repr(time.time()),
+        }, maxlen=self.config.maxlen, approximate=True)
+        events_published.labels(event_type).inc()
+        return entry_id
+
+
+class StreamWorker:
+    """工作进程使用，消费分配给自己的分区并运行插件"""
+
+    def __init__(self, redis_client, config: StreamConfig):
+        """
+        Args:
+            redis_client: Redis客户端
+            config: 消息流配置
+        """
+        self.redis = redis_client
+        self.config = config
+        self.bots: Dict[str, Any] = {}
+        self.consumer = f"worker-{config.worker_id}"
+        self._tasks: List[asyncio.Task] = []
+        # 启动时先假设所有工作进程都存活，第一次心跳检查后再接管已退出的工作进程的分区
+        self._alive: Set[int] = set(range(config.workers)) | {config.worker_id}
+
+    @property
+    def partitions(self) -> List[int]:
+        """分配给当前工作进程的分区"""
+        return [p for p in range(self.config.partitions) if p % self.config.workers == self.config.worker_id]
+
+    @property
+    def owned_partitions(self) -> List[int]:
+        """当前工作进程正在处理的分区，包括从已退出的工作进程接管的分区"""
+        return [p for p in range(self.config.partitions)
+                if self.config.owner(p, self._alive) == self.config.worker_id]
+
+    def owns(self, partition: int) -> bool:
+        return self.config.owner(partition, self._alive) == self.config.worker_id
+
+    def add_bot(self, bot):
+        """添加用于发送回复的WechatAPIClient，事件按消息的Account字段交给对应账号处理"""
+        self.bots[bot.wxid] = bot
+
+    async def wait_profiles(self, interval: float = 2) -> List[Dict[str, str]]:
+        """等待接收进程登录并发布账号信息"""
+        while True:
+            profiles = await self.redis.hgetall(self.config.accounts_key)
+            if profiles:
+                return [json.loads(profile) for profile in profiles.values()]
+            logger.info("等待接收进程登录")
+            await asyncio.sleep(interval)
+
+    async def start(self):
+        """创建消费者组并开始消费，每个分区一个任务，不属于自己的分区只在接管时读取"""
+        await self._heartbeat_once()
+        for partition in range(self.config.partitions):
+            stream = self.config.stream(partition)
+            try:
+                await self.redis.xgroup_create(stream, self.config.group, id="0", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self._tasks.append(asyncio.create_task(self._consume(partition), name=f"stream-{partition}"))
+        self._tasks.append(asyncio.create_task(self._heartbeat(), name="stream-heartbeat"))
+        logger.success("工作进程 {} 开始处理分区 {}", self.consumer, self.owned_partitions)
+
+    async def stop(self):
+        """停止消费，未确认的事件会在重启后重新处理"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self.redis.delete(self.config.heartbeat_key(self.config.worker_id))
+        except Exception as e:
+            logger.warning("删除工作进程心跳失败: {}", e)
+
+    async def run(self):
+        """开始消费并一直运行"""
+        await self.start()
+        await asyncio.gather(*self._tasks)
+
+    async def _heartbeat_once(self):
+        """刷新自己的心跳，并读取其它工作进程的心跳，分区归属随之变化"""
+        ttl = max(self.config.claim_idle_ms, 1000)
+        await self.redis.set(self.config.heartbeat_key(self.config.worker_id), str(time.time()), px=ttl)
+        keys = [self.config.heartbeat_key(worker_id) for worker_id in range(self.config.workers)]
+        values = await self.redis.mget(keys)
+        alive = {worker_id for worker_id, value in enumerate(values) if value is not None}
+        alive.add(self.config.worker_id)
+
+        before = set(self.owned_partitions)
+        self._alive = alive
+        after = set(self.owned_partitions)
+        if after - before:
+            logger.warning("工作进程 {} 接管分区 {}", self.consumer, sorted(after - before))
+        if before - after:
+            logger.info("工作进程 {} 交还分区 {}", self.consumer, sorted(before - after))
+        partitions_owned.set(len(after))
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(max(self.config.claim_idle_ms, 1000) / 4000)
+            try:
+                await self._heartbeat_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("刷新工作进程心跳失败: {}", e)
+
+    async def _consume(self, partition: int):
+        stream = self.config.stream(partition)
+        # 先处理上次退出前已读取但未确认的事件
+        last_id = "0"
+        next_claim = 0.0
+        while True:
+            try:
+                if not self.owns(partition):
+                    # 分区属于其它存活的工作进程，等待接管
+                    next_claim = 0.0
+                    await asyncio.sleep(self.config.block_ms / 1000)
+                    continue
+
+                if time.monotonic() >= next_claim:
+                    await self._claim_stale(stream)
+                    next_claim = time.monotonic() + self.config.claim_idle_ms / 2000
+
+                entries = await self._read(stream, last_id)
+                if last_id == "0" and not entries:
+                    last_id = ">"
+                    continue
+                for entry_id, fields in entries:
+                    await self._handle(stream, entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("处理消息流 {} 失败: {}", stream, e)
+                await asyncio.sleep(1)
+
+    async def _read(self, stream: str, last_id: str) -> List[Tuple[str, Dict[str, str]]]:
+        block = self.config.block_ms if last_id == ">" else None
+        response = await self.redis.xreadgroup(self.config.group, self.consumer, {stream: last_id},
+                                               count=self.config.batch, block=block)
+        if not response:
+            return []
+        return [(entry_id, fields) for entry_id, fields in response[0][1] if fields]
+
+    async def _claim_stale(self, stream: str):
+        """认领长时间未确认的事件（例如接管的分区中已退出的工作进程读取过的事件），并按顺序处理"""
+        start_id = "0-0"
+        while True:
+            result = await self.redis.xautoclaim(stream, self.config.group, self.consumer,
+                                                 min_idle_time=self.config.claim_idle_ms, start_id=start_id,
+                                                 count=self.config.batch)
+            start_id, entries = result[0], result[1]
+            for entry_id, fields in entries:
+                if fields:
+                    events_claimed.inc()
+                    await self._handle(stream, entry_id, fields)
+                else:
+                    await self.redis.xack(stream, self.config.group, entry_id)
+            if start_id in ("0-0", b"0-0") or not entries:
+                return
+
+    async def _handle(self, stream: str, entry_id: str, fields: Dict[str, str]):
+        event_type = fields.get("event", "")
+        result = "success"
+        try:
+            event_lag.observe(max(0.0, time.time() - float(fields.get("ts", time.time()))))
+            message = loads_message(fields["message"])
+            bot = self.bots.get(message.get("Account")) or next(iter(self.bots.values()))
+            await EventManager.emit(event_type, bot, message)
+        except Exception as e:
+            # 插件抛出的异常重试通常也不会成功，记录后确认，避免阻塞同一分区的后续消息
+            result = "error"
+            logger.exception("工作进程处理事件 {} ({}) 失败: {}", entry_id, event_type, e)
+        finally:
+            events_consumed.labels(event_type, result).inc()
+        await self.redis.xack(stream, self.config.group, entry_id)
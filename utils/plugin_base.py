@@ -2,7 +2,9 @@ from abc import ABC
 
 from loguru import logger
 
+from .deadline import PluginDeadlines, deadline_scheduler
 from .decorators import scheduler, add_job_safe, remove_job_safe
+from .http_client import HttpClient, http_client
 
 
 class PluginBase(ABC):
@@ -16,6 +18,19 @@ class PluginBase(ABC):
     def __init__(self):
         self.enabled = False
         self._scheduled_jobs = set()
+        self._deadlines = None
+
+    @property
+    def http(self) -> HttpClient:
+        """所有插件共用的HTTP客户端，带连接池、重试和响应缓存"""
+        return http_client
+
+    @property
+    def deadlines(self) -> PluginDeadlines:
+        """插件的超时回调，所有插件共用一个定时器，插件禁用时自动取消"""
+        if self._deadlines is None:
+            self._deadlines = PluginDeadlines(deadline_scheduler, self.__class__.__name__)
+        return self._deadlines
 
     async def on_enable(self, bot=None):
         """插件启用时调用"""
@@ -42,6 +57,10 @@ class PluginBase(ABC):
         logger.info("已卸载定时任务: {}", self._scheduled_jobs)
         self._scheduled_jobs.clear()
 
+        # 取消等待中的超时回调
+        if self._deadlines is not None and self._deadlines.cancel_all():
+            logger.info("已取消插件 {} 等待中的超时回调", self.__class__.__name__)
+
     async def async_init(self):
         """插件异步初始化"""
         return
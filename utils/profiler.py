@@ -0,0 +1,257 @@
+"""
+插件事件处理函数性能分析
+记录每个处理函数的耗时和CPU时间，支持超时控制，并由看门狗线程
+在处理函数长时间阻塞事件循环时记录堆栈
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.metrics import metrics
+
+handler_duration = metrics.histogram("xybot_handler_duration_seconds", "插件事件处理函数耗时",
+                                     ("plugin", "handler", "event"))
+handler_cpu = metrics.histogram("xybot_handler_cpu_seconds", "插件事件处理函数占用事件循环线程的CPU时间",
+                                ("plugin", "handler", "event"))
+handler_errors = metrics.counter("xybot_handler_errors_total", "插件事件处理函数抛出异常的次数",
+                                 ("plugin", "handler", "event"))
+handler_timeouts = metrics.counter("xybot_handler_timeouts_total", "插件事件处理函数超时的次数",
+                                   ("plugin", "handler", "event"))
+handler_blocking = metrics.counter("xybot_handler_blocking_total", "插件事件处理函数阻塞事件循环超过阈值的次数",
+                                   ("plugin", "handler"))
+
+Label = Tuple[str, str, str]
+
+
+def format_thread_stack(thread_id: int, limit: int = 30) -> str:
+    """获取指定线程当前的调用栈"""
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return "<线程不存在>"
+    return "".join(traceback.format_stack(frame, limit=limit))
+
+
+@dataclass
+class HandlerStats:
+    """单个处理函数的累计统计"""
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    wall_max: float = 0.0
+    step_max: float = 0.0
+    errors: int = 0
+    timeouts: int = 0
+    blocking: int = 0
+
+
+class _ProfiledCoroutine:
+    """逐步驱动协程，统计每一步在事件循环线程上占用的CPU时间和最长单步耗时"""
+
+    __slots__ = ("_coro", "_profiler", "_label", "cpu", "step_max")
+
+    def __init__(self, coro, profiler: "HandlerProfiler", label: Label):
+        self._coro = coro
+        self._profiler = profiler
+        self._label = label
+        self.cpu = 0.0
+        self.step_max = 0.0
+
+    def __await__(self):
+        coro = self._coro
+        profiler = self._profiler
+        value, error = None, None
+        while True:
+            cpu_start = time.thread_time()
+            step_start = time.perf_counter()
+            profiler._enter_step(self._label, step_start)
+            try:
+                if error is not None:
+                    yielded = coro.throw(error)
+                else:
+                    yielded = coro.send(value)
+            except StopIteration as e:
+                return e.value
+            finally:
+                profiler._exit_step()
+                self.cpu += time.thread_time() - cpu_start
+                step = time.perf_counter() - step_start
+                if step > self.step_max:
+                    self.step_max = step
+
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class HandlerProfiler:
+    """插件事件处理函数的性能分析器"""
+
+    def __init__(self):
+        self.enabled = True
+        self.default_timeout: float = 0
+        self.plugin_timeouts: Dict[str, float] = {}
+        self.watchdog_threshold: float = 0.5
+        self.watchdog_interval: float = 0.1
+
+        self._stats: Dict[Label, HandlerStats] = {}
+        self._active: Optional[Tuple[Label, float]] = None
+        self._reported: Optional[Tuple[Label, float]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def configure(self, config: Dict[str, Any]):
+        """
+        从配置加载设置
+
+        Args:
+            config: main_config.toml中的[Profiler]配置
+        """
+        self.enabled = config.get("enabled", True)
+        self.default_timeout = config.get("handler-timeout", 0)
+        self.plugin_timeouts = dict(config.get("plugin-timeouts", {}))
+        self.watchdog_threshold = config.get("watchdog-threshold", 0.5)
+        self.watchdog_interval = config.get("watchdog-interval", 0.1)
+
+    def timeout_for(self, handler: Callable, plugin: str) -> float:
+        """获取处理函数的超时时间，0表示不限制"""
+        timeout = getattr(handler, "_timeout", None)
+        if timeout is None:
+            timeout = self.plugin_timeouts.get(plugin, self.default_timeout)
+        return timeout or 0
+
+    async def run(self, handler: Callable, instance: object, event_type: str, *args, **kwargs):
+        """
+        执行处理函数并记录耗时
+
+        Returns:
+            处理函数的返回值，超时时返回None
+        """
+        plugin = type(instance).__name__
+        if not self.enabled:
+            return await handler(*args, **kwargs)
+
+        if self._loop_thread_id is None:
+            self._loop_thread_id = threading.get_ident()
+
+        label = (plugin, handler.__name__, event_type)
+        stats = self._stats.get(label)
+        if stats is None:
+            stats = self._stats[label] = HandlerStats()
+
+        profiled = _ProfiledCoroutine(handler(*args, **kwargs), self, label)
+        timeout = self.timeout_for(handler, plugin)
+        start = time.perf_counter()
+        try:
+            if timeout > 0:
+                return await asyncio.wait_for(profiled, timeout)
+            return await profiled
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            handler_timeouts.labels(*label).inc()
+            logger.warning("插件 {} 的处理函数 {} 处理 {} 超时（{}秒），已跳过", plugin, label[1], event_type, timeout)
+            return None
+        except Exception:
+            stats.errors += 1
+            handler_errors.labels(*label).inc()
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += profiled.cpu
+            stats.wall_max = max(stats.wall_max, wall)
+            stats.step_max = max(stats.step_max, profiled.step_max)
+            handler_duration.labels(*label).observe(wall)
+            handler_cpu.labels(*label).observe(profiled.cpu)
+
+    def _enter_step(self, label: Label, started: float):
+        self._active = (label, started)
+
+    def _exit_step(self):
+        self._active = None
+
+    def start_watchdog(self):
+        """启动看门狗线程"""
+        if not self.enabled or self.watchdog_threshold <= 0:
+            return
+        if self._watchdog is not None and self._watchdog.is_alive():
+            return
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="handler-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop_watchdog(self):
+        """停止看门狗线程"""
+        self._stop.set()
+        self._watchdog = None
+
+    def _watch(self):
+        while not self._stop.wait(self.watchdog_interval):
+            active = self._active
+            if active is None or active is self._reported:
+                continue
+            label, started = active
+            blocked = time.perf_counter() - started
+            if blocked < self.watchdog_threshold or self._loop_thread_id is None:
+                continue
+
+            self._reported = active
+            stats = self._stats.get(label)
+            if stats is not None:
+                stats.blocking += 1
+            handler_blocking.labels(label[0], label[1]).inc()
+            logger.warning("插件 {} 的处理函数 {} 已阻塞事件循环 {:.3f} 秒，当前堆栈:\n{}",
+                           label[0], label[1], blocked, format_thread_stack(self._loop_thread_id))
+
+    def ranking(self, by: str = "wall", group: str = "plugin") -> List[Dict[str, Any]]:
+        """
+        按开销排序的插件或处理函数列表
+
+        Args:
+            by: 排序依据，wall/cpu/step_max/calls/errors/timeouts/blocking
+            group: plugin按插件汇总，handler按处理函数列出
+
+        Returns:
+            统计列表，开销最大的在前
+        """
+        rows: Dict[Tuple, Dict[str, Any]] = {}
+        for (plugin, handler, event), stats in list(self._stats.items()):
+            key = (plugin,) if group == "plugin" else (plugin, handler, event)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {"plugin": plugin, "calls": 0, "wall": 0.0, "cpu": 0.0, "wall_max": 0.0,
+                                   "step_max": 0.0, "errors": 0, "timeouts": 0, "blocking": 0}
+                if group != "plugin":
+                    row["handler"] = handler
+                    row["event"] = event
+            row["calls"] += stats.calls
+            row["wall"] += stats.wall
+            row["cpu"] += stats.cpu
+            row["wall_max"] = max(row["wall_max"], stats.wall_max)
+            row["step_max"] = max(row["step_max"], stats.step_max)
+            row["errors"] += stats.errors
+            row["timeouts"] += stats.timeouts
+            row["blocking"] += stats.blocking
+
+        result = list(rows.values())
+        for row in result:
+            row["wall_avg"] = row["wall"] / row["calls"] if row["calls"] else 0.0
+            row["cpu_avg"] = row["cpu"] / row["calls"] if row["calls"] else 0.0
+        result.sort(key=lambda r: r.get(by, r["wall"]), reverse=True)
+        return result
+
+    def reset(self):
+        """清空累计统计"""
+        self._stats.clear()
+
+
+profiler = HandlerProfiler()
@@ -0,0 +1,140 @@
+"""
+请求合并(single-flight)
+相同键的并发调用只执行一次，其它调用等待并共用同一个结果；可以把结果缓存一小段时间，
+突发的相同查询（例如群里同时有很多人查同一个城市的天气）只会请求一次上游
+"""
+
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from utils.metrics import metrics
+
+flight_calls = metrics.counter("xybot_singleflight_calls_total", "合并请求的调用数，result为leader(实际执行)、"
+                                                                 "shared(等待其它调用的结果)或cached(使用缓存的结果)",
+                               ("group", "result"))
+flight_in_progress = metrics.gauge("xybot_singleflight_in_progress", "正在执行的合并请求数", ("group",))
+
+
+class SingleFlight:
+    """一组可以合并的调用，不同的组互不影响"""
+
+    def __init__(self, name: str, ttl: float = 0, max_entries: int = 1024, max_bytes: int = 0,
+                 sizeof: Callable[[Any], int] = len):
+        """
+        Args:
+            name: 组名，用于指标
+            ttl: 结果缓存时间（秒），为0时只合并同时进行的调用
+            max_entries: 最多缓存的结果数
+            max_bytes: 缓存结果的总大小上限，为0时不限制，适合缓存图片等较大的结果
+            sizeof: 计算结果大小的函数，只在max_bytes大于0时使用
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        执行调用，相同键的调用正在进行时等待它的结果
+
+        调用失败时所有等待者都会收到同一个异常，失败的结果不会被缓存。
+        发起调用的协程被取消时，调用本身不会被取消，其它等待者仍能拿到结果
+
+        Args:
+            key: 合并的键
+            func: 异步函数
+            *args: 函数参数
+            **kwargs: 函数关键字参数
+
+        Returns:
+            函数的返回值
+        """
+        if self.ttl > 0:
+            cached = self._results.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    self._results.move_to_end(key)
+                    flight_calls.labels(self.name, "cached").inc()
+                    return cached[1]
+                self.forget(key)
+
+        future = self._flights.get(key)
+        if future is not None:
+            flight_calls.labels(self.name, "shared").inc()
+            return await asyncio.shield(future)
+
+        flight_calls.labels(self.name, "leader").inc()
+        future = asyncio.ensure_future(self._run(key, func, args, kwargs))
+        # 所有等待者都被取消时，避免出现未读取异常的警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._flights[key] = future
+        return await asyncio.shield(future)
+
+    async def _run(self, key: Hashable, func, args, kwargs) -> Any:
+        flight_in_progress.labels(self.name).inc()
+        try:
+            result = await func(*args, **kwargs)
+            if self.ttl > 0:
+                self._store(key, result)
+            return result
+        finally:
+            flight_in_progress.labels(self.name).dec()
+            self._flights.pop(key, None)
+
+    def _store(self, key: Hashable, result: Any):
+        """缓存结果，超过数量或大小上限时丢弃最久没有使用的结果"""
+        size = self.sizeof(result) if self.max_bytes > 0 else 0
+        if size > self.max_bytes > 0:
+            return
+        self.forget(key)
+        self._results[key] = (time.monotonic() + self.ttl, result, size)
+        self._bytes += size
+        while len(self._results) > self.max_entries or self._bytes > self.max_bytes > 0:
+            _, (_, _, evicted) = self._results.popitem(last=False)
+            self._bytes -= evicted
+
+    def forget(self, key: Hashable):
+        """丢弃缓存的结果，下一次调用会重新执行"""
+        cached = self._results.pop(key, None)
+        if cached is not None:
+            self._bytes -= cached[2]
+
+    def clear(self):
+        self._results.clear()
+        self._bytes = 0
+
+
+def singleflight(name: Optional[str] = None, ttl: float = 0,
+                 key: Optional[Callable[..., Hashable]] = None):
+    """
+    合并异步函数的并发调用
+
+    用法:
+        @singleflight(ttl=30)
+        async def fetch(city: str): ...
+
+    Args:
+        name: 组名，默认使用函数的限定名
+        ttl: 结果缓存时间（秒）
+        key: 根据调用参数生成合并键的函数，默认使用全部参数（参数需要可哈希）
+    """
+
+    def decorator(func):
+        flight = SingleFlight(name or func.__qualname__, ttl)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            flight_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return await flight.do(flight_key, func, *args, **kwargs)
+
+        wrapper.flight = flight
+        return wrapper
+
+    return decorator
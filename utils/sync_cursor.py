@@ -0,0 +1,159 @@
+"""
+消息同步游标
+保存每个账号的同步键(Synckey)和已处理消息的MsgId水位，重启后从上次的位置继续同步；
+用最近处理过的NewMsgId做去重，断线重连或重试时重复下发的消息不会被再次处理。
+
+消息被接受时只在内存中记录（避免处理中的消息被重复处理），处理完成（done）后才推进水位、
+可以保存的同步键和持久化的NewMsgId。处理中途崩溃或重启时，这些消息会被重新下发并处理
+"""
+
+import json
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from database.keyvalDB import KeyvalDB
+from utils.metrics import metrics
+
+messages_duplicate = metrics.counter("xybot_messages_duplicate_total", "被去重丢弃的重复消息数")
+
+# 持久化的最近NewMsgId数量，重启后仍能识别重复下发的消息
+PERSIST_RECENT = 1000
+
+
+class SyncCursor:
+    """一个账号的同步游标和去重集合"""
+
+    def __init__(self, wxid: str, dedupe_size: int = 10000):
+        """
+        Args:
+            wxid: 账号wxid
+            dedupe_size: 去重集合保存的最近NewMsgId数量
+        """
+        self.wxid = wxid
+        self.key = f"sync_cursor:{wxid}"
+        self.dedupe_size = max(dedupe_size, 1)
+        self.synckey = ""
+        self.watermark = 0
+        # 已接受（处理中或已处理）的NewMsgId，用于去重
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+        # 已处理完成的NewMsgId，会被保存
+        self._processed: "OrderedDict[int, None]" = OrderedDict()
+        # 处理中的消息 id(message) -> MsgId
+        self._pending: Dict[int, Any] = {}
+        # 处理完成的消息中最大的MsgId
+        self._done_max = 0
+        # 按同步顺序排列的 (同步键, 这一批中还在处理的消息)，前面的批次都处理完时才保存同步键
+        self._batches: Deque[Tuple[str, Set[int]]] = deque()
+        self._saved_synckey = ""
+        self._dirty = False
+
+    async def load(self):
+        """读取上次保存的游标"""
+        value = await KeyvalDB().get(self.key)
+        if not value:
+            return
+        try:
+            state = json.loads(value)
+        except ValueError:
+            logger.warning("账号 {} 的同步游标已损坏，将重新同步", self.wxid)
+            return
+        self.synckey = self._saved_synckey = state.get("synckey", "")
+        self.watermark = self._done_max = state.get("watermark", 0)
+        for new_msg_id in state.get("recent", []):
+            self._recent[new_msg_id] = None
+            self._processed[new_msg_id] = None
+        logger.info("账号 {} 从上次的同步位置继续，MsgId水位: {}", self.wxid, self.watermark)
+
+    async def save(self):
+        """有变化时保存游标"""
+        if not self._dirty:
+            return
+        recent = list(self._processed)
+        if await KeyvalDB().set(self.key, json.dumps({
+            "synckey": self._saved_synckey,
+            "watermark": self.watermark,
+            "recent": recent,
+        })):
+            self._dirty = False
+
+    def update(self, data: Dict[str, Any]):
+        """从 /Sync 的返回中更新同步键"""
+        synckey = (data.get("KeyBuf") or {}).get("buffer")
+        if synckey and synckey != self.synckey:
+            self.synckey = synckey
+            self._batches.append((synckey, set()))
+
+    def seen(self, message: Dict[str, Any]) -> bool:
+        """消息是否已经处理过"""
+        new_msg_id = message.get("NewMsgId")
+        return new_msg_id is not None and new_msg_id in self._recent
+
+    def mark(self, message: Dict[str, Any]):
+        """记录已接受的消息，只用于去重，水位在消息处理完成（done）时才推进"""
+        new_msg_id = message.get("NewMsgId")
+        if new_msg_id is not None:
+            self._recent[new_msg_id] = None
+            self._recent.move_to_end(new_msg_id)
+            if len(self._recent) > self.dedupe_size:
+                self._recent.popitem(last=False)
+        self._pending[id(message)] = message.get("MsgId")
+
+    def done(self, message: Dict[str, Any]):
+        """消息处理完成，记录NewMsgId并推进MsgId水位和可以保存的同步键"""
+        if id(message) not in self._pending:
+            return
+        del self._pending[id(message)]
+        new_msg_id = message.get("NewMsgId")
+        if new_msg_id is not None:
+            self._processed[new_msg_id] = None
+            self._processed.move_to_end(new_msg_id)
+            if len(self._processed) > PERSIST_RECENT:
+                self._processed.popitem(last=False)
+            self._dirty = True
+        msg_id = message.get("MsgId")
+        if isinstance(msg_id, int) and msg_id > self._done_max:
+            self._done_max = msg_id
+        for _, pending in self._batches:
+            pending.discard(id(message))
+        self._advance()
+
+    def _advance(self):
+        # 水位以下的消息都已处理完成：不超过仍在处理的消息中最小的MsgId
+        in_flight = [msg_id for msg_id in self._pending.values() if isinstance(msg_id, int)]
+        watermark = min(self._done_max, min(in_flight) - 1) if in_flight else self._done_max
+        if watermark > self.watermark:
+            self.watermark = watermark
+            self._dirty = True
+        while self._batches and not self._batches[0][1]:
+            synckey, _ = self._batches.popleft()
+            if synckey != self._saved_synckey:
+                self._saved_synckey = synckey
+                self._dirty = True
+
+    def accept(self, messages: Optional[List[Dict[str, Any]]], backlog: bool = False) -> List[Dict[str, Any]]:
+        """
+        过滤掉重复的消息，并记录剩下的消息
+
+        Args:
+            messages: /Sync 返回的 AddMsgs
+            backlog: 是否为启动时的堆积消息，堆积消息中MsgId不超过水位的视为已处理
+
+        Returns:
+            需要处理的消息
+        """
+        accepted = []
+        for message in messages or []:
+            msg_id = message.get("MsgId")
+            if self.seen(message) or (backlog and isinstance(msg_id, int) and msg_id <= self.watermark):
+                messages_duplicate.inc()
+                continue
+            self.mark(message)
+            accepted.append(message)
+        if accepted:
+            if not self._batches:
+                self._batches.append((self.synckey, set()))
+            self._batches[-1][1].update(id(message) for message in accepted)
+        self._advance()
+        return accepted
@@ -0,0 +1,419 @@
+"""
+消息链路追踪
+收到消息时创建追踪上下文，通过contextvars传递到数据库、HTTP请求和消息发送，
+完成的追踪按OTLP JSON格式导出到文件或OTLP/HTTP收集器
+
+采样策略：按sample-rate随机采样；另外所有消息都会在内存中记录，耗时超过
+slow-threshold-ms或处理出错的追踪也会导出，便于分析尾部延迟
+"""
+
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from utils.metrics import metrics
+
+spans_exported = metrics.counter("xybot_trace_spans_exported_total", "已导出的追踪span数")
+spans_dropped = metrics.counter("xybot_trace_spans_dropped_total", "因导出队列已满或导出失败而丢弃的span数")
+traces_finished = metrics.counter("xybot_traces_total", "已完成的追踪数", ("result",))
+
+# OTLP中的span类型和状态码
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+KIND_PRODUCER = 4
+KIND_CONSUMER = 5
+_KINDS = {"internal": KIND_INTERNAL, "server": KIND_SERVER, "client": KIND_CLIENT,
+          "producer": KIND_PRODUCER, "consumer": KIND_CONSUMER}
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current: ContextVar[Optional["Span"]] = ContextVar("xybot_current_span", default=None)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class _Trace:
+    """一次追踪中的所有span，根span结束时决定是否导出"""
+
+    __slots__ = ("trace_id", "sampled", "spans", "error", "exported", "finished")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = os.urandom(16).hex()
+        self.sampled = sampled
+        self.spans: List[Span] = []
+        self.error = False
+        self.exported = False
+        self.finished = False
+
+
+class Span:
+    """追踪中的一个阶段"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes",
+                 "status", "status_message")
+
+    def __init__(self, trace: _Trace, name: str, kind: int, parent_id: str = "",
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent请求头"""
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+        self.attributes["exception.type"] = type(error).__name__
+        self.trace.error = True
+
+    @property
+    def duration(self) -> float:
+        """耗时（秒）"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message} if self.status_message
+            else {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NonRecordingSpan:
+    """未被记录的追踪使用的空span"""
+
+    recording = False
+    traceparent = ""
+    duration = 0.0
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+
+class _Exporter:
+    """后台线程批量导出span"""
+
+    def __init__(self, kind: str, path: str, endpoint: str, service_name: str, batch_size: int,
+                 flush_interval: float, max_queue: int):
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[List[Span]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: List[Span]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            spans_dropped.inc(len(spans))
+
+    def shutdown(self, timeout: float = 5):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.flush_interval)
+            while True:
+                batch: List[Span] = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.extend(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    break
+                self._export(batch)
+            if stopping:
+                return
+
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "xybot"}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+
+    def _export(self, spans: List[Span]):
+        data = json.dumps(self._payload(spans), ensure_ascii=False)
+        try:
+            if self.kind == "otlp-http":
+                request = urllib.request.Request(self.endpoint, data=data.encode("utf-8"), method="POST",
+                                                 headers={"Content-Type": "application/json"})
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    response.read()
+            else:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(data + "\n")
+            spans_exported.inc(len(spans))
+        except Exception as e:
+            spans_dropped.inc(len(spans))
+            logger.warning("导出追踪数据失败: {}", e)
+
+
+class Tracer:
+    """链路追踪器"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.slow_threshold = 0.0
+        self._exporter: Optional[_Exporter] = None
+        self._http_trace_config = None
+
+    def configure(self, config: Dict[str, Any]):
+        """
+        从配置加载设置
+
+        Args:
+            config: main_config.toml中的[Tracing]配置
+        """
+        self.shutdown()
+        self.enabled = config.get("enabled", False)
+        self.sample_rate = config.get("sample-rate", 0.01)
+        self.slow_threshold = config.get("slow-threshold-ms", 2000) / 1000
+        if not self.enabled:
+            return
+
+        exporter = config.get("exporter", "file")
+        if exporter not in ("file", "otlp-http"):
+            logger.warning("未知的追踪导出方式 {}，将导出到文件", exporter)
+            exporter = "file"
+        self._exporter = _Exporter(
+            kind=exporter,
+            path=config.get("file", "logs/traces.jsonl"),
+            endpoint=config.get("endpoint", "http://127.0.0.1:4318/v1/traces"),
+            service_name=config.get("service-name", "xybot"),
+            batch_size=config.get("batch-size", 512),
+            flush_interval=config.get("flush-interval", 5),
+            max_queue=config.get("max-queue", 2048),
+        )
+
+    def shutdown(self):
+        """导出剩余的span并停止导出线程"""
+        exporter, self._exporter = self._exporter, None
+        if exporter is not None:
+            exporter.shutdown()
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        """当前上下文中的span，没有记录中的追踪时为None"""
+        return _current.get()
+
+    @contextmanager
+    def use_span(self, span: Optional[Span]) -> Iterator[Optional[Span]]:
+        """把已有的span设为当前上下文中的span，不会结束它，用于在其它任务中继续同一个追踪"""
+        token = _current.set(span)
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+
+    @contextmanager
+    def start_trace(self, name: str, kind: str = "server", **attributes) -> Iterator[Any]:
+        """
+        开始一次新的追踪，作为根span
+
+        未启用、未被采样且没有设置慢追踪阈值时返回空span，内部的span也不会被记录
+        """
+        if not self.enabled or self._exporter is None:
+            yield NON_RECORDING_SPAN
+            return
+
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_threshold <= 0:
+            yield NON_RECORDING_SPAN
+            return
+
+        trace = _Trace(sampled)
+        with self._activate(Span(trace, name, _KINDS.get(kind, KIND_SERVER), attributes=attributes)) as span:
+            yield span
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", parent: Optional[Span] = None, **attributes) -> Iterator[Any]:
+        """
+        在当前追踪中记录一个阶段
+
+        Args:
+            name: 阶段名称
+            kind: internal/server/client/producer/consumer
+            parent: 父span，为空时使用当前上下文中的span
+            **attributes: span属性
+        """
+        parent = parent or _current.get()
+        if parent is None or not parent.recording:
+            yield NON_RECORDING_SPAN
+            return
+
+        span = Span(parent.trace, name, _KINDS.get(kind, KIND_INTERNAL), parent.span_id, attributes)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def _activate(self, span: Span) -> Iterator[Span]:
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current.reset(token)
+            self.finish(span)
+
+    def begin(self, name: str, kind: str = "internal", parent: Optional[Span] = None, **attributes) -> Any:
+        """开始一个不进入上下文的span，需要调用finish结束，用于回调式的接口"""
+        parent = parent or _current.get()
+        if parent is None or not parent.recording:
+            return NON_RECORDING_SPAN
+        return Span(parent.trace, name, _KINDS.get(kind, KIND_INTERNAL), parent.span_id, attributes)
+
+    def finish(self, span: Any):
+        """结束span，根span结束时决定是否导出整个追踪"""
+        if not span.recording or span.end_ns:
+            return
+        span.end_ns = time.time_ns()
+        trace = span.trace
+
+        if trace.finished:
+            # 根span结束后才结束的span（例如后台发送），跟随追踪的导出结果
+            if trace.exported and self._exporter is not None:
+                self._exporter.submit([span])
+            return
+
+        trace.spans.append(span)
+        if span.parent_id:
+            return
+
+        trace.finished = True
+        slow = 0 < self.slow_threshold <= span.duration
+        if trace.sampled or trace.error or slow:
+            trace.exported = True
+            if self._exporter is not None:
+                self._exporter.submit(trace.spans)
+            traces_finished.labels("error" if trace.error else "slow" if slow else "sampled").inc()
+        else:
+            traces_finished.labels("dropped").inc()
+        trace.spans = []
+
+    def traced(self, name: Optional[str] = None, kind: str = "internal"):
+        """装饰器，把函数调用记录为当前追踪中的一个span"""
+
+        def decorator(func):
+            span_name = name or func.__qualname__
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name, kind):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, kind):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def http_trace_config(self):
+        """
+        aiohttp的TraceConfig，为每个请求记录client span并附带traceparent请求头
+
+        用法: aiohttp.ClientSession(trace_configs=[tracer.http_trace_config()])
+        """
+        if self._http_trace_config is not None:
+            return self._http_trace_config
+
+        import aiohttp
+
+        async def on_request_start(session, ctx, params):
+            span = self.begin(f"HTTP {params.method}", "client", **{
+                "http.request.method": params.method,
+                "server.address": params.url.host or "",
+                "url.path": params.url.path,
+            })
+            ctx.span = span
+            if span.recording:
+                params.headers["traceparent"] = span.traceparent
+
+        async def on_request_end(session, ctx, params):
+            span = getattr(ctx, "span", NON_RECORDING_SPAN)
+            span.set_attribute("http.response.status_code", params.response.status)
+            self.finish(span)
+
+        async def on_request_exception(session, ctx, params):
+            span = getattr(ctx, "span", NON_RECORDING_SPAN)
+            span.record_exception(params.exception)
+            self.finish(span)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        self._http_trace_config = trace_config
+        return trace_config
+
+
+tracer = Tracer()
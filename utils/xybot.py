@@ -1,3 +1,4 @@
+import time
 import tomllib
 import xml.etree.ElementTree as ET
 from typing import Dict, Any
@@ -8,6 +9,12 @@ from WechatAPI import WechatAPIClient
 from WechatAPI.Client.protect import protector
 from database.messsagDB import MessageDB
 from utils.event_manager import EventManager
+from utils.metrics import metrics
+from utils.tracing import tracer
+
+messages_processed = metrics.counter("xybot_messages_processed_total", "按类型统计的已处理消息数", ("type",))
+message_duration = metrics.histogram("xybot_message_process_seconds", "按类型统计的消息处理耗时", ("type",))
+message_errors = metrics.counter("xybot_message_errors_total", "按类型统计的消息处理失败次数", ("type",))
 
 
 class XYBot:
@@ -29,6 +36,8 @@ class XYBot:
 
         self.msg_db = MessageDB()
 
+        # 分布式模式下由接收进程把消息写入消息流，交给工作进程处理
+        self.publisher = None
 
     def update_profile(self, wxid: str, nickname: str, alias: str, phone: str):
         """更新机器人信息"""
@@ -37,8 +46,42 @@ class XYBot:
         self.alias = alias
         self.phone = phone
 
+    def set_publisher(self, publisher):
+        """
+        设置消息流发布器，设置后预处理完的消息不再直接交给插件，而是写入消息流
+
+        Args:
+            publisher: utils.message_stream.StreamPublisher
+        """
+        self.publisher = publisher
+
+    async def dispatch(self, event_type: str, message: Dict[str, Any]):
+        """把预处理完的消息交给插件处理"""
+        if self.publisher is not None:
+            await self.publisher.publish(event_type, message)
+        else:
+            await EventManager.emit(event_type, self.bot, message)
+
     async def process_message(self, message: Dict[str, Any]):
-        """处理接收到的消息"""
+        """处理接收到的消息，并记录处理数量和耗时"""
+        msg_type = str(message.get("MsgType"))
+        start = time.perf_counter()
+        try:
+            with tracer.start_trace("XYBot.process_message", "consumer", **{
+                "messaging.message.id": str(message.get("MsgId", "")),
+                "xybot.msg_type": msg_type,
+            }) as span:
+                await self._process_message(message)
+                span.set_attribute("xybot.from_wxid", message.get("FromWxid", ""))
+        except Exception:
+            message_errors.labels(msg_type).inc()
+            raise
+        finally:
+            messages_processed.labels(msg_type).inc()
+            message_duration.labels(msg_type).observe(time.perf_counter() - start)
+
+    async def _process_message(self, message: Dict[str, Any]):
+        """按消息类型分发消息"""
 
         msg_type = message.get("MsgType")
 
@@ -74,7 +117,7 @@ class XYBot:
 
         elif msg_type == 37:  # 好友请求
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("friend_request", self.bot, message)
+                await self.dispatch("friend_request", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -140,7 +183,7 @@ class XYBot:
 
             if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
                 if self.ignore_protection or not protector.check(14400):
-                    await EventManager.emit("at_message", self.bot, message)
+                    await self.dispatch("at_message", message)
                 else:
                     logger.warning("风控保护: 新设备登录后4小时内请挂机")
             return
@@ -154,7 +197,7 @@ class XYBot:
 
         if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("text_message", self.bot, message)
+                await self.dispatch("text_message", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -211,7 +254,7 @@ class XYBot:
 
         if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("image_message", self.bot, message)
+                await self.dispatch("image_message", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -273,7 +316,7 @@ class XYBot:
 
         if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("voice_message", self.bot, message)
+                await self.dispatch("voice_message", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -424,7 +467,7 @@ class XYBot:
 
         if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("quote_message", self.bot, message)
+                await self.dispatch("quote_message", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -466,7 +509,7 @@ class XYBot:
 
         if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("video_message", self.bot, message)
+                await self.dispatch("video_message", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -503,7 +546,7 @@ class XYBot:
 
         if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("file_message", self.bot, message)
+                await self.dispatch("file_message", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -542,7 +585,7 @@ class XYBot:
             logger.info("收到系统消息: {}", message)
             if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
                 if self.ignore_protection or not protector.check(14400):
-                    await EventManager.emit("system_message", self.bot, message)
+                    await self.dispatch("system_message", message)
                 else:
                     logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -581,7 +624,7 @@ class XYBot:
 
         if self.ignore_check(message["FromWxid"], message["SenderWxid"]):
             if self.ignore_protection or not protector.check(14400):
-                await EventManager.emit("pat_message", self.bot, message)
+                await self.dispatch("pat_message", message)
             else:
                 logger.warning("风控保护: 新设备登录后4小时内请挂机")
 
@@ -1,12 +1,16 @@
 import os
 import json
-import asyncio
 from aiohttp import web, WSCloseCode
 import aiohttp_cors
 from pathlib import Path
-import psutil
 from datetime import datetime
 from .auth import AuthManager  # 导入认证管理器
+from xybot.auth.security import LoginRateLimited
+from xybot.web.broadcast import BroadcastHub, SystemStatsSampler
+from xybot.web.logs import LogService
+from utils.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.profiler import profiler
+from utils.loop_monitor import loop_monitor
 import toml  # 导入toml包用于读取配置
 
 class XyBotWebServer:
@@ -25,6 +29,11 @@ class XyBotWebServer:
         # 获取认证相关配置
         auth_config = self.config.get('web', {}).get('auth', {})
         token_expire_hours = auth_config.get('token_expire_hours', 24)
+        max_login_attempts = auth_config.get('max_login_attempts', 5)
+        max_ip_login_attempts = auth_config.get('max_ip_login_attempts', 20)
+        login_timeout_minutes = auth_config.get('login_timeout_minutes', 30)
+        token_cache_seconds = auth_config.get('token_cache_seconds', 30)
+        token_compaction_minutes = auth_config.get('token_compaction_minutes', 60)
         
         self.app = web.Application()
         
@@ -32,8 +41,15 @@ class XyBotWebServer:
         self.redis = bot_instance.api.redis_client
         self.auth_manager = AuthManager(
             redis_client=self.redis,
-            token_expire_hours=token_expire_hours
+            token_expire_hours=token_expire_hours,
+            max_login_attempts=max_login_attempts,
+            max_ip_login_attempts=max_ip_login_attempts,
+            login_timeout_minutes=login_timeout_minutes,
+            token_cache_seconds=token_cache_seconds,
+            token_compaction_minutes=token_compaction_minutes
         )
+        self.app.on_startup.append(self._on_startup)
+        self.app.on_cleanup.append(self._on_cleanup)
         
         # 安全配置
         security_config = self.config.get('web', {}).get('security', {})
@@ -47,6 +63,23 @@ class XyBotWebServer:
         self.ws_max_clients = ws_config.get('max_clients', 50)
         self.ws_stats_update_interval = ws_config.get('stats_update_interval', 5000)
         
+        self.ws_min_update_interval = ws_config.get('min_update_interval', 1000)
+        
+        # 相同推送间隔的客户端共享同一个采样任务，慢客户端使用有界缓冲
+        self.ws_hub = BroadcastHub(
+            buffer_size=ws_config.get('client_buffer_size', 16),
+            drop_policy=ws_config.get('drop_policy', 'drop_oldest'),
+            min_interval=self.ws_min_update_interval / 1000
+        )
+        self.ws_hub.register('system_stats', interval=self.ws_stats_update_interval / 1000,
+                             make_producer=SystemStatsSampler)
+        self.ws_hub.register('messages', interval=self.ws_stats_update_interval / 1000,
+                             make_producer=self._make_message_poller)
+        self.ws_hub.register('logs')  # 由日志sink主动推送
+        
+        # 日志查询服务
+        self.log_service = LogService("logs")
+        
         self.setup_routes()
         
         if self.enable_cors:
@@ -54,7 +87,6 @@ class XyBotWebServer:
             
         self.setup_static_files()
         self.ws_clients = set()
-        self.ws_tasks = {}
     
     def _load_config(self, config_path):
         """加载配置文件"""
@@ -81,7 +113,10 @@ class XyBotWebServer:
                         'enabled': True,
                         'ping_interval': 30,
                         'max_clients': 50,
-                        'stats_update_interval': 5000
+                        'stats_update_interval': 5000,
+                        'client_buffer_size': 16,
+                        'drop_policy': 'drop_oldest',
+                        'min_update_interval': 1000
                     }
                 }
             }
@@ -104,11 +139,21 @@ class XyBotWebServer:
         self.app.router.add_post('/api/plugins/{plugin_id}/config', self.auth_middleware(self.save_plugin_config))
         self.app.router.add_post('/api/plugins/{plugin_id}/reload', self.auth_middleware(self.reload_plugin))
         self.app.router.add_get('/api/plugins/dependency-graph', self.auth_middleware(self.get_plugin_dependency_graph))
+        self.app.router.add_get('/api/plugins/profile', self.auth_middleware(self.get_plugin_profile))
         self.app.router.add_get('/api/settings', self.auth_middleware(self.get_system_settings))
         self.app.router.add_post('/api/settings', self.auth_middleware(self.save_system_settings))
         self.app.router.add_get('/api/logs', self.auth_middleware(self.get_logs))
         self.app.router.add_post('/api/system/restart', self.auth_middleware(self.restart_system))
+        self.app.router.add_get('/api/system/loop', self.auth_middleware(self.get_loop_status))
         self.app.router.add_get('/api/ws', self.websocket_handler)
+        
+        # 运行指标，供Prometheus抓取
+        metrics_config = self.config.get('web', {}).get('metrics', {})
+        if metrics_config.get('enabled', True):
+            if metrics_config.get('require_auth', False):
+                self.app.router.add_get('/metrics', self.auth_middleware(self.get_metrics))
+            else:
+                self.app.router.add_get('/metrics', self.get_metrics)
     
     def setup_cors(self):
         """设置跨域资源共享"""
@@ -186,7 +231,14 @@ class XyBotWebServer:
                     status=400
                 )
             
-            auth_result = await self.auth_manager.authenticate(username, password)
+            try:
+                auth_result = await self.auth_manager.authenticate(username, password, request.remote)
+            except LoginRateLimited as e:
+                return web.json_response(
+                    {"error": str(e), "retry_after": e.retry_after},
+                    status=429,
+                    headers={"Retry-After": str(e.retry_after)}
+                )
             
             if auth_result:
                 return web.json_response(auth_result)
@@ -354,6 +406,15 @@ class XyBotWebServer:
         except Exception as e:
             return web.json_response({"error": str(e)}, status=500)
     
+    async def get_plugin_profile(self, request):
+        """按开销排序的插件处理函数统计"""
+        try:
+            by = request.query.get('by', 'wall')
+            group = request.query.get('group', 'plugin')
+            return web.json_response(profiler.ranking(by=by, group=group))
+        except Exception as e:
+            return web.json_response({"error": str(e)}, status=500)
+    
     async def get_plugin_config(self, request):
         """获取插件配置"""
         plugin_id = request.match_info.get('plugin_id')
@@ -446,70 +507,42 @@ class XyBotWebServer:
             return web.json_response({"error": str(e)}, status=500)
     
     async def get_logs(self, request):
-        """获取系统日志"""
+        """获取系统日志，支持按级别、时间范围和关键字过滤，通过游标分页"""
         try:
-            limit = int(request.query.get('limit', 200))
-            level = request.query.get('level', None)
-            
-            # 日志文件路径
-            log_path = Path("logs")
-            log_files = list(log_path.glob("XYBot_*.log"))
-            log_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-            
-            logs = []
-            
-            # 读取最新的日志文件
-            if log_files:
-                current_file = log_files[0]
-                with open(current_file, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-                    # 从末尾开始读取指定数量的行
-                    for line in reversed(lines[-limit:]):
-                        parts = line.strip().split(" | ", 2)
-                        if len(parts) >= 3:
-                            timestamp, log_level, message = parts
-                            
-                            # 如果指定了日志级别过滤
-                            if level and log_level != level:
-                                continue
-                            
-                            # 解析元数据（如果存在）
-                            metadata = None
-                            traceback = None
-                            if "[METADATA]" in message:
-                                message_parts = message.split("[METADATA]", 1)
-                                message = message_parts[0].strip()
-                                try:
-                                    metadata = json.loads(message_parts[1].strip())
-                                except:
-                                    metadata = {"raw": message_parts[1].strip()}
-                            
-                            # 解析traceback（如果存在）
-                            if "[TRACEBACK]" in message:
-                                message_parts = message.split("[TRACEBACK]", 1)
-                                message = message_parts[0].strip()
-                                traceback = message_parts[1].strip()
-                            
-                            log_entry = {
-                                "timestamp": timestamp,
-                                "level": log_level,
-                                "message": message,
-                                "metadata": metadata,
-                                "traceback": traceback
-                            }
-                            logs.append(log_entry)
-                            
-                            # 达到限制数量时停止
-                            if len(logs) >= limit:
-                                break
-            
-            # 根据时间戳排序，最新的在前
-            logs.sort(key=lambda x: x["timestamp"], reverse=True)
-            
-            return web.json_response(logs)
+            query = request.query
+            limit = max(1, min(int(query.get('limit', 200)), 2000))
+            cursor = query.get('cursor')
+            cursor = int(cursor) if cursor else None
+            
+            # 从日志文件末尾反向读取，只读取需要的部分
+            logs, next_cursor = await self.log_service.query(
+                limit=limit,
+                level=query.get('level') or None,
+                since=query.get('since') or None,
+                until=query.get('until') or None,
+                text=query.get('q') or None,
+                cursor=cursor,
+                file=query.get('file') or None
+            )
+            
+            # 返回格式保持为列表，下一页游标放在响应头中
+            headers = {}
+            if next_cursor is not None:
+                headers['X-Next-Cursor'] = str(next_cursor)
+            return web.json_response(logs, headers=headers)
+        except ValueError as e:
+            return web.json_response({"error": f"参数错误: {str(e)}"}, status=400)
         except Exception as e:
             return web.json_response({"error": str(e)}, status=500)
     
+    async def get_metrics(self, request):
+        """导出Prometheus格式的运行指标"""
+        return web.Response(body=metrics.render().encode('utf-8'), headers={'Content-Type': METRICS_CONTENT_TYPE})
+    
+    async def get_loop_status(self, request):
+        """事件循环延迟分位数和最近的阻塞记录"""
+        return web.json_response(loop_monitor.snapshot())
+    
     async def restart_system(self, request):
         """重启系统"""
         try:
@@ -522,7 +555,7 @@ class XyBotWebServer:
         """处理WebSocket连接"""
         # 认证检查
         token = request.query.get('token')
-        if not token or not self.auth_manager.validate_token(token):
+        if not token or not await self.auth_manager.validate_token(token):
             return web.Response(status=401, text='未授权访问')
         
         ws = web.WebSocketResponse()
@@ -530,15 +563,13 @@ class XyBotWebServer:
         
         # 将新连接添加到客户端集合
         self.ws_clients.add(ws)
-        client_id = id(ws)
-        subscriptions = set()
         
         try:
             async for msg in ws:
                 if msg.type == web.WSMsgType.TEXT:
                     try:
                         data = json.loads(msg.data)
-                        await self._handle_ws_message(ws, data, client_id, subscriptions)
+                        await self._handle_ws_message(ws, data)
                     except json.JSONDecodeError:
                         await ws.send_json({
                             'type': 'error',
@@ -547,33 +578,49 @@ class XyBotWebServer:
                 elif msg.type == web.WSMsgType.ERROR:
                     print(f'WebSocket连接错误: {ws.exception()}')
         finally:
-            # 清理连接和相关任务
-            self.ws_clients.remove(ws)
-            for channel in list(subscriptions):
-                await self._unsubscribe(ws, client_id, channel, subscriptions)
+            # 清理连接和订阅
+            self.ws_clients.discard(ws)
+            await self.ws_hub.remove_client(ws)
             
         return ws
     
-    async def _handle_ws_message(self, ws, data, client_id, subscriptions):
+    async def _handle_ws_message(self, ws, data):
         """处理WebSocket消息"""
         msg_type = data.get('type')
         payload = data.get('payload', {})
         
         if msg_type == 'subscribe':
             channel = payload.get('channel')
-            interval = payload.get('interval', 5000)  # 默认5秒
+            requested = payload.get('interval')  # 毫秒，可选
             
             if channel:
-                await self._subscribe(ws, client_id, channel, interval, subscriptions)
-                await ws.send_json({
-                    'type': 'subscription_success',
-                    'payload': {'channel': channel}
-                })
+                # 相同间隔的订阅者共享同一份数据，间隔小于服务端允许的最小值时使用最小值
+                try:
+                    requested = float(requested) if requested is not None else None
+                except (TypeError, ValueError):
+                    requested = None
+                interval = self.ws_hub.subscribe(ws, channel, requested / 1000 if requested is not None else None)
+                if interval is not None:
+                    if channel == 'logs':
+                        self._attach_log_tail()
+                    response = {'channel': channel, 'interval': int(interval * 1000)}
+                    if requested is not None and int(interval * 1000) != int(requested):
+                        print(f"WebSocket订阅 {channel} 请求的间隔 {requested}ms 已调整为 {int(interval * 1000)}ms")
+                        response['requested_interval'] = requested
+                    await ws.send_json({
+                        'type': 'subscription_success',
+                        'payload': response
+                    })
+                else:
+                    await ws.send_json({
+                        'type': 'error',
+                        'payload': {'message': f'Unknown channel: {channel}'}
+                    })
         
         elif msg_type == 'unsubscribe':
             channel = payload.get('channel')
-            if channel and channel in subscriptions:
-                await self._unsubscribe(ws, client_id, channel, subscriptions)
+            if channel:
+                self.ws_hub.unsubscribe(ws, channel)
                 await ws.send_json({
                     'type': 'unsubscription_success',
                     'payload': {'channel': channel}
@@ -585,120 +632,26 @@ class XyBotWebServer:
                 'payload': {'message': f'Unknown message type: {msg_type}'}
             })
     
-    async def _subscribe(self, ws, client_id, channel, interval, subscriptions):
-        """订阅一个通道"""
-        # 取消之前的订阅（如果存在）
-        await self._unsubscribe(ws, client_id, channel, subscriptions)
-        
-        # 添加新订阅
-        subscriptions.add(channel)
-        
-        # 创建对应的任务
-        task_key = f"{client_id}_{channel}"
-        
-        if channel == 'system_stats':
-            self.ws_tasks[task_key] = asyncio.create_task(
-                self._send_system_stats(ws, interval)
-            )
-        elif channel == 'messages':
-            self.ws_tasks[task_key] = asyncio.create_task(
-                self._send_recent_messages(ws, interval)
-            )
-        # 可以添加更多通道类型
+    def _attach_log_tail(self):
+        """第一次订阅日志通道时注册日志sink，没有订阅者时sink直接返回"""
+        self.log_service.attach_live_tail(
+            lambda entry: self.ws_hub.publish('logs', entry),
+            is_active=lambda: self.ws_hub.subscriber_count('logs') > 0
+        )
     
-    async def _unsubscribe(self, ws, client_id, channel, subscriptions):
-        """取消订阅一个通道"""
-        if channel in subscriptions:
-            subscriptions.remove(channel)
+    def _make_message_poller(self):
+        """生成消息通道的采样函数，每个推送间隔各自记录上次推送的时间，没有新消息时不推送"""
+        last_message_time = datetime.now()
         
-        # 取消并删除相应的任务
-        task_key = f"{client_id}_{channel}"
-        if task_key in self.ws_tasks:
-            self.ws_tasks[task_key].cancel()
-            try:
-                await self.ws_tasks[task_key]
-            except asyncio.CancelledError:
-                pass
-            del self.ws_tasks[task_key]
-    
-    async def _send_system_stats(self, ws, interval):
-        """发送系统统计数据，使用配置的更新间隔"""
-        try:
-            while True:
-                # 获取系统信息
-                cpu = psutil.cpu_percent(interval=0.5)
-                memory = psutil.virtual_memory()
-                disk = psutil.disk_usage('/')
-                network = psutil.net_io_counters()
-                
-                stats = {
-                    'cpu': {
-                        'percent': cpu
-                    },
-                    'memory': {
-                        'total': memory.total,
-                        'available': memory.available,
-                        'percent': memory.percent
-                    },
-                    'disk': {
-                        'total': disk.total,
-                        'used': disk.used,
-                        'free': disk.free,
-                        'percent': disk.percent
-                    },
-                    'network': {
-                        'bytes_sent': network.bytes_sent,
-                        'bytes_recv': network.bytes_recv
-                    },
-                    'timestamp': datetime.now().isoformat()
-                }
-                
-                # 发送数据
-                await ws.send_json({
-                    'type': 'system_stats',
-                    'payload': stats
-                })
-                
-                # 使用配置的更新间隔
-                await asyncio.sleep(self.ws_stats_update_interval / 1000)  # 转换为秒
-        except asyncio.CancelledError:
-            # 任务被取消时正常退出
-            pass
-        except Exception as e:
-            print(f"发送系统统计数据时出错: {str(e)}")
-            if not ws.closed:
-                await ws.send_json({
-                    'type': 'error',
-                    'payload': {'message': f'System stats error: {str(e)}'}
-                })
-    
-    async def _send_recent_messages(self, ws, interval):
-        """发送最近消息"""
-        try:
+        async def poll():
+            nonlocal last_message_time
+            recent_messages = await self._get_new_messages(last_message_time)
+            if not recent_messages:
+                return None
             last_message_time = datetime.now()
-            while True:
-                # 获取新消息
-                recent_messages = await self._get_new_messages(last_message_time)
-                
-                if recent_messages:
-                    last_message_time = datetime.now()
-                    await ws.send_json({
-                        'type': 'messages',
-                        'payload': {'messages': recent_messages}
-                    })
-                
-                # 等待下一次更新
-                await asyncio.sleep(interval / 1000)  # 转换为秒
-        except asyncio.CancelledError:
-            # 任务被取消时正常退出
-            pass
-        except Exception as e:
-            print(f"发送最近消息时出错: {str(e)}")
-            if not ws.closed:
-                await ws.send_json({
-                    'type': 'error',
-                    'payload': {'message': f'Recent messages error: {str(e)}'}
-                })
+            return {'messages': recent_messages}
+        
+        return poll
     
     async def _get_new_messages(self, since_time):
         """获取指定时间后的新消息"""
@@ -714,11 +667,17 @@ class XyBotWebServer:
                                message=b'Server shutdown')
         self.ws_clients.clear()
         
-        # 取消所有任务
-        for task in self.ws_tasks.values():
-            task.cancel()
-        await asyncio.gather(*self.ws_tasks.values(), return_exceptions=True)
-        self.ws_tasks.clear()
+        # 停止所有采样和发送任务
+        self.log_service.detach_live_tail()
+        await self.ws_hub.close()
+    
+    async def _on_startup(self, app):
+        """启动后台任务"""
+        self.auth_manager.start_token_compaction()
+    
+    async def _on_cleanup(self, app):
+        """停止后台任务"""
+        await self.auth_manager.stop_token_compaction()
     
     async def start(self):
         """启动Web服务器，使用配置的主机和端口"""
@@ -4,16 +4,18 @@
 使用Redis存储认证数据
 """
 
-import os
-import time
-import hashlib
 import secrets
 import json
-import base64
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
 import logging
 
+from .tokens import TokenStore
+from .security import (
+    LoginGuard, LoginRateLimited, PasswordHasher, TokenCache,
+    hash_password, verify_password
+)
+
 logger = logging.getLogger(__name__)
 
 class AuthManager:
@@ -21,19 +23,34 @@ class AuthManager:
     
     # Redis键前缀
     REDIS_KEY_USERS = "xybot:web:users"
-    REDIS_KEY_TOKENS = "xybot:web:tokens"
     REDIS_KEY_SECRET = "xybot:web:secret_key"
     
-    def __init__(self, redis_client, token_expire_hours: int = 24):
+    def __init__(self, redis_client, token_expire_hours: int = 24, max_login_attempts: int = 5,
+                 login_timeout_minutes: int = 30, token_cache_seconds: int = 30,
+                 token_compaction_minutes: int = 60, max_ip_login_attempts: int = 20):
         """
         初始化认证管理器
         
         Args:
             redis_client: Redis客户端实例
             token_expire_hours: 令牌过期时间（小时）
+            max_login_attempts: 同一地址对同一用户锁定前允许的登录失败次数
+            max_ip_login_attempts: 同一地址锁定前允许的登录失败次数（不区分用户）
+            login_timeout_minutes: 登录失败的统计窗口和锁定时长（分钟）
+            token_cache_seconds: 已验证令牌的本地缓存时间（秒），0表示不缓存
+            token_compaction_minutes: 令牌存储后台压缩的间隔（分钟）
         """
         self.redis = redis_client
         self.token_expire_hours = token_expire_hours
+        self.token_compaction_minutes = token_compaction_minutes
+        
+        # 令牌按键存储并使用Redis原生TTL，按用户维护令牌集合
+        self.tokens = TokenStore(redis_client)
+        
+        # 密码哈希在线程池中执行，避免阻塞事件循环
+        self.hasher = PasswordHasher()
+        self.rate_limiter = LoginGuard(max_login_attempts, max_ip_login_attempts, login_timeout_minutes * 60)
+        self.token_cache = TokenCache(token_cache_seconds)
         
         # 初始化或加载配置
         self._ensure_initialized()
@@ -55,7 +72,7 @@ class AuthManager:
         
         # 默认管理员账户
         default_password = 'admin123'  # 默认密码
-        password_hash = self._hash_password(default_password)
+        password_hash = await self.hasher.hash(default_password)
         
         admin_user = {
             'username': 'admin',
@@ -79,7 +96,7 @@ class AuthManager:
     
     def _hash_password(self, password: str) -> str:
         """
-        使用PBKDF2算法哈希密码
+        使用PBKDF2算法哈希密码（同步调用，异步代码中请使用self.hasher）
         
         Args:
             password: 明文密码
@@ -87,23 +104,11 @@ class AuthManager:
         Returns:
             密码哈希值
         """
-        # 生成随机盐值
-        salt = os.urandom(16)
-        
-        # 使用PBKDF2算法
-        key = hashlib.pbkdf2_hmac(
-            'sha256',
-            password.encode('utf-8'),
-            salt,
-            100000  # 迭代次数
-        )
-        
-        # 将盐值和密钥合并并编码
-        return base64.b64encode(salt + key).decode('utf-8')
+        return hash_password(password)
     
     def _verify_password(self, stored_hash: str, password: str) -> bool:
         """
-        验证密码
+        验证密码（同步调用，异步代码中请使用self.hasher）
         
         Args:
             stored_hash: 存储的密码哈希
@@ -112,45 +117,30 @@ class AuthManager:
         Returns:
             密码是否正确
         """
-        try:
-            # 解码存储的哈希
-            decoded = base64.b64decode(stored_hash)
-            
-            # 提取盐值
-            salt = decoded[:16]
-            
-            # 提取存储的密钥
-            stored_key = decoded[16:]
-            
-            # 使用相同的盐值和算法生成密钥
-            key = hashlib.pbkdf2_hmac(
-                'sha256',
-                password.encode('utf-8'),
-                salt,
-                100000  # 迭代次数
-            )
-            
-            # 比较密钥
-            return secrets.compare_digest(key, stored_key)
-            
-        except Exception as e:
-            logger.error(f"密码验证出错: {str(e)}")
-            return False
+        return verify_password(stored_hash, password)
     
-    async def authenticate(self, username: str, password: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    async def authenticate(self, username: str, password: str,
+                           client_ip: Optional[str] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
         """
         认证用户
         
         Args:
             username: 用户名
             password: 密码
+            client_ip: 客户端地址，用于登录频率限制
             
         Returns:
-            (成功与否, 用户信息或错误信息)
+            (成功与否, 用户信息或错误信息)，被限制时错误信息包含retry_after
         """
+        try:
+            self.rate_limiter.check(username, client_ip)
+        except LoginRateLimited as e:
+            return False, {"error": str(e), "retry_after": e.retry_after}
+        
         # 获取用户信息
         user_json = await self.redis.hget(self.REDIS_KEY_USERS, username)
         if not user_json:
+            self.rate_limiter.record_failure(username, client_ip)
             return False, {"error": "用户不存在"}
         
         try:
@@ -159,11 +149,14 @@ class AuthManager:
             return False, {"error": "用户数据格式错误"}
         
         # 验证密码
-        if not self._verify_password(user['password_hash'], password):
+        if not await self.hasher.verify(user['password_hash'], password):
+            self.rate_limiter.record_failure(username, client_ip)
             return False, {"error": "密码不正确"}
         
+        self.rate_limiter.reset(username, client_ip)
+        
         # 生成访问令牌
-        token = await self._generate_token(username)
+        token = await self._generate_token(username, user.get('role', 'user'))
         
         # 返回用户信息和令牌
         return True, {
@@ -172,34 +165,18 @@ class AuthManager:
             "token": token
         }
     
-    async def _generate_token(self, username: str) -> str:
+    async def _generate_token(self, username: str, role: str = 'user') -> str:
         """
         为用户生成访问令牌
         
         Args:
             username: 用户名
+            role: 用户角色，保存在令牌中，验证时无需再读取用户信息
             
         Returns:
             访问令牌
         """
-        # 生成随机令牌
-        token = secrets.token_hex(32)
-        
-        # 记录令牌信息
-        expires_at = datetime.now() + timedelta(hours=self.token_expire_hours)
-        token_info = {
-            'username': username,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': expires_at.isoformat()
-        }
-        
-        # 保存到Redis
-        await self.redis.hset(self.REDIS_KEY_TOKENS, token, json.dumps(token_info))
-        
-        # 设置过期时间
-        await self.redis.expire(f"{self.REDIS_KEY_TOKENS}:{token}", int(self.token_expire_hours * 3600))
-        
-        return token
+        return await self.tokens.issue(username, int(self.token_expire_hours * 3600), {'role': role})
     
     async def validate_token(self, token: str) -> Optional[Dict[str, Any]]:
         """
@@ -214,36 +191,33 @@ class AuthManager:
         if not token:
             return None
         
-        # 获取令牌信息
-        token_info_json = await self.redis.hget(self.REDIS_KEY_TOKENS, token)
-        if not token_info_json:
-            return None
+        # 短时间内验证过的令牌直接返回，不访问Redis
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
         
-        try:
-            token_info = json.loads(token_info_json)
-        except json.JSONDecodeError:
+        # 令牌键带有TTL，过期后自动删除
+        token_info = await self.tokens.get(token)
+        if not token_info:
             return None
         
-        # 检查是否过期
-        expires_at = datetime.fromisoformat(token_info['expires_at'])
-        if datetime.now() > expires_at:
-            # 删除过期令牌
-            await self.redis.hdel(self.REDIS_KEY_TOKENS, token)
-            return None
-        
-        # 获取用户信息
         username = token_info['username']
-        user_json = await self.redis.hget(self.REDIS_KEY_USERS, username)
-        if not user_json:
-            # 用户不存在，令牌无效
-            await self.redis.hdel(self.REDIS_KEY_TOKENS, token)
-            return None
-        
-        user = json.loads(user_json)
-        return {
+        role = token_info.get('role')
+        if role is None:
+            # 从旧版存储迁移的令牌没有角色信息
+            user_json = await self.redis.hget(self.REDIS_KEY_USERS, username)
+            if not user_json:
+                await self.tokens.revoke(token)
+                return None
+            role = json.loads(user_json).get('role', 'user')
+        
+        result = {
             'username': username,
-            'role': user.get('role', 'user')
+            'role': role
         }
+        expires_at = datetime.fromisoformat(token_info['expires_at'])
+        self.token_cache.put(token, result, (expires_at - datetime.now()).total_seconds())
+        return result
     
     async def revoke_token(self, token: str) -> bool:
         """
@@ -255,9 +229,19 @@ class AuthManager:
         Returns:
             撤销是否成功
         """
-        result = await self.redis.hdel(self.REDIS_KEY_TOKENS, token)
-        await self.redis.delete(f"{self.REDIS_KEY_TOKENS}:{token}")
-        return result > 0
+        self.token_cache.invalidate(token)
+        return await self.tokens.revoke(token)
+    
+    def start_token_compaction(self) -> None:
+        """启动令牌存储的后台压缩任务，需在事件循环中调用"""
+        async def get_usernames():
+            return await self.redis.hkeys(self.REDIS_KEY_USERS)
+        
+        self.tokens.start_compaction(get_usernames, self.token_compaction_minutes * 60)
+    
+    async def stop_token_compaction(self) -> None:
+        """停止令牌存储的后台压缩任务"""
+        await self.tokens.stop_compaction()
     
     async def list_users(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -299,7 +283,7 @@ class AuthManager:
             return False
         
         # 创建用户
-        password_hash = self._hash_password(password)
+        password_hash = await self.hasher.hash(password)
         user = {
             'username': username,
             'password_hash': password_hash,
@@ -331,15 +315,16 @@ class AuthManager:
         user = json.loads(user_json)
         
         # 验证旧密码
-        if not self._verify_password(user['password_hash'], old_password):
+        if not await self.hasher.verify(user['password_hash'], old_password):
             return False
         
         # 设置新密码
-        user['password_hash'] = self._hash_password(new_password)
+        user['password_hash'] = await self.hasher.hash(new_password)
         user['updated_at'] = datetime.now().isoformat()
         
         # 更新用户信息
         await self.redis.hset(self.REDIS_KEY_USERS, username, json.dumps(user))
+        self.token_cache.invalidate_user(username)
         return True
     
     async def delete_user(self, username: str) -> bool:
@@ -377,13 +362,9 @@ class AuthManager:
         
         # 删除用户
         await self.redis.hdel(self.REDIS_KEY_USERS, username)
+        self.token_cache.invalidate_user(username)
         
         # 撤销该用户的所有令牌
-        all_tokens = await self.redis.hgetall(self.REDIS_KEY_TOKENS)
-        for token, token_info_json in all_tokens.items():
-            token_info = json.loads(token_info_json)
-            if token_info['username'] == username:
-                await self.redis.hdel(self.REDIS_KEY_TOKENS, token)
-                await self.redis.delete(f"{self.REDIS_KEY_TOKENS}:expiry:{token}")
+        await self.tokens.revoke_user(username)
         
         return True 
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""
+认证安全工具模块
+密码哈希在有界线程池中执行，避免阻塞事件循环；
+提供登录频率限制和已验证令牌的进程内缓存
+"""
+
+import asyncio
+import base64
+import hashlib
+import secrets
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Optional, Tuple
+
+PBKDF2_ITERATIONS = 100000
+SALT_SIZE = 16
+
+
+class LoginRateLimited(Exception):
+    """登录尝试过于频繁"""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"登录尝试过于频繁，请在 {retry_after} 秒后重试")
+
+
+def hash_password(password: str) -> str:
+    """
+    使用PBKDF2算法哈希密码（同步调用）
+
+    Args:
+        password: 明文密码
+
+    Returns:
+        Base64编码的盐值+密钥
+    """
+    salt = secrets.token_bytes(SALT_SIZE)
+    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PBKDF2_ITERATIONS)
+    return base64.b64encode(salt + key).decode('utf-8')
+
+
+def verify_password(stored_hash: str, password: str) -> bool:
+    """
+    验证密码（同步调用）
+
+    Args:
+        stored_hash: 存储的密码哈希
+        password: 要验证的明文密码
+
+    Returns:
+        密码是否正确
+    """
+    try:
+        decoded = base64.b64decode(stored_hash)
+        salt, stored_key = decoded[:SALT_SIZE], decoded[SALT_SIZE:]
+        key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PBKDF2_ITERATIONS)
+        return secrets.compare_digest(key, stored_key)
+    except Exception:
+        return False
+
+
+class PasswordHasher:
+    """在有界线程池中执行密码哈希"""
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8):
+        """
+        初始化密码哈希器
+
+        Args:
+            max_workers: 哈希线程数
+            max_pending: 同时进行的哈希任务上限，超出的请求排队等待
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _ensure_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pbkdf2")
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+
+    async def _run(self, func, *args):
+        self._ensure_executor()
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        """异步哈希密码"""
+        return await self._run(hash_password, password)
+
+    async def verify(self, stored_hash: str, password: str) -> bool:
+        """异步验证密码"""
+        return await self._run(verify_password, stored_hash, password)
+
+    def shutdown(self):
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._semaphore = None
+
+
+class LoginRateLimiter:
+    """
+    登录频率限制
+
+    在window秒内失败次数达到max_attempts后锁定window秒，
+    锁定期间直接拒绝，不再计算密码哈希
+    """
+
+    def __init__(self, max_attempts: int = 5, window: float = 1800, max_keys: int = 10000):
+        """
+        初始化频率限制
+
+        Args:
+            max_attempts: 窗口内允许的失败次数
+            window: 统计窗口和锁定时长（秒）
+            max_keys: 最多跟踪的键数量
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.window = window
+        self.max_keys = max_keys
+        self._failures: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._locked_until: Dict[str, float] = {}
+
+    def check(self, *keys: Optional[str]):
+        """
+        检查是否允许登录
+
+        Raises:
+            LoginRateLimited: 任一键处于锁定状态
+        """
+        now = time.monotonic()
+        for key in keys:
+            if not key:
+                continue
+            until = self._locked_until.get(key)
+            if until is None:
+                continue
+            if until > now:
+                raise LoginRateLimited(int(until - now) + 1)
+            del self._locked_until[key]
+            self._failures.pop(key, None)
+
+    def record_failure(self, *keys: Optional[str]):
+        """记录一次失败的登录"""
+        now = time.monotonic()
+        for key in keys:
+            if not key:
+                continue
+            failures = self._failures.get(key)
+            if failures is None:
+                failures = self._failures[key] = deque()
+                if len(self._failures) > self.max_keys:
+                    oldest, _ = self._failures.popitem(last=False)
+                    self._locked_until.pop(oldest, None)
+            else:
+                self._failures.move_to_end(key)
+
+            failures.append(now)
+            while failures and failures[0] <= now - self.window:
+                failures.popleft()
+            if len(failures) >= self.max_attempts:
+                self._locked_until[key] = now + self.window
+
+    def reset(self, *keys: Optional[str]):
+        """登录成功后清除失败记录"""
+        for key in keys:
+            if key:
+                self._failures.pop(key, None)
+                self._locked_until.pop(key, None)
+
+
+class LoginGuard:
+    """
+    登录锁定策略
+
+    失败次数按（用户名, 客户端地址）统计，某个地址猜错密码只会锁定它自己，
+    其它地址仍可以登录同一个用户，避免任何人都能把admin一直锁住；
+    另外每个地址单独有一个较宽的上限，限制同一地址尝试大量用户名
+    """
+
+    def __init__(self, max_attempts: int = 5, max_ip_attempts: int = 20, window: float = 1800):
+        """
+        初始化登录锁定策略
+
+        Args:
+            max_attempts: 同一地址对同一用户窗口内允许的失败次数
+            max_ip_attempts: 同一地址窗口内允许的失败次数（不区分用户）
+            window: 统计窗口和锁定时长（秒）
+        """
+        self.user_limiter = LoginRateLimiter(max_attempts, window)
+        self.ip_limiter = LoginRateLimiter(max_ip_attempts, window)
+
+    @staticmethod
+    def _user_key(username: str, client_ip: Optional[str]) -> str:
+        return f"user:{username}@{client_ip or 'unknown'}"
+
+    @staticmethod
+    def _ip_key(client_ip: Optional[str]) -> Optional[str]:
+        return f"ip:{client_ip}" if client_ip else None
+
+    def check(self, username: str, client_ip: Optional[str] = None):
+        """
+        检查是否允许登录
+
+        Raises:
+            LoginRateLimited: 该地址对该用户或该地址本身处于锁定状态
+        """
+        self.user_limiter.check(self._user_key(username, client_ip))
+        self.ip_limiter.check(self._ip_key(client_ip))
+
+    def record_failure(self, username: str, client_ip: Optional[str] = None):
+        """记录一次失败的登录"""
+        self.user_limiter.record_failure(self._user_key(username, client_ip))
+        self.ip_limiter.record_failure(self._ip_key(client_ip))
+
+    def reset(self, username: str, client_ip: Optional[str] = None):
+        """登录成功后清除该地址对该用户的失败记录，地址的总失败次数保留到窗口结束"""
+        self.user_limiter.reset(self._user_key(username, client_ip))
+
+
+class TokenCache:
+    """已验证令牌的短期进程内缓存"""
+
+    def __init__(self, ttl: float = 30, max_size: int = 1024):
+        """
+        初始化令牌缓存
+
+        Args:
+            ttl: 缓存时间（秒），为0时禁用缓存
+            max_size: 最多缓存的令牌数
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """获取缓存的用户信息，过期或不存在时返回None"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        deadline, user = entry
+        if deadline <= time.monotonic():
+            del self._entries[token]
+            return None
+        return user
+
+    def put(self, token: str, user: Dict[str, Any], expires_in: Optional[float] = None):
+        """
+        缓存用户信息
+
+        Args:
+            token: 访问令牌
+            user: 用户信息
+            expires_in: 令牌剩余有效期（秒），缓存时间不会超过它
+        """
+        if self.ttl <= 0:
+            return
+        ttl = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if ttl <= 0:
+            return
+        self._entries[token] = (time.monotonic() + ttl, user)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        """移除单个令牌"""
+        self._entries.pop(token, None)
+
+    def invalidate_user(self, username: str):
+        """移除某个用户的所有令牌"""
+        for token in [t for t, (_, user) in self._entries.items() if user.get('username') == username]:
+            del self._entries[token]
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
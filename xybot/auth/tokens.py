@@ -0,0 +1,238 @@
+"""
+令牌存储模块
+每个令牌单独存为一个带TTL的键，并按用户维护令牌集合，
+撤销、删除用户和验证的开销只与该用户的令牌数量有关
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 把令牌加入用户令牌集合，集合的有效期不短于其中最晚过期的令牌，在Redis中原子执行
+_ADD_MEMBER_SCRIPT = """
+redis.call('SADD', KEYS[1], ARGV[1])
+local ttl = redis.call('TTL', KEYS[1])
+if ttl < tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+def _decode(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class TokenStore:
+    """基于Redis的令牌存储"""
+
+    # 旧版本的令牌哈希表，查询时按需迁移，压缩任务会迁移剩下的令牌并删除它
+    LEGACY_KEY_TOKENS = "xybot:web:tokens"
+
+    def __init__(self, redis_client, prefix: str = "xybot:web"):
+        """
+        初始化令牌存储
+
+        Args:
+            redis_client: Redis客户端实例
+            prefix: 键前缀
+        """
+        self.redis = redis_client
+        self.prefix = prefix
+        self._compaction_task: Optional[asyncio.Task] = None
+        self._add_member = redis_client.register_script(_ADD_MEMBER_SCRIPT)
+        # 旧版哈希表是否可能还有令牌，确认已删除后查询未命中时不再访问它
+        self._legacy_pending = True
+
+    def token_key(self, token: str) -> str:
+        return f"{self.prefix}:token:{token}"
+
+    def user_key(self, username: str) -> str:
+        return f"{self.prefix}:user_tokens:{username}"
+
+    async def issue(self, username: str, ttl_seconds: int, extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        签发令牌
+
+        Args:
+            username: 用户名
+            ttl_seconds: 有效期（秒）
+            extra: 额外保存在令牌中的信息
+
+        Returns:
+            访问令牌
+        """
+        token = secrets.token_hex(32)
+        now = datetime.now()
+        token_info = {
+            'username': username,
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(seconds=ttl_seconds)).isoformat()
+        }
+        if extra:
+            token_info.update(extra)
+
+        await self._store(token, token_info, ttl_seconds)
+        return token
+
+    async def _store(self, token: str, token_info: Dict[str, Any], ttl_seconds: int):
+        # 令牌和TTL在同一条命令中写入，不会留下没有TTL的令牌
+        await self.redis.set(self.token_key(token), json.dumps(token_info), ex=ttl_seconds)
+        await self._add_member(keys=[self.user_key(token_info['username'])], args=[token, ttl_seconds])
+
+    @staticmethod
+    def _legacy_remaining(token_info: Dict[str, Any]) -> int:
+        """旧版令牌剩余的有效秒数"""
+        try:
+            return int((datetime.fromisoformat(token_info['expires_at']) - datetime.now()).total_seconds())
+        except (ValueError, KeyError, TypeError):
+            return 0
+
+    async def _delete_legacy(self, token: str):
+        await self.redis.hdel(self.LEGACY_KEY_TOKENS, token)
+        await self.redis.delete(f"{self.LEGACY_KEY_TOKENS}:expiry:{token}", f"{self.LEGACY_KEY_TOKENS}:{token}")
+
+    async def _migrate_legacy(self, token: str) -> Optional[Dict[str, Any]]:
+        """在旧版哈希表中查找令牌，找到且未过期时迁移到新结构"""
+        token_info_json = await self.redis.hget(self.LEGACY_KEY_TOKENS, token)
+        if not token_info_json:
+            if not await self.redis.exists(self.LEGACY_KEY_TOKENS):
+                self._legacy_pending = False
+            return None
+        try:
+            token_info = json.loads(token_info_json)
+        except json.JSONDecodeError:
+            token_info = {}
+        remaining = self._legacy_remaining(token_info)
+        if remaining >= 1 and 'username' in token_info:
+            await self._store(token, token_info, remaining)
+        else:
+            token_info = None
+        await self._delete_legacy(token)
+        return token_info
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        获取令牌信息
+
+        Returns:
+            令牌信息，不存在或已过期时返回None
+        """
+        if not token:
+            return None
+        token_info_json = await self.redis.get(self.token_key(token))
+        if not token_info_json:
+            # 升级后第一次压缩完成前，旧版哈希表中的令牌仍然有效
+            if self._legacy_pending:
+                return await self._migrate_legacy(token)
+            return None
+        try:
+            return json.loads(token_info_json)
+        except json.JSONDecodeError:
+            return None
+
+    async def revoke(self, token: str) -> bool:
+        """
+        撤销令牌
+
+        Returns:
+            令牌是否存在
+        """
+        token_info = await self.get(token)
+        deleted = await self.redis.delete(self.token_key(token))
+        if token_info:
+            await self.redis.srem(self.user_key(token_info['username']), token)
+        return bool(deleted)
+
+    async def revoke_user(self, username: str) -> List[str]:
+        """
+        撤销用户的所有令牌
+
+        Returns:
+            被撤销的令牌列表
+        """
+        user_key = self.user_key(username)
+        tokens = [_decode(t) for t in await self.redis.smembers(user_key)]
+        if tokens:
+            await self.redis.delete(*[self.token_key(t) for t in tokens])
+        await self.redis.delete(user_key)
+        return tokens
+
+    async def compact(self, usernames) -> Dict[str, int]:
+        """
+        压缩令牌存储：迁移旧版哈希表中未过期的令牌并删除旧数据，
+        清理用户令牌集合中已过期的成员
+
+        Args:
+            usernames: 需要检查的用户名列表
+
+        Returns:
+            统计信息
+        """
+        stats = {'migrated': 0, 'expired': 0, 'pruned': 0}
+
+        if await self.redis.exists(self.LEGACY_KEY_TOKENS):
+            legacy_tokens = await self.redis.hgetall(self.LEGACY_KEY_TOKENS)
+            for token, token_info_json in legacy_tokens.items():
+                token = _decode(token)
+                try:
+                    token_info = json.loads(token_info_json)
+                except json.JSONDecodeError:
+                    token_info = {}
+                remaining = self._legacy_remaining(token_info)
+                if remaining >= 1 and 'username' in token_info:
+                    await self._store(token, token_info, remaining)
+                    stats['migrated'] += 1
+                else:
+                    stats['expired'] += 1
+                await self._delete_legacy(token)
+            await self.redis.delete(self.LEGACY_KEY_TOKENS)
+        self._legacy_pending = False
+
+        for username in usernames:
+            username = _decode(username)
+            user_key = self.user_key(username)
+            for token in await self.redis.smembers(user_key):
+                token = _decode(token)
+                if not await self.redis.exists(self.token_key(token)):
+                    await self.redis.srem(user_key, token)
+                    stats['pruned'] += 1
+
+        return stats
+
+    def start_compaction(self, get_usernames, interval_seconds: float = 3600):
+        """
+        启动后台压缩任务
+
+        Args:
+            get_usernames: 返回用户名列表的异步函数
+            interval_seconds: 压缩间隔（秒）
+        """
+        if self._compaction_task is not None and not self._compaction_task.done():
+            return
+
+        async def run():
+            while True:
+                try:
+                    stats = await self.compact(await get_usernames())
+                    if any(stats.values()):
+                        logger.info(f"令牌存储压缩完成: {stats}")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"令牌存储压缩出错: {str(e)}")
+                await asyncio.sleep(interval_seconds)
+
+        self._compaction_task = asyncio.create_task(run())
+
+    async def stop_compaction(self):
+        """停止后台压缩任务"""
+        task, self._compaction_task = self._compaction_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
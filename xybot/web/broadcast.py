@@ -0,0 +1,427 @@
+"""
+WebSocket广播模块
+每个通道只运行一个采样任务，数据序列化一次后分发给所有订阅者
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import psutil
+from aiohttp import WSCloseCode
+
+logger = logging.getLogger(__name__)
+
+# 慢客户端的缓冲区溢出策略
+DROP_OLDEST = 'drop_oldest'      # 丢弃最旧的帧，保证客户端拿到最新数据
+DROP_NEWEST = 'drop_newest'      # 丢弃新产生的帧
+DISCONNECT = 'disconnect'        # 断开跟不上的客户端
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+Producer = Callable[[], Awaitable[Any]]
+ProducerFactory = Callable[[], Producer]
+
+
+# CPU占用率的基准超过这个秒数（通道曾经没有订阅者而停止采样）时不再使用，重新短暂测量
+CPU_BASELINE_MAX_AGE = 60.0
+# 没有可用的基准时测量CPU占用率的时长（秒）
+CPU_PROBE_WINDOW = 0.1
+
+
+def _cpu_busy_total(times) -> Tuple[float, float]:
+    """CPU的忙碌时间和总时间，与psutil.cpu_percent的计算方式一致（guest已计入user/nice）"""
+    total = sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+    busy = total - times.idle - getattr(times, 'iowait', 0)
+    return busy, total
+
+
+def collect_system_stats(cpu_percent: float) -> Dict[str, Any]:
+    """
+    采集系统统计信息（同步调用，需在线程中执行）
+
+    Args:
+        cpu_percent: CPU占用率，由调用方按自己的采样间隔计算
+    """
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage('/')
+    network = psutil.net_io_counters()
+
+    return {
+        'cpu': {
+            'percent': cpu_percent
+        },
+        'memory': {
+            'total': memory.total,
+            'available': memory.available,
+            'percent': memory.percent
+        },
+        'disk': {
+            'total': disk.total,
+            'used': disk.used,
+            'free': disk.free,
+            'percent': disk.percent
+        },
+        'network': {
+            'bytes_sent': network.bytes_sent,
+            'bytes_recv': network.bytes_recv
+        },
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+class SystemStatsSampler:
+    """
+    系统统计的采样函数，每个采样任务（每个推送间隔）各用一个
+
+    CPU占用率由本采样函数上一次读取的psutil.cpu_times()算出，即该通道两次采样之间的平均值，
+    不受其它通道或psutil.cpu_percent()调用的影响。第一次采样或基准过旧时短暂测量CPU_PROBE_WINDOW秒
+    """
+
+    def __init__(self):
+        self._last_times = None
+        self._last_at = 0.0
+
+    def _cpu_percent(self) -> float:
+        if self._last_times is None or time.monotonic() - self._last_at > CPU_BASELINE_MAX_AGE:
+            self._last_times = psutil.cpu_times()
+            time.sleep(CPU_PROBE_WINDOW)
+        times = psutil.cpu_times()
+        busy, total = _cpu_busy_total(times)
+        last_busy, last_total = _cpu_busy_total(self._last_times)
+        self._last_times = times
+        self._last_at = time.monotonic()
+        if total <= last_total:
+            return 0.0
+        return round(min(max((busy - last_busy) / (total - last_total) * 100, 0.0), 100.0), 1)
+
+    def collect(self) -> Dict[str, Any]:
+        return collect_system_stats(self._cpu_percent())
+
+    async def __call__(self) -> Dict[str, Any]:
+        """在线程中采集系统统计信息，不阻塞事件循环"""
+        return await asyncio.to_thread(self.collect)
+
+
+def serialize_frame(channel: str, payload: Any) -> str:
+    """将通道数据序列化为WebSocket帧"""
+    return json.dumps({'type': channel, 'payload': payload}, ensure_ascii=False, default=str)
+
+
+def serialize_error(channel: str, error: Exception) -> str:
+    """采样出错时的错误帧，与原来每个客户端单独采样时的格式一致"""
+    return json.dumps({'type': 'error', 'payload': {'message': f'{channel} error: {str(error)}'}},
+                      ensure_ascii=False)
+
+
+class ClientSender:
+    """单个WebSocket客户端的有界发送缓冲"""
+
+    def __init__(self, ws, buffer_size: int = 16, drop_policy: str = DROP_OLDEST):
+        """
+        初始化发送缓冲
+
+        Args:
+            ws: WebSocket连接
+            buffer_size: 缓冲区最多保留的帧数
+            drop_policy: 缓冲区满时的处理策略
+        """
+        self.ws = ws
+        self.buffer = deque()
+        self.buffer_size = max(1, buffer_size)
+        self.drop_policy = drop_policy if drop_policy in DROP_POLICIES else DROP_OLDEST
+        self.dropped = 0
+        self.closed = False
+        self._close_task: Optional[asyncio.Task] = None
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def offer(self, frame: str) -> bool:
+        """
+        放入一帧数据
+
+        Args:
+            frame: 已序列化的帧
+
+        Returns:
+            客户端是否仍然可用
+        """
+        if self.closed or self.ws.closed:
+            return False
+
+        if len(self.buffer) >= self.buffer_size:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return True
+            if self.drop_policy == DISCONNECT:
+                logger.warning(f"WebSocket客户端处理过慢，已断开连接（丢弃 {self.dropped} 帧）")
+                self.closed = True
+                self._close_task = asyncio.create_task(
+                    self.ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b'Slow consumer'))
+                return False
+            self.buffer.popleft()
+
+        self.buffer.append(frame)
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        """按顺序将缓冲区中的帧写入连接"""
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self.buffer and not self.ws.closed:
+                    await self.ws.send_str(self.buffer.popleft())
+        except asyncio.CancelledError:
+            pass
+        except (ConnectionResetError, RuntimeError) as e:
+            logger.debug(f"WebSocket发送失败，停止推送: {str(e)}")
+            self.closed = True
+
+    async def close(self):
+        """停止发送任务"""
+        self.closed = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if self._close_task is not None:
+            await asyncio.gather(self._close_task, return_exceptions=True)
+
+
+class BroadcastChannel:
+    """广播通道，可由采样任务定时产生数据，也可由外部主动推送"""
+
+    def __init__(self, name: str, producer: Optional[Producer] = None, interval: float = 5.0):
+        """
+        初始化广播通道
+
+        Args:
+            name: 通道名称，同时作为帧的type字段
+            producer: 异步采样函数，返回None时本轮不推送
+            interval: 采样间隔（秒）
+        """
+        self.name = name
+        self.producer = producer
+        self.interval = interval
+        self.subscribers: Set[ClientSender] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, sender: ClientSender):
+        """添加订阅者，第一个订阅者到来时启动采样任务"""
+        self.subscribers.add(sender)
+        if self.producer and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, sender: ClientSender):
+        """移除订阅者，没有订阅者时停止采样任务"""
+        self.subscribers.discard(sender)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, payload: Any) -> int:
+        """
+        向所有订阅者推送同一帧数据
+
+        Returns:
+            成功放入缓冲的订阅者数量
+        """
+        if not self.subscribers:
+            return 0
+        return self._broadcast(serialize_frame(self.name, payload))
+
+    def _broadcast(self, frame: str) -> int:
+        delivered = 0
+        for sender in list(self.subscribers):
+            if sender.offer(frame):
+                delivered += 1
+            else:
+                self.remove(sender)
+        return delivered
+
+    async def _run(self):
+        """采样循环，按固定节拍运行，采样耗时不会累积到间隔中"""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        try:
+            while self.subscribers:
+                try:
+                    payload = await self.producer()
+                    if payload is not None:
+                        self.publish(payload)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.exception(f"通道 {self.name} 采样出错: {str(e)}")
+                    if self.subscribers:
+                        self._broadcast(serialize_error(self.name, e))
+
+                next_tick += self.interval
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self):
+        """停止采样任务"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.subscribers.clear()
+
+
+class BroadcastHub:
+    """
+    管理所有广播通道及客户端的发送缓冲
+
+    客户端订阅时可以指定推送间隔，相同通道、相同间隔的订阅者共享一个采样任务，
+    不同的间隔各自运行一个采样任务
+    """
+
+    def __init__(self, buffer_size: int = 16, drop_policy: str = DROP_OLDEST, min_interval: float = 0.0):
+        """
+        初始化广播中心
+
+        Args:
+            buffer_size: 每个客户端的缓冲帧数
+            drop_policy: 缓冲区满时的处理策略
+            min_interval: 客户端可以指定的最小推送间隔（秒）
+        """
+        self.buffer_size = buffer_size
+        self.drop_policy = drop_policy
+        self.min_interval = min_interval
+        self.channels: Dict[str, BroadcastChannel] = {}
+        self._factories: Dict[str, Optional[ProducerFactory]] = {}
+        self._variants: Dict[Tuple[str, float], BroadcastChannel] = {}
+        self._senders: Dict[Any, ClientSender] = {}
+
+    def register(self, name: str, producer: Optional[Producer] = None, interval: float = 5.0,
+                 make_producer: Optional[ProducerFactory] = None) -> BroadcastChannel:
+        """
+        注册通道
+
+        Args:
+            name: 通道名称
+            producer: 异步采样函数，为None时只能通过publish推送
+            interval: 默认采样间隔（秒）
+            make_producer: 生成采样函数的工厂，采样函数带有状态（例如上次推送的位置）时使用，
+                           每个推送间隔各自生成一个采样函数
+        """
+        if make_producer is not None:
+            producer = make_producer()
+        channel = BroadcastChannel(name, producer, interval)
+        self.channels[name] = channel
+        self._factories[name] = make_producer
+        return channel
+
+    def resolve_interval(self, name: str, interval: Optional[float] = None) -> Optional[float]:
+        """
+        客户端请求的推送间隔实际使用的值
+
+        Returns:
+            通道不存在时返回None；未指定间隔或通道不采样时使用默认间隔，小于最小间隔时使用最小间隔
+        """
+        channel = self.channels.get(name)
+        if channel is None:
+            return None
+        if interval is None or channel.producer is None:
+            return channel.interval
+        return round(max(float(interval), self.min_interval), 3)
+
+    def _channel_for(self, name: str, interval: float) -> BroadcastChannel:
+        channel = self.channels[name]
+        if interval == channel.interval or channel.producer is None:
+            return channel
+        variant = self._variants.get((name, interval))
+        if variant is None:
+            factory = self._factories.get(name)
+            producer = factory() if factory is not None else channel.producer
+            variant = BroadcastChannel(name, producer, interval)
+            self._variants[(name, interval)] = variant
+        return variant
+
+    def _channels_of(self, name: str):
+        channel = self.channels.get(name)
+        if channel is not None:
+            yield channel
+        for (variant_name, _), variant in list(self._variants.items()):
+            if variant_name == name:
+                yield variant
+
+    def _prune(self):
+        """丢弃没有订阅者的非默认间隔通道"""
+        for key, variant in list(self._variants.items()):
+            if not variant.subscribers:
+                del self._variants[key]
+
+    def subscribe(self, ws, name: str, interval: Optional[float] = None) -> Optional[float]:
+        """
+        订阅通道，已订阅同一通道的其它间隔时改为新的间隔
+
+        Args:
+            ws: WebSocket连接
+            name: 通道名称
+            interval: 客户端请求的推送间隔（秒），为None时使用默认间隔
+
+        Returns:
+            实际使用的推送间隔（秒），通道不存在时返回None
+        """
+        interval = self.resolve_interval(name, interval)
+        if interval is None:
+            return None
+
+        sender = self._senders.get(ws)
+        if sender is None:
+            sender = ClientSender(ws, self.buffer_size, self.drop_policy)
+            self._senders[ws] = sender
+        target = self._channel_for(name, interval)
+        for channel in self._channels_of(name):
+            if channel is not target:
+                channel.remove(sender)
+        target.add(sender)
+        self._prune()
+        return interval
+
+    def unsubscribe(self, ws, name: str):
+        """取消订阅通道"""
+        sender = self._senders.get(ws)
+        if sender is None:
+            return
+        for channel in self._channels_of(name):
+            channel.remove(sender)
+        self._prune()
+
+    def publish(self, name: str, payload: Any) -> int:
+        """向通道推送数据"""
+        return sum(channel.publish(payload) for channel in self._channels_of(name))
+
+    def subscriber_count(self, name: str) -> int:
+        """获取通道的订阅者数量"""
+        return sum(len(channel.subscribers) for channel in self._channels_of(name))
+
+    async def remove_client(self, ws):
+        """移除客户端的所有订阅并停止其发送任务"""
+        sender = self._senders.pop(ws, None)
+        if sender is None:
+            return
+        for channel in list(self.channels.values()) + list(self._variants.values()):
+            channel.remove(sender)
+        self._prune()
+        await sender.close()
+
+    async def close(self):
+        """停止所有通道和发送任务"""
+        for channel in list(self.channels.values()) + list(self._variants.values()):
+            await channel.close()
+        self._variants.clear()
+        senders = list(self._senders.values())
+        self._senders.clear()
+        for sender in senders:
+            await sender.close()
@@ -0,0 +1,321 @@
+"""
+日志服务模块
+从文件末尾反向读取日志，按时间和级别维护稀疏偏移索引，支持过滤和分页，
+并通过loguru sink实时推送新日志
+"""
+
+import asyncio
+import bisect
+import json
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 日志行格式: "YYYY-MM-DD HH:mm:ss | LEVEL | message"，不以时间戳开头的行属于上一条日志
+ENTRY_START = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| ([A-Z]+) \| ')
+TIMESTAMP_LENGTH = 19
+
+LEVELS = ('TRACE', 'DEBUG', 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'CRITICAL')
+LEVEL_BITS = {level: 1 << i for i, level in enumerate(LEVELS)}
+UNKNOWN_LEVEL_BIT = 1 << len(LEVELS)
+
+READ_BLOCK_SIZE = 64 * 1024          # 反向读取的块大小
+INDEX_BLOCK_SIZE = 256 * 1024        # 索引的块粒度
+
+
+def parse_entry(text: str) -> Optional[Dict[str, Any]]:
+    """
+    解析一条日志（可能包含多行）
+
+    Args:
+        text: 日志文本
+
+    Returns:
+        日志字典，格式不正确时返回None
+    """
+    parts = text.rstrip('\n').split(" | ", 2)
+    if len(parts) < 3:
+        return None
+
+    timestamp, log_level, message = parts
+
+    # 解析元数据（如果存在）
+    metadata = None
+    traceback = None
+    if "[METADATA]" in message:
+        message_parts = message.split("[METADATA]", 1)
+        message = message_parts[0].strip()
+        try:
+            metadata = json.loads(message_parts[1].strip())
+        except ValueError:
+            metadata = {"raw": message_parts[1].strip()}
+
+    # 解析traceback（如果存在）
+    if "[TRACEBACK]" in message:
+        message_parts = message.split("[TRACEBACK]", 1)
+        message = message_parts[0].strip()
+        traceback = message_parts[1].strip()
+
+    return {
+        "timestamp": timestamp,
+        "level": log_level,
+        "message": message,
+        "metadata": metadata,
+        "traceback": traceback
+    }
+
+
+def _iter_entries_reverse(f, start: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    """
+    在[start, end)范围内从后向前逐条读取日志
+
+    Yields:
+        (日志起始偏移, 日志原始字节)
+    """
+    position = end
+    tail = b''            # 当前块之后尚未成行的字节
+    pending: List[bytes] = []  # 已读到但还没遇到起始行的续行（倒序）
+
+    while position > start:
+        read_size = min(READ_BLOCK_SIZE, position - start)
+        position -= read_size
+        f.seek(position)
+        data = f.read(read_size) + tail
+
+        lines = data.split(b'\n')
+        # 第一段可能是不完整的行，留到下一个块拼接
+        tail = lines[0] if position > start else b''
+        first = 1 if position > start else 0
+
+        offset = position + len(data)
+        for i in range(len(lines) - 1, first - 1, -1):
+            line = lines[i]
+            offset -= len(line) + (1 if i < len(lines) - 1 else 0)
+            if not line:
+                continue
+            if ENTRY_START.match(line):
+                pending.append(line)
+                pending.reverse()
+                yield offset, b'\n'.join(pending)
+                pending = []
+            else:
+                pending.append(line)
+
+
+class _FileIndex:
+    """单个日志文件的稀疏索引，每个块记录起始偏移、时间范围和出现过的级别"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.indexed_size = 0
+        self.offsets: List[int] = []
+        self.first_ts: List[str] = []
+        self.last_ts: List[str] = []
+        self.masks: List[int] = []
+
+    def update(self) -> int:
+        """
+        增量扫描新写入的内容
+
+        Returns:
+            当前已索引的文件大小（只包含完整的行）
+        """
+        size = self.path.stat().st_size
+        if size < self.indexed_size:
+            # 文件被截断或替换，重建索引
+            self.__init__(self.path)
+        if size == self.indexed_size:
+            return self.indexed_size
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.indexed_size)
+            offset = self.indexed_size
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                match = ENTRY_START.match(line)
+                if match:
+                    timestamp = match.group(1).decode()
+                    bit = LEVEL_BITS.get(match.group(2).decode(), UNKNOWN_LEVEL_BIT)
+                    if not self.offsets or offset - self.offsets[-1] >= INDEX_BLOCK_SIZE:
+                        self.offsets.append(offset)
+                        self.first_ts.append(timestamp)
+                        self.last_ts.append(timestamp)
+                        self.masks.append(bit)
+                    else:
+                        self.last_ts[-1] = timestamp
+                        self.masks[-1] |= bit
+                offset += len(line)
+            self.indexed_size = offset
+
+        return self.indexed_size
+
+    def block_end(self, i: int) -> int:
+        return self.offsets[i + 1] if i + 1 < len(self.offsets) else self.indexed_size
+
+
+class LogService:
+    """日志查询服务"""
+
+    def __init__(self, log_dir: str = "logs", pattern: str = "XYBot_*.log"):
+        """
+        初始化日志服务
+
+        Args:
+            log_dir: 日志目录
+            pattern: 日志文件匹配模式
+        """
+        self.log_dir = Path(log_dir)
+        self.pattern = pattern
+        self._indexes: Dict[Path, _FileIndex] = {}
+        self._sink_id = None
+
+    def list_files(self) -> List[Path]:
+        """获取所有日志文件，最新的在前"""
+        files = list(self.log_dir.glob(self.pattern))
+        files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+        return files
+
+    async def query(self, limit: int = 200, level: Optional[str] = None, since: Optional[str] = None,
+                    until: Optional[str] = None, text: Optional[str] = None, cursor: Optional[int] = None,
+                    file: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        查询日志，在线程中执行，不阻塞事件循环
+
+        Args:
+            limit: 最多返回的条数
+            level: 日志级别
+            since: 起始时间（YYYY-MM-DD HH:MM:SS，可只写前缀）
+            until: 截止时间（YYYY-MM-DD HH:MM:SS，可只写前缀）
+            text: 消息中需包含的文本
+            cursor: 分页游标，上一页返回的next_cursor
+            file: 日志文件名，默认最新的文件
+
+        Returns:
+            (日志列表（最新的在前）, 下一页游标，没有更多时为None)
+        """
+        return await asyncio.to_thread(self._query, limit, level, since, until, text, cursor, file)
+
+    def _query(self, limit, level, since, until, text, cursor, file):
+        files = self.list_files()
+        if file:
+            files = [f for f in files if f.name == Path(file).name]
+        if not files or limit <= 0:
+            return [], None
+
+        path = files[0]
+        level = level.upper() if level else None
+        if until and len(until) < TIMESTAMP_LENGTH:
+            until = until + "\uffff"  # 前缀匹配，包含该时间段内的所有日志
+
+        if level or since or until:
+            ranges = self._indexed_ranges(path, level, since, until, cursor)
+        else:
+            end = path.stat().st_size if cursor is None else cursor
+            ranges = [(0, end)]
+
+        logs = []
+        next_cursor = None
+        with open(path, 'rb') as f:
+            for start, end in ranges:
+                for offset, raw in _iter_entries_reverse(f, start, end):
+                    entry = parse_entry(raw.decode('utf-8', errors='replace'))
+                    if entry is None:
+                        continue
+                    timestamp = entry["timestamp"]
+                    if until and timestamp > until:
+                        continue
+                    if since and timestamp < since:
+                        return logs, None
+                    if level and entry["level"] != level:
+                        continue
+                    if text and text not in entry["message"]:
+                        continue
+
+                    logs.append(entry)
+                    if len(logs) >= limit:
+                        next_cursor = offset if offset > 0 else None
+                        return logs, next_cursor
+
+        return logs, next_cursor
+
+    def _indexed_ranges(self, path: Path, level: Optional[str], since: Optional[str], until: Optional[str],
+                        cursor: Optional[int]) -> List[Tuple[int, int]]:
+        """利用索引计算需要扫描的字节范围（从新到旧）"""
+        index = self._indexes.get(path)
+        if index is None:
+            index = self._indexes[path] = _FileIndex(path)
+        end = index.update()
+        if cursor is not None:
+            end = min(end, cursor)
+
+        # 跳过until之后的块
+        last = len(index.offsets) - 1
+        if until:
+            last = min(last, bisect.bisect_right(index.first_ts, until) - 1)
+
+        bit = LEVEL_BITS.get(level, UNKNOWN_LEVEL_BIT) if level else 0
+        ranges = []
+        for i in range(last, -1, -1):
+            block_start = index.offsets[i]
+            if block_start >= end:
+                continue
+            if since and index.last_ts[i] < since:
+                break
+            if bit and not index.masks[i] & bit:
+                continue
+            block_end = min(index.block_end(i), end)
+            if ranges and ranges[-1][0] == block_end:
+                ranges[-1] = (block_start, ranges[-1][1])
+            else:
+                ranges.append((block_start, block_end))
+        return ranges
+
+    def prune(self):
+        """移除已被删除的日志文件的索引"""
+        for path in list(self._indexes):
+            if not path.exists():
+                del self._indexes[path]
+
+    def attach_live_tail(self, publish: Callable[[Dict[str, Any]], None], level: str = "DEBUG",
+                         loop: Optional[asyncio.AbstractEventLoop] = None,
+                         is_active: Optional[Callable[[], bool]] = None):
+        """
+        注册loguru sink，实时推送新写入的日志
+
+        Args:
+            publish: 在事件循环中调用的推送函数
+            level: 推送的最低日志级别
+            loop: 事件循环，默认当前运行的循环
+            is_active: 是否有订阅者，返回False时跳过推送
+        """
+        from loguru import logger as loguru_logger
+
+        if self._sink_id is not None:
+            return
+        loop = loop or asyncio.get_running_loop()
+
+        def sink(message):
+            if is_active is not None and not is_active():
+                return
+            record = message.record
+            entry = parse_entry(
+                f"{record['time']:%Y-%m-%d %H:%M:%S} | {record['level'].name} | {record['message']}"
+            )
+            if entry is None or loop.is_closed():
+                return
+            loop.call_soon_threadsafe(publish, entry)
+
+        self._sink_id = loguru_logger.add(sink, level=level, enqueue=False)
+
+    def detach_live_tail(self):
+        """移除实时推送的sink"""
+        if self._sink_id is None:
+            return
+        from loguru import logger as loguru_logger
+        try:
+            loguru_logger.remove(self._sink_id)
+        except ValueError:
+            pass
+        self._sink_id = None
+
@@ -8,6 +8,10 @@ import logging
 import json
 from datetime import datetime
 
+from utils.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.profiler import profiler
+from utils.loop_monitor import loop_monitor
+
 logger = logging.getLogger(__name__)
 
 def setup_routes(server):
@@ -40,10 +44,16 @@ def setup_routes(server):
                     status=400
                 )
             
-            success, result = await server.auth_manager.authenticate(username, password)
+            success, result = await server.auth_manager.authenticate(username, password, request.remote)
             
             if success:
                 return web.json_response(result)
+            elif 'retry_after' in result:
+                return web.json_response(
+                    result,
+                    status=429,
+                    headers={"Retry-After": str(result['retry_after'])}
+                )
             else:
                 return web.json_response(result, status=401)
         except Exception as e:
@@ -121,6 +131,11 @@ def setup_routes(server):
         
         return web.json_response(system_info)
     
+    @auth_routes.get('/api/system/loop')
+    async def loop_status(request):
+        """事件循环延迟分位数和最近的阻塞记录"""
+        return web.json_response(loop_monitor.snapshot())
+    
     @auth_routes.get('/api/bot/status')
     async def bot_status(request):
         """获取机器人状态"""
@@ -135,6 +150,13 @@ def setup_routes(server):
         
         return web.json_response(status)
     
+    @auth_routes.get('/api/plugins/profile')
+    async def plugin_profile(request):
+        """按开销排序的插件处理函数统计"""
+        by = request.query.get('by', 'wall')
+        group = request.query.get('group', 'plugin')
+        return web.json_response(profiler.ranking(by=by, group=group))
+    
     @auth_routes.post('/api/auth/change-password')
     async def change_password(request):
         """修改密码"""
@@ -169,6 +191,16 @@ def setup_routes(server):
             logger.exception("修改密码处理出错")
             return web.json_response({"error": str(e)}, status=500)
     
+    # 运行指标，供Prometheus抓取
+    if server.config_manager.get('web.metrics.enabled', True):
+        metrics_routes = auth_routes if server.config_manager.get('web.metrics.require_auth', False) else api_routes
+        
+        @metrics_routes.get('/metrics')
+        async def get_metrics(request):
+            """导出Prometheus格式的运行指标"""
+            return web.Response(body=metrics.render().encode('utf-8'),
+                                headers={'Content-Type': METRICS_CONTENT_TYPE})
+    
     # WebSocket路由
     @auth_routes.get('/api/ws')
     async def websocket_handler(request):
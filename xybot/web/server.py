@@ -44,6 +44,11 @@ class WebServer:
         
         # 获取认证相关配置
         token_expire_hours = self.config_manager.get('web.auth.token_expire_hours', 24)
+        max_login_attempts = self.config_manager.get('web.auth.max_login_attempts', 5)
+        max_ip_login_attempts = self.config_manager.get('web.auth.max_ip_login_attempts', 20)
+        login_timeout_minutes = self.config_manager.get('web.auth.login_timeout_minutes', 30)
+        token_cache_seconds = self.config_manager.get('web.auth.token_cache_seconds', 30)
+        token_compaction_minutes = self.config_manager.get('web.auth.token_compaction_minutes', 60)
         
         # 创建Web应用
         self.app = web.Application(middlewares=[
@@ -55,8 +60,15 @@ class WebServer:
             self.redis = bot_instance.api.redis_client
             self.auth_manager = AuthManager(
                 redis_client=self.redis,
-                token_expire_hours=token_expire_hours
+                token_expire_hours=token_expire_hours,
+                max_login_attempts=max_login_attempts,
+                max_ip_login_attempts=max_ip_login_attempts,
+                login_timeout_minutes=login_timeout_minutes,
+                token_cache_seconds=token_cache_seconds,
+                token_compaction_minutes=token_compaction_minutes
             )
+            self.app.on_startup.append(self._on_startup)
+            self.app.on_cleanup.append(self._on_cleanup)
         else:
             logger.error("Bot实例没有提供Redis客户端，认证功能将不可用")
             self.auth_manager = None
@@ -71,7 +83,9 @@ class WebServer:
             'enabled': self.config_manager.get('web.websocket.enabled', True),
             'ping_interval': self.config_manager.get('web.websocket.ping_interval', 30),
             'max_clients': self.config_manager.get('web.websocket.max_clients', 50),
-            'stats_update_interval': self.config_manager.get('web.websocket.stats_update_interval', 5000)
+            'stats_update_interval': self.config_manager.get('web.websocket.stats_update_interval', 5000),
+            'client_buffer_size': self.config_manager.get('web.websocket.client_buffer_size', 16),
+            'drop_policy': self.config_manager.get('web.websocket.drop_policy', 'drop_oldest')
         }
         self.ws_manager = WebSocketManager(self.bot, ws_config)
         
@@ -163,6 +177,14 @@ class WebServer:
         
         return middleware
     
+    async def _on_startup(self, app):
+        """启动后台任务"""
+        self.auth_manager.start_token_compaction()
+    
+    async def _on_cleanup(self, app):
+        """停止后台任务"""
+        await self.auth_manager.stop_token_compaction()
+    
     async def start(self):
         """启动Web服务器"""
         runner = web.AppRunner(self.app)
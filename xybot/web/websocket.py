@@ -3,13 +3,13 @@ WebSocket管理模块
 处理实时数据传输和连接管理
 """
 
-import asyncio
 import json
 import logging
-import psutil
 from datetime import datetime
 from aiohttp import web, WSCloseCode
 
+from .broadcast import BroadcastHub, SystemStatsSampler
+
 logger = logging.getLogger(__name__)
 
 class WebSocketManager:
@@ -31,7 +31,14 @@ class WebSocketManager:
         
         # 连接管理
         self.clients = set()
-        self.tasks = {}
+        
+        # 系统统计由一个共享采样任务产生，广播给所有连接
+        self.hub = BroadcastHub(
+            buffer_size=config.get('client_buffer_size', 16),
+            drop_policy=config.get('drop_policy', 'drop_oldest')
+        )
+        self.hub.register('system_stats', interval=self.stats_update_interval / 1000,
+                          make_producer=SystemStatsSampler)
     
     async def handle_connection(self, request):
         """
@@ -62,7 +69,6 @@ class WebSocketManager:
         
         # 保存连接
         self.clients.add(ws)
-        client_id = id(ws)
         
         try:
             # 发送欢迎消息
@@ -75,11 +81,8 @@ class WebSocketManager:
                 }
             })
             
-            # 启动系统统计信息发送任务
-            stats_task = asyncio.create_task(
-                self._send_system_stats(ws, self.stats_update_interval)
-            )
-            self.tasks[client_id] = stats_task
+            # 订阅系统统计信息
+            self.hub.subscribe(ws, 'system_stats')
             
             # 消息处理循环
             async for msg in ws:
@@ -99,9 +102,7 @@ class WebSocketManager:
         finally:
             # 清理连接
             self.clients.discard(ws)
-            if client_id in self.tasks:
-                self.tasks[client_id].cancel()
-                del self.tasks[client_id]
+            await self.hub.remove_client(ws)
             
             if not ws.closed:
                 await ws.close()
@@ -137,58 +138,6 @@ class WebSocketManager:
                 'payload': {'message': f'未知的消息类型: {msg_type}'}
             })
     
-    async def _send_system_stats(self, ws, interval):
-        """
-        定时发送系统统计信息
-        
-        Args:
-            ws: WebSocket连接
-            interval: 更新间隔（毫秒）
-        """
-        try:
-            while True:
-                # 获取系统信息
-                cpu = psutil.cpu_percent(interval=0.5)
-                memory = psutil.virtual_memory()
-                disk = psutil.disk_usage('/')
-                
-                stats = {
-                    'cpu': {
-                        'percent': cpu
-                    },
-                    'memory': {
-                        'total': memory.total,
-                        'available': memory.available,
-                        'percent': memory.percent
-                    },
-                    'disk': {
-                        'total': disk.total,
-                        'free': disk.free,
-                        'percent': disk.percent
-                    },
-                    'timestamp': datetime.now().isoformat()
-                }
-                
-                # 发送统计信息
-                if not ws.closed:
-                    await ws.send_json({
-                        'type': 'system_stats',
-                        'payload': stats
-                    })
-                
-                # 等待下一次更新
-                await asyncio.sleep(interval / 1000)  # 转换为秒
-        except asyncio.CancelledError:
-            # 任务被取消时正常退出
-            pass
-        except Exception as e:
-            logger.exception(f"发送系统统计数据时出错: {str(e)}")
-            if not ws.closed:
-                await ws.send_json({
-                    'type': 'error',
-                    'payload': {'message': f'System stats error: {str(e)}'}
-                })
-    
     async def _send_bot_status(self, ws):
         """
         发送机器人状态信息
@@ -227,10 +176,5 @@ class WebSocketManager:
                                message=b'Server shutdown')
         self.clients.clear()
         
-        # 取消所有任务
-        for task in self.tasks.values():
-            task.cancel()
-        
-        if self.tasks:
-            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
-            self.tasks.clear() 
\ No newline at end of file
+        # 停止共享采样任务和所有发送任务
+        await self.hub.close()